@@ -0,0 +1,318 @@
+"""
+Motor de almacenamiento opcional en SQLite.
+
+Guarda las mismas colecciones que los archivos de data/*.json, una tabla por
+colección. Cada registro se guarda completo como JSON en la columna 'datos'
+(así no se pierde ningún campo) y además se extraen las columnas que
+necesitamos indexar: la clave (id del problema o nombre del tema, concurso,
+categoría o curso), los temas de cada problema y los usos de cada curso.
+
+guardar() recibe la colección completa, igual que los guardar_* de JSON,
+pero solo ejecuta INSERT/UPDATE/DELETE para los registros que cambiaron:
+igual que diario.py, compara contra lo último que este proceso leyó o
+escribió, sin volver a leer la tabla (salvo si otro proceso la cambió).
+
+Cada hilo tiene su propia conexión por base, abierta una sola vez.
+
+Para pasar los datos actuales a SQLite:
+
+    python almacen_sqlite.py [--data data/] [--db data/icpc.sqlite3]
+"""
+import json
+import sqlite3
+import threading
+
+from metricas import contar
+
+# coleccion -> campo que identifica a cada registro
+CLAVES = {
+    "temas": "nombre",
+    "problemas": "id",
+    "concursos": "nombre",
+    "concursos_categorias": "nombre",
+    "cursos": "nombre",
+}
+
+USOS_CURSO = ("usados_problemas", "usados_temas", "usados_concursos")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS versiones (
+    coleccion TEXT PRIMARY KEY,
+    version   INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS temas (
+    clave TEXT PRIMARY KEY,
+    pos   INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS problemas (
+    clave    TEXT PRIMARY KEY,
+    pos      INTEGER NOT NULL,
+    concurso TEXT,
+    datos    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_problemas_concurso ON problemas(concurso);
+
+CREATE TABLE IF NOT EXISTS problema_temas (
+    problema TEXT NOT NULL,
+    tema     TEXT NOT NULL,
+    PRIMARY KEY (problema, tema)
+);
+CREATE INDEX IF NOT EXISTS idx_problema_temas_tema ON problema_temas(tema);
+
+CREATE TABLE IF NOT EXISTS concursos (
+    clave TEXT PRIMARY KEY,
+    pos   INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS concursos_categorias (
+    clave TEXT PRIMARY KEY,
+    pos   INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cursos (
+    clave TEXT PRIMARY KEY,
+    pos   INTEGER NOT NULL,
+    datos TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS curso_usos (
+    curso TEXT NOT NULL,
+    tipo  TEXT NOT NULL,
+    valor TEXT NOT NULL,
+    PRIMARY KEY (curso, tipo, valor)
+);
+CREATE INDEX IF NOT EXISTS idx_curso_usos_valor ON curso_usos(tipo, valor);
+"""
+
+# Rutas a las que ya les creamos el esquema en este proceso
+_inicializadas = set()
+
+# Conexiones abiertas de cada hilo: ruta -> conexión (sqlite3 no deja usar
+# una conexión desde otro hilo)
+_hilo = threading.local()
+
+# Último estado conocido de cada colección, para calcular diferencias:
+#   (ruta, coleccion) -> {"version", "filas" (clave -> (pos, registro))}
+_estado = {}
+
+
+def olvidar(ruta_db):
+    """Suelta el estado guardado de las colecciones de esa base (al descargar un conjunto)."""
+    for llave in [llave for llave in _estado if llave[0] == ruta_db]:
+        _estado.pop(llave, None)
+
+
+def conectar(ruta_db):
+    """La conexión de este hilo a 'ruta_db'; la abre (y crea el esquema) la primera vez."""
+    conexiones = getattr(_hilo, "conexiones", None)
+    if conexiones is None:
+        conexiones = _hilo.conexiones = {}
+    conexion = conexiones.get(ruta_db)
+    if conexion is None:
+        conexion = sqlite3.connect(str(ruta_db), timeout=30)
+        if ruta_db not in _inicializadas:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.executescript(ESQUEMA)
+            _inicializadas.add(ruta_db)
+        conexiones[ruta_db] = conexion
+    return conexion
+
+
+def _serializar(registro):
+    return json.dumps(registro, ensure_ascii=False)
+
+
+def _version(conexion, coleccion):
+    fila = conexion.execute(
+        "SELECT version FROM versiones WHERE coleccion = ?", (coleccion,)
+    ).fetchone()
+    return fila[0] if fila else 0
+
+
+def version(ruta_db, coleccion):
+    """
+    Contador que aumenta en cada guardar() de la colección, también si lo
+    hace otro proceso. Es lo que usa datos.py para validar su caché.
+    """
+    return _version(conectar(ruta_db), coleccion)
+
+
+def _leer_filas(conexion, coleccion):
+    """clave -> (pos, registro), en orden, y los bytes leídos."""
+    filas = {}
+    leidos = 0
+    for clave, pos, datos in conexion.execute(
+        f"SELECT clave, pos, datos FROM {coleccion} ORDER BY pos"
+    ):
+        filas[clave] = (pos, json.loads(datos))
+        leidos += len(datos)
+    contar("icpc_bytes_leidos_total", leidos, archivo=coleccion)
+    return filas
+
+
+def cargar(ruta_db, coleccion):
+    conexion = conectar(ruta_db)
+    # la versión va antes que las filas: si otro proceso escribe en medio,
+    # queda vieja y el siguiente guardar() vuelve a leer la tabla
+    version_leida = _version(conexion, coleccion)
+    filas = _leer_filas(conexion, coleccion)
+    _estado[(ruta_db, coleccion)] = {"version": version_leida, "filas": filas}
+    return [registro for _, registro in filas.values()]
+
+
+def _posiciones(claves_nuevas, pos_anterior):
+    """
+    Asigna 'pos' a cada registro de la lista nueva cambiando lo menos
+    posible: los registros que ya existían se reparten sus posiciones
+    anteriores en el nuevo orden (un intercambio solo toca dos filas, un
+    borrado no toca ninguna) y los nuevos van al final.
+    """
+    existentes = [c for c in claves_nuevas if c in pos_anterior]
+    n_existentes = len(existentes)
+    nuevos_al_final = all(c in pos_anterior for c in claves_nuevas[:n_existentes])
+
+    if not nuevos_al_final:
+        # caso raro (insertar a media lista): numerar todo de nuevo
+        return {c: i for i, c in enumerate(claves_nuevas)}
+
+    valores = sorted(pos_anterior[c] for c in existentes)
+    posiciones = dict(zip(existentes, valores))
+    siguiente = max(pos_anterior.values(), default=-1) + 1
+    for c in claves_nuevas[n_existentes:]:
+        posiciones[c] = siguiente
+        siguiente += 1
+    return posiciones
+
+
+def _escribir_indices(conexion, coleccion, clave, registro):
+    if coleccion == "problemas":
+        conexion.execute("DELETE FROM problema_temas WHERE problema = ?", (clave,))
+        conexion.executemany(
+            "INSERT OR IGNORE INTO problema_temas (problema, tema) VALUES (?, ?)",
+            [(clave, tema) for tema in registro.get("temas") or []],
+        )
+    elif coleccion == "cursos":
+        conexion.execute("DELETE FROM curso_usos WHERE curso = ?", (clave,))
+        conexion.executemany(
+            "INSERT OR IGNORE INTO curso_usos (curso, tipo, valor) VALUES (?, ?, ?)",
+            [
+                (clave, tipo, valor)
+                for tipo in USOS_CURSO
+                for valor in registro.get(tipo) or []
+            ],
+        )
+
+
+def _borrar_indices(conexion, coleccion, clave):
+    if coleccion == "problemas":
+        conexion.execute("DELETE FROM problema_temas WHERE problema = ?", (clave,))
+    elif coleccion == "cursos":
+        conexion.execute("DELETE FROM curso_usos WHERE curso = ?", (clave,))
+
+
+def guardar(ruta_db, coleccion, registros):
+    """
+    Deja la colección igual a 'registros', escribiendo solo las filas que
+    cambiaron. Todo en una transacción.
+    """
+    campo = CLAVES[coleccion]
+    claves_nuevas = [r[campo] for r in registros]
+    if len(set(claves_nuevas)) != len(claves_nuevas):
+        raise ValueError(f"Hay claves repetidas en '{coleccion}'")
+
+    escritos = 0
+    conexion = conectar(ruta_db)
+    with conexion:
+        # IMMEDIATE: nadie más escribe entre revisar la versión y guardar
+        conexion.execute("BEGIN IMMEDIATE")
+        estado = _estado.get((ruta_db, coleccion))
+        if estado is None or estado["version"] != _version(conexion, coleccion):
+            anteriores = _leer_filas(conexion, coleccion)
+        else:
+            anteriores = estado["filas"]
+        posiciones = _posiciones(
+            claves_nuevas, {c: pos for c, (pos, _) in anteriores.items()}
+        )
+
+        for clave in anteriores.keys() - set(claves_nuevas):
+            conexion.execute(f"DELETE FROM {coleccion} WHERE clave = ?", (clave,))
+            _borrar_indices(conexion, coleccion, clave)
+
+        for registro, clave in zip(registros, claves_nuevas):
+            pos = posiciones[clave]
+            previo = anteriores.get(clave)
+            if previo is not None and previo[1] == registro:
+                if previo[0] != pos:
+                    # solo cambió de lugar
+                    conexion.execute(
+                        f"UPDATE {coleccion} SET pos = ? WHERE clave = ?", (pos, clave)
+                    )
+                continue
+
+            datos = _serializar(registro)
+            if coleccion == "problemas":
+                conexion.execute(
+                    "INSERT OR REPLACE INTO problemas (clave, pos, concurso, datos) "
+                    "VALUES (?, ?, ?, ?)",
+                    (clave, pos, registro.get("concurso") or None, datos),
+                )
+            else:
+                conexion.execute(
+                    f"INSERT OR REPLACE INTO {coleccion} (clave, pos, datos) "
+                    "VALUES (?, ?, ?)",
+                    (clave, pos, datos),
+                )
+            _escribir_indices(conexion, coleccion, clave, registro)
+            escritos += len(datos)
+
+        conexion.execute(
+            "INSERT INTO versiones (coleccion, version) VALUES (?, 1) "
+            "ON CONFLICT(coleccion) DO UPDATE SET version = version + 1",
+            (coleccion,),
+        )
+        version_nueva = _version(conexion, coleccion)
+    _estado[(ruta_db, coleccion)] = {
+        "version": version_nueva,
+        "filas": {c: (posiciones[c], r) for r, c in zip(registros, claves_nuevas)},
+    }
+    contar("icpc_bytes_escritos_total", escritos, archivo=coleccion)
+
+
+def migrar_desde_json(data_dir, ruta_db):
+    """
+    Copia data/*.json a la base SQLite (una sola vez; si se vuelve a
+    correr, deja la base igual a los JSON). Regresa cuántos registros
+    se migraron por colección.
+    """
+    resumen = {}
+    for coleccion in CLAVES:
+        archivo = data_dir / f"{coleccion}.json"
+        if archivo.exists():
+            with archivo.open("r", encoding="utf-8") as f:
+                registros = json.load(f)
+        else:
+            registros = []
+        guardar(ruta_db, coleccion, registros)
+        resumen[coleccion] = len(registros)
+    return resumen
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    from datos import DATA_DIR, SQLITE_FILE
+
+    parser = argparse.ArgumentParser(description="Migra data/*.json a SQLite.")
+    parser.add_argument("--data", type=Path, default=DATA_DIR)
+    parser.add_argument("--db", type=Path, default=SQLITE_FILE)
+    args = parser.parse_args()
+
+    for coleccion, n in migrar_desde_json(args.data, args.db).items():
+        print(f"{coleccion}: {n} registros")
+    print("Listo. Para usarla: ICPC_DB_ALMACEN=sqlite python app.py")
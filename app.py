@@ -1,198 +1,271 @@
-import json
-from pathlib import Path
-from flask import Flask, render_template, send_file, abort
+from flask import Flask, render_template, send_file, abort, make_response, jsonify, Response, g
+from flask import before_render_template, template_rendered
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from functools import wraps
+import cProfile
+import hashlib
 import mimetypes
+import os
+import threading
+import time
+from pathlib import Path
 
-app = Flask(__name__)
-
-BASE_DIR = Path(__file__).resolve().parent
-DATA_DIR = BASE_DIR / "data"
-TEMAS_FILE = DATA_DIR / "temas.json"
-CONCURSOS_FILE = DATA_DIR / "concursos.json"
-CONCURSOS_CATEGORIAS_FILE = DATA_DIR / "concursos_categorias.json"
-PROBLEMAS_FILE = DATA_DIR / "problemas.json"
-CURSOS_FILE = DATA_DIR / "cursos.json"
-
-def cargar_temas():
-    if not TEMAS_FILE.exists():
-        return []
-    with TEMAS_FILE.open("r", encoding="utf-8") as f:
-        temas = json.load(f)
-    # ordenar por campo 'orden'
-    temas.sort(key=lambda t: t.get("orden", 0))
-    return temas
-
-def guardar_temas(temas):
-    with TEMAS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(temas, f, indent=4, ensure_ascii=False)
-
-def obtener_categorias():
-    temas = cargar_temas()
-    categorias = sorted({t.get("categoria") for t in temas if t.get("categoria")})
-    return categorias
-
-def cargar_concursos():
-    if not CONCURSOS_FILE.exists():
-        return []
-    with CONCURSOS_FILE.open("r", encoding="utf-8") as f:
-        concursos = json.load(f)
-    # ordenar por año descendente y luego por nombre
-    concursos.sort(key=lambda c: (-int(c.get("anio", 0)), c.get("nombre", "")))
-    return concursos
-
-
-def guardar_concursos(concursos):
-    with CONCURSOS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(concursos, f, indent=4, ensure_ascii=False)
-
-def cargar_categorias_concursos():
-    # Lee las categorías con orden desde archivo (si existe)
-    if CONCURSOS_CATEGORIAS_FILE.exists():
-        with CONCURSOS_CATEGORIAS_FILE.open("r", encoding="utf-8") as f:
-            categorias = json.load(f)
-    else:
-        categorias = []
-
-    # Asegurar que todas las categorías presentes en concursos existan aquí
-    concursos = cargar_concursos()
-    nombres_existentes = {c["nombre"] for c in categorias}
-    categorias_en_concursos = set()
-
-    for conc in concursos:
-        cat = conc.get("categoria") or "Sin categoría"
-        categorias_en_concursos.add(cat)
-
-    # Asignar orden nuevo al final para las categorías que falten
-    if categorias:
-        max_orden = max(c["orden"] for c in categorias)
-    else:
-        max_orden = 0
-
-    for cat in sorted(categorias_en_concursos):
-        if cat not in nombres_existentes:
-            max_orden += 1
-            categorias.append({
-                "nombre": cat,
-                "orden": max_orden
-            })
-
-    # Ordenar internamente por 'orden'
-    categorias.sort(key=lambda c: c["orden"])
-
-    # Guardar de vuelta por si agregamos nuevas
-    guardar_categorias_concursos(categorias)
-
-    return categorias
-
-def guardar_categorias_concursos(categorias):
-    with CONCURSOS_CATEGORIAS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(categorias, f, indent=4, ensure_ascii=False)
-
-def cargar_problemas():
-    if not PROBLEMAS_FILE.exists():
-        return []
-    with PROBLEMAS_FILE.open("r", encoding="utf-8") as f:
-        probs = json.load(f)
-    return probs
-
+from datos import (
+    BASE_DIR,
+    cargar_temas,
+    obtener_tema,
+    guardar_temas,
+    obtener_categorias,
+    cargar_concursos,
+    guardar_concursos,
+    cargar_categorias_concursos,
+    guardar_categorias_concursos,
+    sincronizar_categorias_concursos,
+    cargar_problemas,
+    obtener_problema,
+    guardar_problemas,
+    cargar_cursos,
+    guardar_cursos,
+    transaccion,
+    version_registro,
+    version_colecciones,
+    al_guardar,
+    conjunto_actual,
+    conjunto_en_fecha,
+    existe_conjunto,
+    usar_conjunto,
+    deshacer_ultimo_cambio,
+    cambios_recientes,
+)
+from historial import normalizar_fecha
+from indices import (
+    cargar_grupos_problemas,
+    problemas_del_grupo,
+    tema_principal_por_id,
+    filtrar_problemas,
+    ordenar_temas,
+)
+from busqueda import buscar
+from importar import importar_binario
+from exportar import FORMATOS, exportar
+from referencias import referencias, renombrar, quitar_referencias, integridad
+from usos import (
+    conjuntos_curso,
+    marcar_uso,
+    tablero_curso,
+    nunca_usados,
+    usados_en_al_menos,
+    solapamiento,
+    diferencia,
+)
+from archivos import estado_rutas, reporte as reporte_archivos, version as version_archivos
+from archivos import iniciar as iniciar_escaneo
+from notas import ESTILOS, se_puede_mostrar, html_de_archivo, firma_archivo, precalentar
+from metricas import (
+    contar,
+    observar,
+    fase,
+    empezar_fase,
+    terminar_fase,
+    iniciar_peticion,
+    terminar_peticion,
+    texto_prometheus,
+)
 
-def guardar_problemas(problemas):
-    with PROBLEMAS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(problemas, f, indent=4, ensure_ascii=False)
+app = Flask(__name__)
 
-def calcular_tema_principal(problema, temas):
+# Peticiones lentas: con ICPC_DB_LENTAS_MS se registra en el log cada
+# petición que tarde más de esos milisegundos, con su desglose por fase.
+# Con ICPC_DB_PERFILAR=1 además se perfila cada petición con cProfile y las
+# lentas se guardan en ICPC_DB_PERFILES (por defecto perfiles/) para verlas
+# con pstats o snakeviz.
+LENTAS_MS = float(os.environ.get("ICPC_DB_LENTAS_MS") or 0)
+PERFILAR = os.environ.get("ICPC_DB_PERFILAR") == "1"
+PERFILES_DIR = Path(os.environ.get("ICPC_DB_PERFILES") or BASE_DIR / "perfiles")
+
+# Con ICPC_DB_PRECALENTAR=1 las notas de temas/ se convierten a HTML en
+# segundo plano al arrancar (ver crear_app()), para que la primera visita ya
+# salga de la caché.
+PRECALENTAR = os.environ.get("ICPC_DB_PRECALENTAR") == "1"
+
+
+@app.before_request
+def _empezar_medicion():
+    g.metricas = iniciar_peticion()
+    g.inicio = time.perf_counter()
+    g.perfil = None
+    if PERFILAR:
+        g.perfil = cProfile.Profile()
+        try:
+            g.perfil.enable()
+        except ValueError:  # ya hay otro perfilador activo en este hilo
+            g.perfil = None
+
+
+@app.after_request
+def _terminar_medicion(respuesta):
+    if "metricas" not in g:
+        return respuesta
+    duracion = time.perf_counter() - g.inicio
+    if g.perfil is not None:
+        g.perfil.disable()
+    fases = terminar_peticion(g.pop("metricas"))
+
+    # la regla y no la ruta concreta, para no crear una serie por cada id
+    ruta = request.url_rule.rule if request.url_rule else "(sin ruta)"
+    contar("icpc_peticiones_total", ruta=ruta, metodo=request.method, estado=respuesta.status_code)
+    observar("icpc_peticion_segundos", duracion, ruta=ruta)
+    for nombre, segundos in fases.items():
+        contar("icpc_fase_segundos_total", segundos, ruta=ruta, fase=nombre)
+
+    if LENTAS_MS and duracion * 1000 >= LENTAS_MS:
+        desglose = ", ".join(f"{n}={s * 1000:.1f}ms" for n, s in sorted(fases.items()))
+        app.logger.warning(
+            "Petición lenta: %s %s %.1fms (%s)",
+            request.method, request.full_path.rstrip("?"), duracion * 1000, desglose or "sin fases",
+        )
+        if g.perfil is not None:
+            PERFILES_DIR.mkdir(parents=True, exist_ok=True)
+            nombre = "".join(c if c.isalnum() else "_" for c in request.path).strip("_")
+            g.perfil.dump_stats(PERFILES_DIR / (
+                f"{time.strftime('%Y%m%d-%H%M%S')}.{time.time_ns() // 1000 % 1000000:06d}-{request.method}-"
+                f"{nombre or 'inicio'}-{duracion * 1000:.0f}ms.prof"
+            ))
+    return respuesta
+
+
+@before_render_template.connect_via(app)
+def _empezar_render(sender, template, context, **extra):
+    empezar_fase("render")
+
+
+@template_rendered.connect_via(app)
+def _terminar_render(sender, template, context, **extra):
+    terminar_fase()
+
+
+@app.context_processor
+def _variables_plantillas():
+    # sitio.py genera las páginas de solo lectura con g.solo_lectura; las
+    # vistas en una fecha pasada (/h/<fecha>/...) también son de solo lectura
+    fecha = request.environ.get("icpc.fecha")
+    return {
+        "solo_lectura": g.get("solo_lectura", False) or fecha is not None,
+        "fecha_historial": fecha,
+        "raiz_vigente": request.environ.get("icpc.raiz", ""),
+    }
+
+
+@app.route("/metrics")
+def metrics():
+    """Contadores y tiempos de este proceso en formato de texto de Prometheus."""
+    return Response(texto_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+CONFLICTO = (
+    "Alguien más modificó estos datos mientras los editabas. "
+    "Recarga la página y vuelve a intentarlo.",
+    409,
+)
+
+
+def con_bloqueo(vista):
     """
-    Devuelve el nombre del 'tema principal' del problema:
-    el tema con mayor 'orden' de entre los temas asociados.
-    Si no tiene temas, devuelve 'Sin tema principal'.
+    Para las peticiones POST, hace todo el ciclo cargar -> modificar ->
+    guardar de la vista dentro de una transacción (bloqueo entre procesos).
     """
-    nombres_temas_problema = problema.get("temas") or []
-    if not nombres_temas_problema:
-        return "Sin tema principal"
-
-    orden_por_nombre = {t["nombre"]: t.get("orden", 0) for t in temas}
-
-    # usamos -1 si el tema no existe en la lista de temas
-    return max(
-        nombres_temas_problema,
-        key=lambda nombre: orden_por_nombre.get(nombre, -1)
-    )
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if request.method != "POST":
+            return vista(*args, **kwargs)
+        with transaccion():
+            return vista(*args, **kwargs)
+    return envoltura
 
 
-def agrupar_problemas_por_tema_principal(problemas, temas):
+def es_version_vieja(actual):
     """
-    Regresa una lista de grupos:
-    [
-      {
-        "nombre": "Segment Tree",
-        "problemas": [ ... lista de problemas ... ]
-      },
-      ...
-    ]
-    Los grupos se ordenan por el 'orden' del Tema.
-    Dentro de cada grupo:
-      - primero los etiquetados como Introductorios,
-      - luego el resto en el orden original.
+    True si el formulario se generó a partir de otra versión de 'actual'
+    (un registro o lista). Los formularios sin campo 'version' se aceptan.
     """
-    # por si queremos usar el orden original como tie-breaker
-    for idx, p in enumerate(problemas):
-        p["_idx"] = idx
-
-    grupos_dict = {}  # nombre_tema_principal -> lista de problemas
+    enviada = request.form.get("version", "")
+    return bool(enviada) and enviada != version_registro(actual)
 
-    for p in problemas:
-        tema_principal = calcular_tema_principal(p, temas)
-        p["_tema_principal"] = tema_principal
-        grupos_dict.setdefault(tema_principal, []).append(p)
 
-    # Orden de grupos: primero los temas en su orden, luego extra, luego 'Sin tema principal'
-    nombres_grupos_ordenados = []
+def confirmar_eliminacion(tipo, clave):
+    """
+    Si algo menciona al registro que se va a borrar y el formulario no pidió
+    borrar en cascada, regresa la página que lista esas referencias y pide
+    confirmación. Si no, quita las referencias y regresa None.
+    """
+    refs = referencias(tipo, clave)
+    if not refs["problemas"] and not refs["cursos"]:
+        return None
+    if not request.form.get("cascada"):
+        return render_template(
+            "confirmar_eliminar.html", tipo=tipo, clave=clave, refs=refs
+        ), 409
+    quitar_referencias(tipo, clave)
+    return None
 
-    nombres_temas = [t["nombre"] for t in temas]
-    for nombre in nombres_temas:
-        if nombre in grupos_dict:
-            nombres_grupos_ordenados.append(nombre)
 
-    otros = [
-        nombre for nombre in grupos_dict.keys()
-        if nombre not in nombres_grupos_ordenados
-        and nombre != "Sin tema principal"
-    ]
-    otros.sort()
-    nombres_grupos_ordenados.extend(otros)
+# Las plantillas también forman parte del ETag: si se actualiza la app con
+# los mismos datos, los navegadores no deben quedarse con el HTML viejo.
+VERSION_PLANTILLAS = hashlib.sha1(repr(sorted(
+    (p.name, p.stat().st_mtime_ns) for p in (BASE_DIR / "templates").glob("*.html")
+)).encode("utf-8")).hexdigest()[:8]
 
-    if "Sin tema principal" in grupos_dict:
-        nombres_grupos_ordenados.append("Sin tema principal")
+# Páginas ya renderizadas de cada conjunto de datos: ruta -> (etag, html).
+# Se vacía en cada guardar_* de ese conjunto.
+def _paginas():
+    return conjunto_actual().derivado("paginas", dict)
 
-    grupos = []
-    for nombre in nombres_grupos_ordenados:
-        lista = grupos_dict[nombre]
 
-        # Introductorios primero (etiqueta == 'introductorio', case-insensitive)
-        def es_introductorio(p):
-            return (p.get("etiqueta", "") or "").strip().lower() == "introductorio"
+@al_guardar
+def _invalidar_paginas(coleccion):
+    _paginas().clear()
 
-        lista.sort(key=lambda p: (not es_introductorio(p), p["_idx"]))
 
-        grupos.append({
-            "nombre": nombre,
-            "problemas": lista,
-        })
-
-    return grupos
-
-def cargar_cursos():
-    if not CURSOS_FILE.exists():
-        return []
-    with CURSOS_FILE.open("r", encoding="utf-8") as f:
-        cursos = json.load(f)
-    # ordenar por nombre alfabéticamente
-    cursos.sort(key=lambda c: c.get("nombre", ""))
-    return cursos
+def con_cache(*colecciones):
+    """
+    Para las vistas GET que solo dependen de 'colecciones': responde 304 si
+    el navegador ya tiene la versión vigente (ETag) y, si no, reutiliza el
+    HTML ya renderizado mientras los datos no cambien.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            if request.method != "GET":
+                return vista(*args, **kwargs)
+
+            # las páginas también muestran si existen los archivos de notas
+            etag = f"{version_colecciones(*colecciones)}-{version_archivos()}-{VERSION_PLANTILLAS}"
+            if etag in request.if_none_match:
+                contar("icpc_cache_paginas_total", resultado="304")
+                respuesta = make_response("", 304)
+                respuesta.set_etag(etag)
+                return respuesta
+
+            paginas = _paginas()
+            entrada = paginas.get(request.path)
+            if entrada and entrada[0] == etag:
+                contar("icpc_cache_paginas_total", resultado="cache")
+                html = entrada[1]
+            else:
+                contar("icpc_cache_paginas_total", resultado="render")
+                html = vista(*args, **kwargs)
+                if not isinstance(html, str):
+                    # errores (404, ...) y redirecciones no se guardan
+                    return html
+                paginas[request.path] = (etag, html)
+
+            respuesta = make_response(html)
+            respuesta.set_etag(etag)
+            # el navegador puede guardar la página, pero debe revalidarla
+            respuesta.headers["Cache-Control"] = "no-cache"
+            return respuesta
+        return envoltura
+    return decorador
 
-def guardar_cursos(cursos):
-    with CURSOS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(cursos, f, indent=4, ensure_ascii=False)
 
 @app.route("/")
 def home():
@@ -200,14 +273,21 @@ def home():
 
 
 @app.route("/temas")
+@con_cache("temas")
 def lista_temas():
     temas = cargar_temas()
-    return render_template("temas_list.html", temas=temas)
+    return render_template(
+        "temas_list.html",
+        temas=temas,
+        version=version_registro([t["nombre"] for t in temas]),
+        estados=estado_rutas("temas"),
+    )
 
 from flask import request, redirect, url_for
 
 
 @app.route("/temas/nuevo", methods=["GET", "POST"])
+@con_bloqueo
 def nuevo_tema():
     if request.method == "POST":
         nombre = request.form["nombre"].strip()
@@ -217,6 +297,9 @@ def nuevo_tema():
         ruta = request.form["ruta"].strip()
 
         temas = cargar_temas()
+        if any(t["nombre"] == nombre for t in temas):
+            return "Ya existe un tema con ese nombre", 400
+
         nuevo_orden = (temas[-1]["orden"] + 1) if temas else 1
 
         temas.append({
@@ -232,6 +315,7 @@ def nuevo_tema():
     return render_template("temas_form.html", modo="nuevo", tema=None, categorias=obtener_categorias())
 
 @app.route("/temas/editar/<nombre>", methods=["GET", "POST"])
+@con_bloqueo
 def editar_tema(nombre):
     temas = cargar_temas()
     tema = next((t for t in temas if t["nombre"] == nombre), None)
@@ -246,17 +330,36 @@ def editar_tema(nombre):
         categoria = categoria_nueva or categoria_existente
         ruta = request.form["ruta"].strip()
 
+        if es_version_vieja(tema):
+            return CONFLICTO
+
+        # evitar duplicado de nombre (con otro tema)
+        if nuevo_nombre != nombre and any(t["nombre"] == nuevo_nombre for t in temas):
+            return "Ya existe otro tema con ese nombre", 400
+
         tema["nombre"] = nuevo_nombre
         tema["categoria"] = categoria
         tema["ruta"] = ruta
 
         guardar_temas(temas)
+        renombrar("tema", nombre, nuevo_nombre)  # problemas y cursos que lo usan
         return redirect(url_for("lista_temas"))
 
-    return render_template("temas_form.html", modo="editar", tema=tema, categorias=obtener_categorias())
+    return render_template(
+        "temas_form.html",
+        modo="editar",
+        tema=tema,
+        categorias=obtener_categorias(),
+        version=version_registro(tema),
+    )
 
 @app.route("/temas/eliminar/<nombre>", methods=["POST"])
+@con_bloqueo
 def eliminar_tema(nombre):
+    confirmacion = confirmar_eliminacion("tema", nombre)
+    if confirmacion:
+        return confirmacion
+
     temas = cargar_temas()
     nuevos = [t for t in temas if t["nombre"] != nombre]
 
@@ -264,42 +367,54 @@ def eliminar_tema(nombre):
     return redirect(url_for("lista_temas"))
 
 @app.route("/temas/orden", methods=["POST"])
+@con_bloqueo
 def guardar_orden_temas_route():
     orden_str = request.form.get("orden", "") or ""
-    print("ORDEN RECIBIDO:", orden_str)  # <- ayuda para depurar en consola
+    app.logger.debug("Orden recibido: %s", orden_str)
 
     nombres = [n for n in orden_str.split(",") if n.strip()]
     temas = cargar_temas()
-    tema_por_nombre = {t["nombre"]: t for t in temas}
-
-    nuevos = []
-    orden_val = 1
-
-    # Asignar orden según la lista que viene del frontend
-    for nombre in nombres:
-        tema = tema_por_nombre.get(nombre)
-        if not tema:
-            continue
-        tema["orden"] = orden_val
-        orden_val += 1
-        nuevos.append(tema)
-
-    # Si por alguna razón hay temas que no llegaron en la lista (caso raro),
-    # los mandamos al final, conservando su orden relativo anterior.
-    for t in temas:
-        if t["nombre"] not in nombres:
-            t["orden"] = orden_val
-            orden_val += 1
-            nuevos.append(t)
 
-    guardar_temas(nuevos)
+    # si alguien más reordenó mientras tanto, no pisar su orden
+    if es_version_vieja([t["nombre"] for t in temas]):
+        return CONFLICTO
+
+    guardar_temas(ordenar_temas(temas, nombres))
     return redirect(url_for("lista_temas"))
 
 
+def pagina_nota(titulo, archivo, url_crudo, coleccion):
+    """
+    Muestra una nota Markdown o un archivo de código dentro de base.html.
+    El HTML sale de la caché de notas.py; el ETag cambia con el archivo y
+    con 'coleccion' (de ahí sale el título).
+    """
+    etag = f"{firma_archivo(archivo)}-{version_colecciones(coleccion)}-{VERSION_PLANTILLAS}"
+    if etag in request.if_none_match:
+        respuesta = make_response("", 304)
+        respuesta.set_etag(etag)
+        return respuesta
+
+    try:
+        ruta = archivo.relative_to(BASE_DIR).as_posix()
+    except ValueError:
+        ruta = str(archivo)
+    respuesta = make_response(render_template(
+        "nota.html",
+        titulo=titulo,
+        ruta=ruta,
+        contenido=html_de_archivo(archivo),
+        estilos=ESTILOS,
+        url_crudo=url_crudo,
+    ))
+    respuesta.set_etag(etag)
+    respuesta.headers["Cache-Control"] = "no-cache"
+    return respuesta
+
+
 @app.route("/temas/ver/<nombre>")
 def ver_tema(nombre):
-    temas = cargar_temas()
-    tema = next((t for t in temas if t["nombre"] == nombre), None)
+    tema = obtener_tema(nombre)
 
     if not tema or not tema.get("ruta"):
         return "No hay archivo asociado a este tema.", 404
@@ -307,14 +422,28 @@ def ver_tema(nombre):
     # Interpretar la ruta como relativa al directorio del proyecto
     file_path = (BASE_DIR / tema["ruta"]).resolve()
 
+    if not file_path.is_relative_to(BASE_DIR):
+        return "La ruta de este tema apunta fuera del proyecto.", 404
     if not file_path.exists():
         return f"Archivo no encontrado: {file_path}", 404
 
+    # las notas .md se muestran ya convertidas; ?crudo=1 baja el archivo tal cual
+    if file_path.is_file() and se_puede_mostrar(file_path) and not request.args.get("crudo"):
+        return pagina_nota(
+            tema["nombre"], file_path, url_for("ver_tema", nombre=nombre, crudo=1), "temas"
+        )
+
     mime_type, _ = mimetypes.guess_type(str(file_path))
     # send_file se encarga de mostrar pdf en el navegador, txt/md como descarga o texto
-    return send_file(file_path, mimetype=mime_type or "application/octet-stream")
+    with fase("archivo"):
+        return send_file(
+            file_path,
+            mimetype=mime_type or "application/octet-stream",
+            conditional=True,  # ETag + Last-Modified del archivo, responde 304
+        )
 
 @app.route("/concursos")
+@con_cache("concursos", "concursos_categorias")
 def lista_concursos():
     concursos = cargar_concursos()
     categorias = cargar_categorias_concursos()
@@ -333,10 +462,12 @@ def lista_concursos():
         "concursos_list.html",
         categorias=categorias,
         concursos_por_categoria=concursos_por_categoria,
+        version=version_registro([c["nombre"] for c in categorias]),
     )
 
 
 @app.route("/concursos/nuevo", methods=["GET", "POST"])
+@con_bloqueo
 def nuevo_concurso():
     if request.method == "POST":
         nombre = request.form["nombre"].strip()
@@ -363,7 +494,7 @@ def nuevo_concurso():
         guardar_concursos(concursos)
 
         # actualizar categorías (por si se creó una nueva)
-        cargar_categorias_concursos()
+        sincronizar_categorias_concursos()
 
         return redirect(url_for("lista_concursos"))
 
@@ -372,6 +503,7 @@ def nuevo_concurso():
 
 
 @app.route("/concursos/editar/<nombre>", methods=["GET", "POST"])
+@con_bloqueo
 def editar_concurso(nombre):
     concursos = cargar_concursos()
     concurso = next((c for c in concursos if c["nombre"] == nombre), None)
@@ -391,28 +523,48 @@ def editar_concurso(nombre):
         except ValueError:
             anio = None
 
+        if es_version_vieja(concurso):
+            return CONFLICTO
+
+        # evitar duplicado de nombre (con otro concurso)
+        if nuevo_nombre != nombre and any(c["nombre"] == nuevo_nombre for c in concursos):
+            return "Ya existe otro concurso con ese nombre", 400
+
         concurso["nombre"] = nuevo_nombre
         concurso["anio"] = anio
         concurso["categoria"] = categoria
 
         guardar_concursos(concursos)
-        cargar_categorias_concursos()  # por si aparece una nueva categoría
+        sincronizar_categorias_concursos()  # por si aparece una nueva categoría
+        renombrar("concurso", nombre, nuevo_nombre)
 
         return redirect(url_for("lista_concursos"))
 
     categorias = cargar_categorias_concursos()
-    return render_template("concursos_form.html", modo="editar", concurso=concurso, categorias=categorias)
+    return render_template(
+        "concursos_form.html",
+        modo="editar",
+        concurso=concurso,
+        categorias=categorias,
+        version=version_registro(concurso),
+    )
 
 
 
 @app.route("/concursos/eliminar/<nombre>", methods=["POST"])
+@con_bloqueo
 def eliminar_concurso(nombre):
+    confirmacion = confirmar_eliminacion("concurso", nombre)
+    if confirmacion:
+        return confirmacion
+
     concursos = cargar_concursos()
     nuevos = [c for c in concursos if c["nombre"] != nombre]
     guardar_concursos(nuevos)
     return redirect(url_for("lista_concursos"))
 
 @app.route("/concursos/categorias/mover/<nombre>/<direccion>", methods=["POST"])
+@con_bloqueo
 def mover_categoria_concurso(nombre, direccion):
     categorias = cargar_categorias_concursos()
     idx = next((i for i, c in enumerate(categorias) if c["nombre"] == nombre), None)
@@ -428,15 +580,39 @@ def mover_categoria_concurso(nombre, direccion):
     guardar_categorias_concursos(categorias)
     return redirect(url_for("lista_concursos"))
 
+@app.route("/concursos/categorias/orden", methods=["POST"])
+@con_bloqueo
+def guardar_orden_categorias_concursos():
+    # un nombre por línea: los nombres de categoría pueden llevar comas
+    nombres = [n.strip() for n in request.form.get("orden", "").split("\n") if n.strip()]
+    categorias = cargar_categorias_concursos()
+
+    if es_version_vieja([c["nombre"] for c in categorias]):
+        return CONFLICTO
+
+    por_nombre = {c["nombre"]: c for c in categorias}
+    nuevas = [por_nombre.pop(n) for n in dict.fromkeys(nombres) if n in por_nombre]
+    # las que no llegaron (caso raro) van al final, en su orden anterior
+    nuevas.extend(c for c in categorias if c["nombre"] in por_nombre)
+    for i, c in enumerate(nuevas, start=1):
+        c["orden"] = i
+
+    guardar_categorias_concursos(nuevas)
+    return redirect(url_for("lista_concursos"))
+
 @app.route("/problemas")
+@con_cache("temas", "problemas")
 def lista_problemas():
-    problemas = cargar_problemas()
-    temas = cargar_temas()
-    grupos = agrupar_problemas_por_tema_principal(problemas, temas)
-    return render_template("problemas_list.html", grupos=grupos)
+    grupos = cargar_grupos_problemas()
+    for grupo in grupos:
+        grupo["version"] = version_registro([p["id"] for p in grupo["problemas"]])
+    return render_template(
+        "problemas_list.html", grupos=grupos, estados=estado_rutas("problemas")
+    )
 
 
 @app.route("/problemas/nuevo", methods=["GET", "POST"])
+@con_bloqueo
 def nuevo_problema():
     temas = cargar_temas()
     concursos = cargar_concursos()
@@ -474,7 +650,26 @@ def nuevo_problema():
         concursos=concursos,
     )
 
+@app.route("/problemas/importar", methods=["GET", "POST"])
+@con_bloqueo
+def importar_problemas():
+    reporte = None
+    if request.method == "POST":
+        archivo = request.files.get("archivo")
+        if not archivo or not archivo.filename:
+            return "Selecciona un archivo CSV o JSONL", 400
+
+        reporte = importar_binario(
+            archivo.stream,
+            archivo.filename,
+            crear_faltantes=not request.form.get("no_crear"),
+            simulacro=bool(request.form.get("simulacro")),
+        )
+
+    return render_template("importar.html", reporte=reporte)
+
 @app.route("/problemas/editar/<problema_id>", methods=["GET", "POST"])
+@con_bloqueo
 def editar_problema(problema_id):
     temas = cargar_temas()
     concursos = cargar_concursos()
@@ -493,6 +688,9 @@ def editar_problema(problema_id):
         ruta_solucion = request.form["ruta_solucion"].strip()
         etiqueta = request.form["etiqueta"].strip()
 
+        if es_version_vieja(problema):
+            return CONFLICTO
+
         # validar que el nuevo ID no choque con otro problema distinto
         if nuevo_id != problema_id and any(p["id"] == nuevo_id for p in problemas):
             return "Ya existe otro problema con ese ID", 400
@@ -506,6 +704,7 @@ def editar_problema(problema_id):
         problema["etiqueta"] = etiqueta
 
         guardar_problemas(problemas)
+        renombrar("problema", problema_id, nuevo_id)  # usos en los cursos
         return redirect(url_for("lista_problemas"))
 
     return render_template(
@@ -514,10 +713,16 @@ def editar_problema(problema_id):
         problema=problema,
         temas=temas,
         concursos=concursos,
+        version=version_registro(problema),
     )
 
 @app.route("/problemas/eliminar/<problema_id>", methods=["POST"])
+@con_bloqueo
 def eliminar_problema(problema_id):
+    confirmacion = confirmar_eliminacion("problema", problema_id)
+    if confirmacion:
+        return confirmacion
+
     problemas = cargar_problemas()
     nuevos = [p for p in problemas if p["id"] != problema_id]
     guardar_problemas(nuevos)
@@ -525,56 +730,101 @@ def eliminar_problema(problema_id):
 
 @app.route("/problemas/ver_solucion/<problema_id>")
 def ver_solucion_problema(problema_id):
-    problemas = cargar_problemas()
-    problema = next((p for p in problemas if p["id"] == problema_id), None)
+    problema = obtener_problema(problema_id)
 
     if not problema or not problema.get("ruta_solucion"):
         return "No hay archivo de solución asociado a este problema.", 404
 
     file_path = (BASE_DIR / problema["ruta_solucion"]).resolve()
 
+    if not file_path.is_relative_to(BASE_DIR):
+        return "La ruta de esta solución apunta fuera del proyecto.", 404
     if not file_path.exists():
         return f"Archivo no encontrado: {file_path}", 404
 
+    if file_path.is_file() and se_puede_mostrar(file_path) and not request.args.get("crudo"):
+        return pagina_nota(
+            f"Solución de {problema.get('nombre') or problema_id}",
+            file_path,
+            url_for("ver_solucion_problema", problema_id=problema_id, crudo=1),
+            "problemas",
+        )
+
     mime_type, _ = mimetypes.guess_type(str(file_path))
-    return send_file(file_path, mimetype=mime_type or "application/octet-stream")
+    with fase("archivo"):
+        return send_file(
+            file_path,
+            mimetype=mime_type or "application/octet-stream",
+            conditional=True,  # ETag + Last-Modified del archivo, responde 304
+        )
+
+@app.route("/problemas/orden", methods=["POST"])
+@con_bloqueo
+def guardar_orden_problemas():
+    """
+    Recibe el orden completo de los problemas de un grupo (tema principal)
+    y lo aplica en una sola pasada y un solo guardado.
+    """
+    grupo = request.form.get("grupo", "")
+    # un id por línea
+    ids = [i.strip() for i in request.form.get("orden", "").split("\n") if i.strip()]
+
+    actuales = [p["id"] for p in problemas_del_grupo(grupo)]
+    if es_version_vieja(actuales):
+        return CONFLICTO
+
+    del_grupo = set(actuales)
+    nuevo_orden = [i for i in dict.fromkeys(ids) if i in del_grupo]
+    vistos = set(nuevo_orden)
+    # los que no llegaron (caso raro) van al final, en su orden anterior
+    nuevo_orden.extend(i for i in actuales if i not in vistos)
+
+    # los problemas del grupo ocupan los mismos lugares del banco que antes,
+    # solo que en el nuevo orden; los demás no se mueven
+    problemas = cargar_problemas()
+    por_id = {p["id"]: p for p in problemas if p["id"] in del_grupo}
+    siguiente = iter(nuevo_orden)
+    nuevos = [
+        por_id[next(siguiente)] if p["id"] in del_grupo else p
+        for p in problemas
+    ]
+
+    guardar_problemas(nuevos)
+    return redirect(url_for("lista_problemas"))
 
 @app.route("/problemas/mover/<problema_id>/<direccion>", methods=["POST"])
+@con_bloqueo
 def mover_problema(problema_id, direccion):
     problemas = cargar_problemas()
-    temas = cargar_temas()
 
     idx = next((i for i, p in enumerate(problemas) if p["id"] == problema_id), None)
     if idx is None:
         return "Problema no encontrado", 404
 
-    tema_main = calcular_tema_principal(problemas[idx], temas)
-
-    # Índices de todos los problemas con el mismo tema principal
-    indices_grupo = [
-        i for i, p in enumerate(problemas)
-        if calcular_tema_principal(p, temas) == tema_main
-    ]
+    principal = tema_principal_por_id()
+    tema_main = principal.get(problema_id)
 
-    pos = indices_grupo.index(idx)
-
-    if direccion == "up" and pos > 0:
-        other_idx = indices_grupo[pos - 1]
-        problemas[idx], problemas[other_idx] = problemas[other_idx], problemas[idx]
-    elif direccion == "down" and pos < len(indices_grupo) - 1:
-        other_idx = indices_grupo[pos + 1]
-        problemas[idx], problemas[other_idx] = problemas[other_idx], problemas[idx]
+    # Intercambiar con el vecino más cercano que tenga el mismo tema principal
+    paso = -1 if direccion == "up" else 1 if direccion == "down" else 0
+    other_idx = idx + paso
+    while paso and 0 <= other_idx < len(problemas):
+        if principal.get(problemas[other_idx]["id"]) == tema_main:
+            problemas[idx], problemas[other_idx] = problemas[other_idx], problemas[idx]
+            break
+        other_idx += paso
 
     guardar_problemas(problemas)
     return redirect(url_for("lista_problemas"))
 
 
 @app.route("/cursos")
+@con_cache("cursos")
 def lista_cursos():
     cursos = cargar_cursos()
     return render_template("cursos_list.html", cursos=cursos)
 
 @app.route("/cursos/nuevo", methods=["GET", "POST"])
+@con_bloqueo
 def nuevo_curso():
     if request.method == "POST":
         nombre = request.form["nombre"].strip()
@@ -597,6 +847,7 @@ def nuevo_curso():
     return render_template("cursos_form.html", modo="nuevo", curso=None)
 
 @app.route("/cursos/editar/<nombre>", methods=["GET", "POST"])
+@con_bloqueo
 def editar_curso(nombre):
     cursos = cargar_cursos()
     curso = next((c for c in cursos if c["nombre"] == nombre), None)
@@ -608,6 +859,9 @@ def editar_curso(nombre):
         nuevo_nombre = request.form["nombre"].strip()
         descripcion = request.form["descripcion"].strip()
 
+        if es_version_vieja(curso):
+            return CONFLICTO
+
         # evitar duplicado de nombre (con otro curso)
         if nuevo_nombre != nombre and any(c["nombre"] == nuevo_nombre for c in cursos):
             return "Ya existe otro curso con ese nombre", 400
@@ -618,9 +872,15 @@ def editar_curso(nombre):
         guardar_cursos(cursos)
         return redirect(url_for("lista_cursos"))
 
-    return render_template("cursos_form.html", modo="editar", curso=curso)
+    return render_template(
+        "cursos_form.html",
+        modo="editar",
+        curso=curso,
+        version=version_registro(curso),
+    )
 
 @app.route("/cursos/eliminar/<nombre>", methods=["POST"])
+@con_bloqueo
 def eliminar_curso(nombre):
     cursos = cargar_cursos()
     nuevos = [c for c in cursos if c["nombre"] != nombre]
@@ -628,17 +888,18 @@ def eliminar_curso(nombre):
     return redirect(url_for("lista_cursos"))
 
 @app.route("/cursos/gestionar/<nombre>", methods=["GET", "POST"])
+@con_bloqueo
+@con_cache("cursos", "temas", "concursos", "problemas")
 def gestionar_curso(nombre):
     cursos = cargar_cursos()
     curso = next((c for c in cursos if c["nombre"] == nombre), None)
     if not curso:
         return "Curso no encontrado", 404
 
-    temas = cargar_temas()
-    concursos = cargar_concursos()
-    problemas = cargar_problemas()
-
     if request.method == "POST":
+        if es_version_vieja(curso):
+            return CONFLICTO
+
         usados_problemas = request.form.getlist("usados_problemas")
         usados_temas = request.form.getlist("usados_temas")
         usados_concursos = request.form.getlist("usados_concursos")
@@ -651,15 +912,350 @@ def gestionar_curso(nombre):
         return redirect(url_for("gestionar_curso", nombre=curso["nombre"]))
 
     # Agrupar problemas por tema principal, en el mismo orden que en /problemas
-    grupos_problemas = agrupar_problemas_por_tema_principal(problemas, temas)
+    grupos_problemas = cargar_grupos_problemas()
+    temas = cargar_temas()
+    concursos = cargar_concursos()
 
     return render_template(
         "curso_usos.html",
         curso=curso,
+        usados=conjuntos_curso(curso),
         temas=temas,
         concursos=concursos,
         grupos_problemas=grupos_problemas,
+        version=version_registro(curso),
     )
 
+
+@app.route("/cursos/tablero/<nombre>")
+@con_cache("cursos", "temas", "concursos", "problemas")
+def tablero_curso_page(nombre):
+    tablero = tablero_curso(nombre)
+    if tablero is None:
+        return "Curso no encontrado", 404
+    return render_template("curso_tablero.html", **tablero)
+
+
+@app.route("/cursos/comparar")
+def comparar_cursos():
+    a = request.args.get("a", "")
+    b = request.args.get("b", "")
+    try:
+        solo_a = diferencia(a, b) if a and b else None
+        solo_b = diferencia(b, a) if a and b else None
+    except KeyError:
+        return "Curso no encontrado", 404
+
+    return render_template(
+        "cursos_comparar.html",
+        solapamiento=solapamiento(),
+        nunca_usados=len(nunca_usados()),
+        a=a,
+        b=b,
+        solo_a=solo_a,
+        solo_b=solo_b,
+    )
+
+
+@app.route("/api/cursos/<nombre>/usos", methods=["POST"])
+@con_bloqueo
+def api_marcar_uso(nombre):
+    """
+    Marca o desmarca un solo elemento como usado en el curso:
+      {"tipo": "problema"|"tema"|"concurso", "clave": "...", "usado": true|false}
+    Regresa la nueva versión del curso (para el campo 'version' del formulario).
+    """
+    datos_peticion = request.get_json(silent=True)
+    if not isinstance(datos_peticion, dict):
+        return jsonify(error="Se esperaba un objeto JSON"), 400
+    tipo = datos_peticion.get("tipo")
+    clave = str(datos_peticion.get("clave", ""))
+    usado = bool(datos_peticion.get("usado"))
+    try:
+        curso = marcar_uso(nombre, tipo, clave, usado)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if curso is None:
+        return jsonify(error="Curso no encontrado"), 404
+
+    return jsonify(
+        curso=curso["nombre"],
+        tipo=tipo,
+        clave=clave,
+        usado=usado,
+        version=version_registro(curso),
+    )
+
+def _enlace_resultado(resultado):
+    if resultado["tipo"] == "problema":
+        return url_for("editar_problema", problema_id=resultado["clave"])
+    if resultado["tipo"] == "tema":
+        return url_for("editar_tema", nombre=resultado["clave"])
+    return url_for("editar_concurso", nombre=resultado["clave"])
+
+
+def _resultados_busqueda(consulta, limite):
+    resultados = buscar(consulta, limite=limite) if consulta else []
+    for r in resultados:
+        r["enlace"] = _enlace_resultado(r)
+    return resultados
+
+
+@app.route("/buscar")
+def buscar_page():
+    consulta = request.args.get("q", "").strip()
+    resultados = _resultados_busqueda(consulta, limite=100)
+    return render_template("buscar.html", consulta=consulta, resultados=resultados)
+
+
+@app.route("/api/buscar")
+def api_buscar():
+    consulta = request.args.get("q", "").strip()
+    limite = request.args.get("limite", 20, type=int)
+    return jsonify(
+        consulta=consulta,
+        resultados=_resultados_busqueda(consulta, limite=max(1, min(limite, 200))),
+    )
+
+# páginas que se pueden ver en una fecha pasada desde /historial
+PAGINAS_HISTORIAL = {
+    "problemas": "lista_problemas",
+    "temas": "lista_temas",
+    "concursos": "lista_concursos",
+    "cursos": "lista_cursos",
+}
+
+
+def _pagina_historial(error=None, estado=200):
+    return render_template(
+        "historial.html",
+        grupos=cambios_recientes(),
+        cursos=[c["nombre"] for c in cargar_cursos()],
+        deshecho=request.args.get("deshecho"),
+        error=error,
+    ), estado
+
+
+@app.route("/historial")
+def historial_page():
+    fecha = request.args.get("fecha", "").strip()
+    if not fecha:
+        return _pagina_historial()
+    try:
+        normalizar_fecha(fecha)
+    except ValueError:
+        return _pagina_historial(f"Fecha no válida: {fecha}", 400)
+
+    # la página elegida, en la vista de solo lectura de esa fecha
+    curso = request.args.get("curso")
+    if curso:
+        destino = url_for("gestionar_curso", nombre=curso)
+    else:
+        destino = url_for(PAGINAS_HISTORIAL.get(request.args.get("pagina"), "lista_problemas"))
+    destino = destino[len(request.script_root):]
+    return redirect(f"{request.script_root}{PREFIJO_FECHA}{fecha}{destino}")
+
+
+@app.route("/historial/deshacer", methods=["POST"])
+def deshacer_route():
+    try:
+        deshecho = deshacer_ultimo_cambio()
+    except ValueError as e:
+        return _pagina_historial(str(e), 409)
+    if deshecho is None:
+        return _pagina_historial("No hay cambios que deshacer.", 409)
+    return redirect(url_for("historial_page", deshecho=deshecho["fecha"]))
+
+
+@app.route("/integridad")
+@con_cache("temas", "concursos", "concursos_categorias", "problemas", "cursos")
+def integridad_page():
+    rotas = integridad()
+    por_origen = {}
+    for r in rotas:
+        por_origen.setdefault(r["origen"], []).append(r)
+    return render_template(
+        "integridad.html",
+        total=len(rotas),
+        por_origen=por_origen,
+        archivos=reporte_archivos(),
+    )
+
+
+@app.route("/api/usos/nunca_usados")
+def api_nunca_usados():
+    problemas = nunca_usados()
+    return jsonify(total=len(problemas), problemas=problemas)
+
+
+@app.route("/api/usos/al_menos")
+def api_usados_en_al_menos():
+    k = max(1, request.args.get("k", 2, type=int))
+    problemas = usados_en_al_menos(k)
+    return jsonify(k=k, total=len(problemas), problemas=problemas)
+
+
+@app.route("/api/usos/solapamiento")
+def api_solapamiento():
+    return jsonify(solapamiento())
+
+
+@app.route("/api/usos/diferencia")
+def api_diferencia():
+    """Problemas que usó el curso 'a' y el curso 'b' no."""
+    a = request.args.get("a", "")
+    b = request.args.get("b", "")
+    try:
+        problemas = diferencia(a, b)
+    except KeyError:
+        return jsonify(error="Curso no encontrado"), 404
+    return jsonify(a=a, b=b, total=len(problemas), problemas=problemas)
+
+
+def _filtros_de_peticion(args):
+    """Filtros de filtrar_problemas() a partir de los parámetros de la URL."""
+    return dict(
+        temas=args.getlist("tema"),
+        todos_los_temas=args.get("temas_modo") == "all",
+        concursos=args.getlist("concurso"),
+        etiquetas=args.getlist("etiqueta"),
+        jueces=args.getlist("juez"),
+        usado_en=args.get("usado_en"),
+        no_usado_en=args.get("no_usado_en"),
+        prefijo=args.get("prefijo", "").strip(),
+    )
+
+
+@app.route("/api/problemas")
+def api_problemas():
+    """
+    Filtros (todos opcionales, los repetibles se combinan con OR):
+      tema=...&tema=...   temas_modo=any|all
+      concurso=...        etiqueta=...        juez=CF|CSES|...
+      usado_en=<curso>    no_usado_en=<curso> prefijo=<inicio del id>
+      pagina=1            por_pagina=50
+    """
+    args = request.args
+    return jsonify(filtrar_problemas(
+        pagina=max(1, args.get("pagina", 1, type=int)),
+        por_pagina=max(1, min(args.get("por_pagina", 50, type=int), 500)),
+        **_filtros_de_peticion(args),
+    ))
+
+
+@app.route("/exportar/<formato>")
+def exportar_route(formato):
+    """
+    /exportar/csv|json|md|zip             todo el banco
+    /exportar/<formato>?curso=<nombre>    lo usado en un curso
+    /exportar/<formato>?tema=...&...      un filtro (mismos parámetros que /api/problemas)
+    """
+    if formato not in FORMATOS:
+        abort(404)
+
+    curso = request.args.get("curso")
+    filtros = {k: v for k, v in _filtros_de_peticion(request.args).items() if v}
+    try:
+        generador, mimetype, nombre = exportar(formato, curso=curso, filtros=filtros)
+    except KeyError:
+        return "Curso no encontrado", 404
+
+    return Response(
+        generador,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
+
+
+# Varios conjuntos de datos en el mismo proceso (ver datos.usar_conjunto):
+# /c/<nombre>/temas, /c/<nombre>/problemas, ... o, si se define
+# ICPC_DB_DOMINIO=ejemplo.org, <nombre>.ejemplo.org/temas. Lo demás usa data/.
+# Detrás de cualquiera de ellos, /h/<fecha>/... muestra (solo lectura) los
+# datos como estaban en esa fecha.
+PREFIJO_CONJUNTOS = "/c/"
+PREFIJO_FECHA = "/h/"
+DOMINIO = (os.environ.get("ICPC_DB_DOMINIO") or "").lower().strip(".")
+
+
+class _RespuestaEnConjunto:
+    """Cuerpo de la respuesta que se genera dentro del conjunto (p. ej. las exportaciones)."""
+
+    def __init__(self, conjunto, respuesta):
+        self.conjunto = conjunto
+        self.respuesta = respuesta
+
+    def __iter__(self):
+        with usar_conjunto(self.conjunto):
+            yield from self.respuesta
+
+    def close(self):
+        if hasattr(self.respuesta, "close"):
+            self.respuesta.close()
+
+
+class SelectorConjunto:
+    """
+    Middleware WSGI que elige el conjunto de datos de cada petición por
+    subdominio o por prefijo. El prefijo se pasa a SCRIPT_NAME, así que
+    url_for() sigue generando los enlaces dentro del mismo conjunto.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        nombre = None
+        host = (environ.get("HTTP_HOST") or "").split(":")[0].lower()
+        ruta = environ.get("PATH_INFO") or ""
+        if DOMINIO and host.endswith("." + DOMINIO):
+            nombre = host[:-len(DOMINIO) - 1]
+        elif ruta.startswith(PREFIJO_CONJUNTOS):
+            nombre, _, resto = ruta[len(PREFIJO_CONJUNTOS):].partition("/")
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + PREFIJO_CONJUNTOS + nombre
+            environ["PATH_INFO"] = "/" + resto
+
+        if nombre is not None and not (nombre and existe_conjunto(nombre)):
+            return NotFound("Conjunto de datos no encontrado")(environ, start_response)
+
+        fecha = None
+        ruta = environ.get("PATH_INFO") or ""
+        if ruta.startswith(PREFIJO_FECHA):
+            fecha, _, resto = ruta[len(PREFIJO_FECHA):].partition("/")
+            if environ.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+                return MethodNotAllowed(["GET", "HEAD"])(environ, start_response)
+            environ["icpc.raiz"] = environ.get("SCRIPT_NAME", "")
+            environ["SCRIPT_NAME"] = environ["icpc.raiz"] + PREFIJO_FECHA + fecha
+            environ["PATH_INFO"] = "/" + resto
+
+        with usar_conjunto(nombre or "") as conjunto:
+            if fecha is not None:
+                try:
+                    conjunto = conjunto_en_fecha(fecha)
+                except ValueError:
+                    return NotFound("Fecha no válida")(environ, start_response)
+                environ["icpc.fecha"] = conjunto.fecha
+                with usar_conjunto(conjunto):
+                    respuesta = self.wsgi_app(environ, start_response)
+            else:
+                respuesta = self.wsgi_app(environ, start_response)
+        return _RespuestaEnConjunto(conjunto, respuesta)
+
+
+app.wsgi_app = SelectorConjunto(app.wsgi_app)
+
+def crear_app():
+    """
+    La app lista para servir: arranca la revisión periódica de las rutas de
+    notas y soluciones (ver archivos.py) y, con ICPC_DB_PRECALENTAR=1, la
+    conversión de las notas. Importar app.py no arranca ningún hilo, así
+    que sitio.py, cli.py y benchmark.py no dejan hilos corriendo. Con
+    varios procesos: gunicorn -w 4 'app:crear_app()'.
+    """
+    iniciar_escaneo()
+    if PRECALENTAR:
+        threading.Thread(target=precalentar, daemon=True).start()
+    return app
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    crear_app().run(debug=True)
@@ -0,0 +1,278 @@
+"""
+Índice de archivos de notas y soluciones, y revisión de las rutas.
+
+Un hilo en segundo plano (ver iniciar()) recorre cada INTERVALO segundos el
+árbol temas/ y revisa, en un pool de hilos, los archivos de 'ruta' de los
+temas y de 'ruta_solucion' de los problemas. Las páginas consultan el
+resultado (estado_rutas()) en vez de hacer stat de cada archivo en cada
+petición.
+
+Cada ruta queda como:
+  - "ok": el archivo existe;
+  - "falta": no existe;
+  - "fuera": apunta fuera del proyecto (p. ej. "../../etc/passwd").
+
+Si los temas o problemas cambian entre dos recorridos, solo se vuelven a
+revisar las rutas de los registros que cambiaron. Además se sugiere a qué
+tema enlazar las notas de temas/<Categoria>/ que ningún tema usa.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from datos import (
+    BASE_DIR,
+    cargar_temas,
+    cargar_problemas,
+    conjunto_actual,
+    conjuntos_cargados,
+    firma_colecciones,
+    usar_conjunto,
+)
+from busqueda import normalizar
+from metricas import contar, fase
+
+CARPETA_NOTAS = BASE_DIR / "temas"
+
+# segundos entre recorridos del hilo de fondo (ICPC_DB_ESCANEO_S; 0 = sin hilo)
+INTERVALO = float(os.environ.get("ICPC_DB_ESCANEO_S") or 10)
+
+HILOS = 8
+
+logger = logging.getLogger(__name__)
+
+# coleccion -> campo con la ruta del archivo
+CAMPOS = {"temas": "ruta", "problemas": "ruta_solucion"}
+CLAVES = {"temas": "nombre", "problemas": "id"}
+
+_hilo = None
+
+
+def _nuevo():
+    """Índice vacío; hay uno por conjunto de datos."""
+    return {
+        "bloqueo": threading.Lock(),
+        "archivos": frozenset(),                    # rutas relativas bajo temas/
+        "rutas": {"temas": {}, "problemas": {}},    # clave -> ruta del registro
+        "estados": {"temas": {}, "problemas": {}},  # clave -> "ok" | "falta" | "fuera"
+        "firma": None,
+        "version": 0,
+    }
+
+
+def _del_conjunto():
+    return conjunto_actual().derivado("archivos", _nuevo)
+
+
+def _relativa(ruta):
+    """Ruta relativa al proyecto (posix), o None si se sale de él."""
+    archivo = (BASE_DIR / ruta).resolve()
+    if not archivo.is_relative_to(BASE_DIR):
+        return None
+    return archivo.relative_to(BASE_DIR).as_posix()
+
+
+def _listar_notas():
+    archivos = set()
+    for carpeta, _, nombres in os.walk(CARPETA_NOTAS):
+        for nombre in nombres:
+            relativa = os.path.relpath(os.path.join(carpeta, nombre), BASE_DIR)
+            archivos.add(relativa.replace(os.sep, "/"))
+    return frozenset(archivos)
+
+
+def _en_notas(relativa):
+    prefijo = CARPETA_NOTAS.relative_to(BASE_DIR).as_posix() + "/"
+    return relativa.startswith(prefijo)
+
+
+def _revisar(rutas, archivos):
+    """
+    ruta -> estado para cada ruta de 'rutas'. Las de temas/ se buscan en el
+    índice; las demás se revisan en el disco, en paralelo.
+    """
+    estados = {}
+    en_disco = []
+    for ruta in rutas:
+        relativa = _relativa(ruta)
+        if relativa is None:
+            estados[ruta] = "fuera"
+        elif _en_notas(relativa):
+            estados[ruta] = "ok" if relativa in archivos else "falta"
+        else:
+            en_disco.append((ruta, BASE_DIR / relativa))
+
+    if len(en_disco) > 1:
+        with ThreadPoolExecutor(max_workers=HILOS) as pool:
+            existen = list(pool.map(lambda par: par[1].is_file(), en_disco))
+    else:
+        existen = [archivo.is_file() for _, archivo in en_disco]
+    for (ruta, _), existe in zip(en_disco, existen):
+        estados[ruta] = "ok" if existe else "falta"
+    return estados
+
+
+def _rutas_actuales():
+    rutas = {}
+    for coleccion, cargar in (("temas", cargar_temas), ("problemas", cargar_problemas)):
+        campo, clave = CAMPOS[coleccion], CLAVES[coleccion]
+        rutas[coleccion] = {r[clave]: r[campo] for r in cargar() if r.get(campo)}
+    return rutas
+
+
+def _publicar(archivos, rutas, estados, firma):
+    """Reemplaza el índice; sube la versión si algo visible cambió."""
+    indice = _del_conjunto()
+    with indice["bloqueo"]:
+        cambio = archivos != indice["archivos"] or estados != indice["estados"]
+        indice.update(archivos=archivos, rutas=rutas, estados=estados, firma=firma)
+        if cambio:
+            indice["version"] += 1
+
+
+def escanear():
+    """Recorre temas/ y revisa todas las rutas."""
+    with fase("archivos"):
+        contar("icpc_escaneos_archivos_total", tipo="completo")
+        firma = firma_colecciones("temas", "problemas")
+        rutas = _rutas_actuales()
+        archivos = _listar_notas()
+        estado_por_ruta = _revisar(
+            {r for por_clave in rutas.values() for r in por_clave.values()}, archivos
+        )
+        estados = {
+            coleccion: {clave: estado_por_ruta[ruta] for clave, ruta in por_clave.items()}
+            for coleccion, por_clave in rutas.items()
+        }
+        _publicar(archivos, rutas, estados, firma)
+
+
+def _sincronizar():
+    """Si cambiaron temas o problemas, revisa solo las rutas nuevas o cambiadas."""
+    indice = _del_conjunto()
+    if indice["firma"] is None:
+        escanear()
+        return
+    firma = firma_colecciones("temas", "problemas")
+    if firma == indice["firma"]:
+        return
+
+    with fase("archivos"):
+        contar("icpc_escaneos_archivos_total", tipo="parcial")
+        rutas = _rutas_actuales()
+        with indice["bloqueo"]:
+            archivos = indice["archivos"]
+            anteriores = indice["rutas"]
+            estados_anteriores = indice["estados"]
+        cambiadas = {
+            ruta
+            for coleccion, por_clave in rutas.items()
+            for clave, ruta in por_clave.items()
+            if anteriores[coleccion].get(clave) != ruta
+        }
+        estado_por_ruta = _revisar(cambiadas, archivos)
+        estados = {
+            coleccion: {
+                clave: estado_por_ruta.get(ruta) or estados_anteriores[coleccion][clave]
+                for clave, ruta in por_clave.items()
+            }
+            for coleccion, por_clave in rutas.items()
+        }
+        _publicar(archivos, rutas, estados, firma)
+
+
+def estado_rutas(coleccion):
+    """clave -> "ok" | "falta" | "fuera" para los registros con ruta ("temas" o "problemas")."""
+    indice = _del_conjunto()
+    _sincronizar()
+    with indice["bloqueo"]:
+        return indice["estados"][coleccion]
+
+
+def version():
+    """Número que cambia cada vez que cambia algún estado o el árbol de temas/."""
+    indice = _del_conjunto()
+    _sincronizar()
+    return indice["version"]
+
+
+def _simple(texto):
+    return re.sub(r"[^a-z0-9]", "", normalizar(texto or ""))
+
+
+def reporte(sugerencias=5):
+    """
+    {"rutas": [{"coleccion", "clave", "ruta", "estado"}] con las que no
+    están "ok", "sin_enlazar": [{"archivo", "categoria", "sugerencias"}]}
+    con las notas de temas/<Categoria>/ que ningún tema usa y, para cada
+    una, los temas de esa categoría sin nota válida que podrían usarla
+    (primero los de nombre parecido al del archivo).
+    """
+    _sincronizar()
+    indice = _del_conjunto()
+    with indice["bloqueo"]:
+        archivos = indice["archivos"]
+        rutas = indice["rutas"]
+        estados = indice["estados"]
+
+    malas = [
+        {"coleccion": coleccion, "clave": clave, "ruta": rutas[coleccion][clave], "estado": estado}
+        for coleccion, por_clave in estados.items()
+        for clave, estado in sorted(por_clave.items())
+        if estado != "ok"
+    ]
+
+    enlazadas = {
+        _relativa(ruta) for ruta in rutas["temas"].values()
+    } | {
+        _relativa(ruta) for ruta in rutas["problemas"].values()
+    }
+    temas = cargar_temas()
+    sin_nota = {}
+    for t in temas:
+        if estados["temas"].get(t["nombre"]) != "ok":
+            sin_nota.setdefault(_simple(t.get("categoria")), []).append(t["nombre"])
+
+    sin_enlazar = []
+    for archivo in sorted(archivos - enlazadas):
+        partes = archivo.split("/")
+        if len(partes) < 3:
+            continue  # suelta en temas/, sin categoría
+        categoria = partes[1]
+        nombre = _simple(partes[-1].rsplit(".", 1)[0])
+        candidatos = sorted(
+            sin_nota.get(_simple(categoria), []),
+            key=lambda t: (_simple(t) != nombre, nombre not in _simple(t), t),
+        )
+        sin_enlazar.append({
+            "archivo": archivo,
+            "categoria": categoria,
+            "sugerencias": candidatos[:sugerencias],
+        })
+
+    return {"rutas": malas, "sin_enlazar": sin_enlazar}
+
+
+def _vigilar(intervalo):
+    while True:
+        time.sleep(intervalo)
+        for conjunto in conjuntos_cargados():
+            try:
+                with usar_conjunto(conjunto):
+                    escanear()
+            except Exception:
+                # p. ej. un archivo a medio escribir: se reintenta en la
+                # siguiente vuelta, sin que se muera el hilo
+                logger.exception("Falló la revisión de archivos de '%s'", conjunto.nombre)
+
+
+def iniciar(intervalo=INTERVALO):
+    """Arranca (una sola vez) el hilo que vuelve a recorrer los archivos."""
+    global _hilo
+    if _hilo is not None or intervalo <= 0:
+        return
+    _hilo = threading.Thread(target=_vigilar, args=(intervalo,), daemon=True)
+    _hilo.start()
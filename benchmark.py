@@ -0,0 +1,340 @@
+"""
+Benchmark de la app con datos sintéticos.
+
+Genera data/*.json realistas del tamaño pedido (problemas con 1-3 temas de
+una distribución sesgada, concursos, categorías y cursos con sus listas de
+uso), mide cada ruta con el cliente de pruebas de Flask, las funciones de
+índices más usadas y la carga en frío con y sin instantáneas (ver
+instantanea.py), y escribe los resultados en JSON para compararlos entre
+commits:
+
+    python benchmark.py                              # 1k y 10k problemas
+    python benchmark.py --problemas 1000 10000 100000 -o bench.json
+    python benchmark.py -o nuevo.json --comparar bench.json
+
+Cada tamaño corre en un proceso aparte (ICPC_DB_DATA apunta a una carpeta
+temporal), así que las cachés en memoria de un tamaño no afectan al otro
+y los datos reales de data/ no se tocan.
+"""
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+JUECES = ("CF", "CSES", "ATCODER", "SPOJ", "UVA", "CFGYM", "OMEGAUP")
+CATEGORIAS_TEMAS = (
+    "Basic", "Grafos", "Math", "Estructuras de datos", "Strings", "Geometry",
+    "Tecnicas", "Ad-Hoc", "DP", "Flujos", "Teoria de juegos", "Avanzado",
+)
+CATEGORIAS_CONCURSOS = (
+    "ICPC Latam Regional", "ICPC World Finals", "OMI", "IOI", "Codeforces Gym",
+    "AtCoder", "Selectivos", "Entrenamientos",
+)
+
+
+def generar_datos(carpeta, n_problemas, n_temas=500, n_concursos=200, n_cursos=100, semilla=1):
+    """Escribe temas, concursos, categorías, problemas y cursos en 'carpeta'."""
+    rnd = random.Random(semilla)
+    carpeta = Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+
+    temas = [
+        {
+            "nombre": f"Tema {i:03d}",
+            "categoria": CATEGORIAS_TEMAS[i % len(CATEGORIAS_TEMAS)],
+            "orden": i + 1,
+            "ruta": "",
+        }
+        for i in range(n_temas)
+    ]
+    categorias = [{"nombre": c, "orden": i + 1} for i, c in enumerate(CATEGORIAS_CONCURSOS)]
+    concursos = [
+        {
+            "nombre": f"Concurso {i:03d}",
+            "anio": 2000 + rnd.randrange(26),
+            "categoria": rnd.choice(CATEGORIAS_CONCURSOS),
+        }
+        for i in range(n_concursos)
+    ]
+
+    # temas con distribución sesgada: unos pocos temas tienen muchos problemas
+    pesos_temas = [1 / (i + 1) ** 0.8 for i in range(n_temas)]
+    nombres_temas = [t["nombre"] for t in temas]
+    problemas = []
+    for i in range(n_problemas):
+        juez = JUECES[i % len(JUECES)]
+        elegidos = rnd.choices(nombres_temas, pesos_temas, k=rnd.choice((1, 1, 2, 2, 3)))
+        problemas.append({
+            "id": f"{juez}-{100000 + i}{'ABCDEF'[i % 6]}",
+            "nombre": f"Problema {i}",
+            "url": f"https://example.com/{juez.lower()}/{i}",
+            "concurso": rnd.choice(concursos)["nombre"] if rnd.random() < 0.8 else "",
+            "temas": list(dict.fromkeys(elegidos)),
+            "ruta_solucion": "",
+            "etiqueta": "Introductorio" if rnd.random() < 0.1 else "",
+        })
+
+    ids = [p["id"] for p in problemas]
+    cursos = []
+    for i in range(n_cursos):
+        usados = rnd.sample(ids, min(len(ids), rnd.randint(50, 500)))
+        cursos.append({
+            "nombre": f"Curso {i:03d}",
+            "descripcion": f"Ciclo de entrenamiento {i}",
+            "usados_problemas": usados,
+            "usados_temas": rnd.sample(nombres_temas, rnd.randint(0, min(60, n_temas))),
+            "usados_concursos": [c["nombre"] for c in rnd.sample(concursos, min(5, len(concursos)))],
+        })
+
+    for nombre, registros in (
+        ("temas", temas),
+        ("concursos", concursos),
+        ("concursos_categorias", categorias),
+        ("problemas", problemas),
+        ("cursos", cursos),
+    ):
+        with (carpeta / f"{nombre}.json").open("w", encoding="utf-8") as f:
+            json.dump(registros, f, indent=4, ensure_ascii=False)
+
+
+def medir(funcion, presupuesto=1.0, maximo=200, minimo=1):
+    """
+    Llama a 'funcion' al menos 'minimo' veces y hasta agotar 'presupuesto'
+    segundos (o 'maximo' veces). Regresa estadísticas en milisegundos.
+    """
+    tiempos = []
+    inicio = time.perf_counter()
+    while len(tiempos) < minimo or (time.perf_counter() - inicio < presupuesto and len(tiempos) < maximo):
+        t = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t) * 1000)
+    ordenados = sorted(tiempos)
+    return {
+        "n": len(tiempos),
+        "primera_ms": round(tiempos[0], 3),
+        "media_ms": round(statistics.fmean(tiempos), 3),
+        "p50_ms": round(ordenados[len(ordenados) // 2], 3),
+        "p95_ms": round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))], 3),
+        "por_segundo": round(len(tiempos) / (sum(tiempos) / 1000), 1),
+    }
+
+
+def _correr(presupuesto):
+    """Mide rutas y funciones con los datos de ICPC_DB_DATA (proceso hijo)."""
+    # se importan aquí para que DATA_DIR ya apunte a los datos sintéticos
+    import datos
+    import diario
+    import indices
+    from app import app
+
+    cliente = app.test_client()
+    problemas = datos.cargar_problemas()
+    temas = datos.cargar_temas()
+    curso = datos.cargar_cursos()[0]["nombre"]
+    otro_curso = datos.cargar_cursos()[1]["nombre"]
+    grupo = indices.cargar_grupos_problemas()[0]
+    problema = grupo["problemas"][len(grupo["problemas"]) // 2]
+
+    def get(url, **kwargs):
+        def llamada():
+            r = cliente.get(url, **kwargs)
+            assert r.status_code == 200, (url, r.status_code)
+            r.close()
+        return llamada
+
+    estado = {"i": 0}
+
+    def mover():
+        estado["i"] += 1
+        direccion = "up" if estado["i"] % 2 else "down"
+        r = cliente.post(f"/problemas/mover/{problema['id']}/{direccion}")
+        assert r.status_code == 302
+
+    def editar():
+        estado["i"] += 1
+        p = datos.obtener_problema(problema["id"])
+        r = cliente.post(f"/problemas/editar/{p['id']}", data={
+            "nombre": f"Problema editado {estado['i']}",
+            "id": p["id"],
+            "url": p["url"],
+            "concurso": p["concurso"],
+            "temas": p["temas"],
+            "ruta_solucion": "",
+            "etiqueta": p["etiqueta"],
+        })
+        assert r.status_code == 302
+
+    def marcar():
+        estado["i"] += 1
+        r = cliente.post(f"/api/cursos/{curso}/usos", json={
+            "tipo": "problema", "clave": problema["id"], "usado": bool(estado["i"] % 2),
+        })
+        assert r.status_code == 200
+
+    def editar_y_listar():
+        editar()
+        get("/problemas")()
+
+    rutas = {
+        "GET /": get("/"),
+        "GET /temas": get("/temas"),
+        "GET /concursos": get("/concursos"),
+        "GET /problemas": get("/problemas"),
+        "GET /cursos": get("/cursos"),
+        "GET /cursos/gestionar/<curso>": get(f"/cursos/gestionar/{curso}"),
+        "GET /cursos/tablero/<curso>": get(f"/cursos/tablero/{curso}"),
+        "GET /cursos/comparar": get("/cursos/comparar", query_string={"a": curso, "b": otro_curso}),
+        "GET /integridad": get("/integridad"),
+        "GET /buscar?q=": get("/buscar", query_string={"q": "problema 12"}),
+        "GET /api/buscar": get("/api/buscar", query_string={"q": "tema"}),
+        "GET /api/problemas?tema=": get("/api/problemas", query_string={"tema": temas[0]["nombre"]}),
+        "GET /api/usos/al_menos": get("/api/usos/al_menos", query_string={"k": 3}),
+        "GET /api/usos/solapamiento": get("/api/usos/solapamiento"),
+        "GET /exportar/csv": get("/exportar/csv"),
+        "POST /problemas/mover": mover,
+        "POST /problemas/editar": editar,
+        "POST /api/cursos/<curso>/usos": marcar,
+        "POST editar + GET /problemas": editar_y_listar,
+    }
+
+    def carga_en_frio(instantaneas):
+        # como al arrancar un worker: conjunto nuevo, sin caché ni índices
+        def llamada():
+            datos.INSTANTANEAS = instantaneas
+            conjunto = datos.Conjunto("", datos.DATA_DIR)
+            diario.olvidar(conjunto.archivos.values())
+            with datos.usar_conjunto(conjunto):
+                for cargar in (
+                    datos.cargar_temas, datos.cargar_concursos, datos.cargar_categorias_concursos,
+                    datos.cargar_problemas, datos.cargar_cursos, indices.cargar_grupos_problemas,
+                ):
+                    cargar()
+        return llamada
+
+    orden = indices.indice_orden_temas(temas)
+    funciones = {
+        "agrupar_problemas_por_tema_principal": lambda: indices.agrupar_problemas_por_tema_principal(problemas, temas),
+        "calcular_tema_principal (todos)": lambda: [indices.calcular_tema_principal(p, orden) for p in problemas],
+        "cargar_categorias_concursos": datos.cargar_categorias_concursos,
+        "cargar_problemas (en caché)": datos.cargar_problemas,
+        "cargar_grupos_problemas (en caché)": indices.cargar_grupos_problemas,
+        "filtrar_problemas": lambda: indices.filtrar_problemas(temas=[temas[0]["nombre"]], jueces=["CF"]),
+        "json.loads problemas.json": lambda: json.loads(datos.PROBLEMAS_FILE.read_bytes()),
+    }
+    # lo que hace un worker al arrancar. Las instantáneas se escriben al
+    # guardar o con cli.py --instantaneas, nunca al leer: se generan antes
+    # de medir, como en un despliegue
+    en_frio = {
+        "carga en frío (JSON)": carga_en_frio(False),
+        "carga en frío (instantánea)": carga_en_frio(True),
+    }
+
+    resultados = {
+        "rutas": {nombre: medir(f, presupuesto) for nombre, f in rutas.items()},
+        "funciones": {nombre: medir(f, presupuesto) for nombre, f in funciones.items()},
+    }
+    datos.generar_instantaneas()
+    indices.guardar_instantanea_agrupacion()
+    resultados["funciones"].update(
+        {nombre: medir(f, presupuesto, minimo=3) for nombre, f in en_frio.items()}
+    )
+    return resultados
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def correr(tamanos, presupuesto, almacen="json"):
+    resultados = []
+    for n in tamanos:
+        with tempfile.TemporaryDirectory(prefix="icpc-bench-") as carpeta:
+            t = time.perf_counter()
+            generar_datos(carpeta, n)
+            print(f"[{n} problemas] datos generados en {time.perf_counter() - t:.1f}s", file=sys.stderr)
+
+            entorno = dict(os.environ, ICPC_DB_DATA=carpeta, ICPC_DB_ALMACEN=almacen)
+            if almacen == "sqlite":
+                subprocess.run(
+                    [sys.executable, str(BASE_DIR / "almacen_sqlite.py")],
+                    env=entorno, check=True, capture_output=True,
+                )
+            salida = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--hijo", "--presupuesto", str(presupuesto)],
+                env=entorno, check=True, capture_output=True, text=True,
+            ).stdout
+            resultados.append({"problemas": n, **json.loads(salida)})
+    return {
+        "commit": _commit(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "almacen": almacen,
+        "resultados": resultados,
+    }
+
+
+def imprimir(informe, anterior=None):
+    """Tabla legible; con 'anterior', la razón contra esa corrida (p50)."""
+    previos = {}
+    for r in (anterior or {}).get("resultados", []):
+        for tipo in ("rutas", "funciones"):
+            for nombre, m in r[tipo].items():
+                previos[(r["problemas"], nombre)] = m["p50_ms"]
+
+    for r in informe["resultados"]:
+        print(f"\n== {r['problemas']} problemas ==")
+        for tipo in ("rutas", "funciones"):
+            for nombre, m in r[tipo].items():
+                linea = (
+                    f"  {nombre:<45} p50 {m['p50_ms']:>10.2f} ms   "
+                    f"p95 {m['p95_ms']:>10.2f} ms   primera {m['primera_ms']:>10.2f} ms"
+                )
+                previo = previos.get((r["problemas"], nombre))
+                if previo:
+                    linea += f"   x{m['p50_ms'] / previo:.2f}"
+                print(linea)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark con datos sintéticos.")
+    parser.add_argument("--problemas", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--presupuesto", type=float, default=1.0,
+                        help="segundos por medición (al menos una llamada)")
+    parser.add_argument("--almacen", choices=("json", "sqlite"), default="json")
+    parser.add_argument("-o", "--salida", help="archivo JSON con los resultados")
+    parser.add_argument("--comparar", help="resultados anteriores para comparar")
+    parser.add_argument("--generar", metavar="CARPETA",
+                        help="solo generar los datos (con el primer --problemas) y salir")
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        json.dump(_correr(args.presupuesto), sys.stdout)
+    elif args.generar:
+        generar_datos(args.generar, args.problemas[0])
+    else:
+        informe = correr(args.problemas, args.presupuesto, args.almacen)
+        anterior = None
+        if args.comparar:
+            with open(args.comparar, encoding="utf-8") as f:
+                anterior = json.load(f)
+        imprimir(informe, anterior)
+        if args.salida:
+            with open(args.salida, "w", encoding="utf-8") as f:
+                json.dump(informe, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,232 @@
+"""
+Búsqueda de texto sobre problemas, temas (incluyendo sus notas .md) y
+concursos, con un índice invertido en memoria.
+
+Las palabras se normalizan quitando acentos y mayúsculas ("Árbol" y "arbol"
+son la misma palabra) y cada palabra de la consulta puede ser el inicio de
+una palabra indexada ("seg" encuentra "Segment Tree").
+
+El índice se actualiza por partes: en cada consulta se revisa la firma de
+las colecciones y solo se vuelven a indexar los registros que cambiaron.
+Las notas de los temas se revisan (stat) a lo más cada INTERVALO_NOTAS
+segundos y solo se vuelven a leer si cambió el archivo.
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from datos import (
+    BASE_DIR,
+    cargar_problemas,
+    cargar_temas,
+    cargar_concursos,
+    conjunto_actual,
+    firma_colecciones,
+)
+from metricas import fase, recalcular
+
+INTERVALO_NOTAS = 2.0
+
+# orden en que se muestran los tipos con el mismo puntaje
+TIPOS = ("tema", "problema", "concurso")
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def palabras(texto):
+    return re.findall(r"[a-z0-9]+", normalizar(texto))
+
+
+class IndiceInvertido:
+    """
+    palabra -> conjunto de claves de documento, más la lista ordenada de
+    palabras para resolver prefijos con bisect.
+    """
+
+    def __init__(self):
+        self.documentos = {}  # clave -> (palabras del título, todas las palabras)
+        self.postings = {}
+        self.vocabulario = []
+
+    def quitar(self, clave):
+        _, todas = self.documentos.pop(clave, (set(), set()))
+        for palabra in todas:
+            claves = self.postings[palabra]
+            claves.discard(clave)
+            if not claves:
+                del self.postings[palabra]
+                del self.vocabulario[bisect_left(self.vocabulario, palabra)]
+
+    def poner(self, clave, titulo, texto):
+        self.quitar(clave)
+        del_titulo = set(palabras(titulo))
+        todas = del_titulo | set(palabras(texto))
+        self.documentos[clave] = (del_titulo, todas)
+        for palabra in todas:
+            if palabra not in self.postings:
+                self.postings[palabra] = set()
+                insort(self.vocabulario, palabra)
+            self.postings[palabra].add(clave)
+
+    def _con_prefijo(self, prefijo):
+        i = bisect_left(self.vocabulario, prefijo)
+        while i < len(self.vocabulario) and self.vocabulario[i].startswith(prefijo):
+            yield self.vocabulario[i]
+            i += 1
+
+    def buscar(self, consulta):
+        """
+        Claves de los documentos que contienen todas las palabras de la
+        consulta (como palabra completa o como prefijo), con su puntaje.
+        """
+        terminos = palabras(consulta)
+        if not terminos:
+            return []
+
+        resultado = None
+        for termino in terminos:
+            claves = set()
+            for palabra in self._con_prefijo(termino):
+                claves |= self.postings[palabra]
+            resultado = claves if resultado is None else resultado & claves
+            if not resultado:
+                return []
+
+        puntajes = []
+        for clave in resultado:
+            del_titulo, todas = self.documentos[clave]
+            puntaje = 0
+            for termino in terminos:
+                # palabra exacta > prefijo; en el título vale el doble
+                valor = 2 if termino in todas else 1
+                if any(p.startswith(termino) for p in del_titulo):
+                    valor *= 2
+                puntaje += valor
+            puntajes.append((clave, puntaje))
+        return puntajes
+
+
+def _nuevo():
+    """Índice vacío; hay uno por conjunto de datos."""
+    return {
+        "bloqueo": threading.Lock(),
+        "indice": IndiceInvertido(),
+        "resumenes": {},        # clave -> datos para mostrar el resultado
+        "firma": None,
+        "registros": {},        # clave -> registro indexado (para detectar cambios)
+        "notas": {},            # clave de tema -> (ruta, firma del archivo)
+        "revision_notas": 0.0,
+    }
+
+
+def _ruta_nota(ruta):
+    """Ruta absoluta de una nota, solo si está dentro del proyecto."""
+    if not ruta:
+        return None
+    archivo = (BASE_DIR / ruta).resolve()
+    if not archivo.is_relative_to(BASE_DIR) or not archivo.is_file():
+        return None
+    return archivo
+
+
+def _firma_nota(archivo):
+    if archivo is None:
+        return None
+    try:
+        st = archivo.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _indexar(actual, clave, registro):
+    tipo, _ = clave
+    if tipo == "problema":
+        titulo = f'{registro.get("nombre") or ""} {registro["id"]}'
+        texto = " ".join([registro.get("concurso") or ""] + (registro.get("temas") or []))
+        detalle = registro.get("concurso") or ""
+    elif tipo == "tema":
+        titulo = registro["nombre"]
+        archivo = _ruta_nota(registro.get("ruta"))
+        contenido = ""
+        if archivo is not None:
+            try:
+                contenido = archivo.read_text(encoding="utf-8", errors="replace")
+            except OSError:
+                archivo = None
+        actual["notas"][clave] = (archivo, _firma_nota(archivo))
+        texto = f'{registro.get("categoria") or ""} {contenido}'
+        detalle = registro.get("categoria") or ""
+    else:
+        titulo = registro["nombre"]
+        texto = registro.get("categoria") or ""
+        detalle = " · ".join(
+            str(v) for v in (registro.get("anio"), registro.get("categoria")) if v
+        )
+
+    actual["indice"].poner(clave, titulo, texto)
+    actual["resumenes"][clave] = {
+        "tipo": tipo,
+        "clave": clave[1],
+        "titulo": registro.get("nombre") or clave[1],
+        "detalle": detalle,
+        "url": registro.get("url") or "",
+    }
+
+
+def _quitar(actual, clave):
+    actual["indice"].quitar(clave)
+    actual["resumenes"].pop(clave, None)
+    actual["notas"].pop(clave, None)
+
+
+@fase("indices")
+def _sincronizar(actual):
+    firma = firma_colecciones("temas", "problemas", "concursos")
+    if recalcular("busqueda", firma, actual["firma"]):
+        actuales = {}
+        for p in cargar_problemas():
+            actuales[("problema", p["id"])] = p
+        for t in cargar_temas():
+            actuales[("tema", t["nombre"])] = t
+        for c in cargar_concursos():
+            actuales[("concurso", c["nombre"])] = c
+
+        anteriores = actual["registros"]
+        for clave in anteriores.keys() - actuales.keys():
+            _quitar(actual, clave)
+        for clave, registro in actuales.items():
+            if anteriores.get(clave) != registro:
+                _indexar(actual, clave, registro)
+
+        actual["firma"] = firma
+        actual["registros"] = actuales
+
+    ahora = time.monotonic()
+    if ahora - actual["revision_notas"] >= INTERVALO_NOTAS:
+        actual["revision_notas"] = ahora
+        for clave, (archivo, firma_nota) in list(actual["notas"].items()):
+            registro = actual["registros"][clave]
+            if _ruta_nota(registro.get("ruta")) != archivo or _firma_nota(archivo) != firma_nota:
+                _indexar(actual, clave, registro)
+
+
+def buscar(consulta, limite=50):
+    """
+    Regresa hasta 'limite' resultados, cada uno un dict con 'tipo'
+    ("problema", "tema" o "concurso"), 'clave', 'titulo', 'detalle' y 'url'.
+    """
+    actual = conjunto_actual().derivado("busqueda", _nuevo)
+    with actual["bloqueo"]:
+        _sincronizar(actual)
+        resumenes = actual["resumenes"]
+        puntajes = actual["indice"].buscar(consulta)
+        puntajes.sort(key=lambda cp: (
+            -cp[1], TIPOS.index(cp[0][0]), normalizar(resumenes[cp[0]]["titulo"])
+        ))
+        return [dict(resumenes[clave]) for clave, _ in puntajes[:limite]]
@@ -0,0 +1,310 @@
+"""
+Operaciones en lote desde la terminal, sin levantar la app web.
+
+Lee operaciones, una por línea en JSON, de un archivo o de la entrada
+estándar, y las aplica todas en un solo ciclo cargar -> guardar (ver
+datos.lote()): cada colección se lee una vez y se escribe una vez al final.
+Si alguna operación falla no se guarda nada. Usa la misma capa de datos que
+app.py pero no importa Flask ni las plantillas, así que arranca rápido
+(sirve para scripts y cron).
+
+    python cli.py operaciones.jsonl [--conjunto NOMBRE] [--simulacro]
+    echo '{"op": "validar"}' | python cli.py
+    python cli.py --instantaneas [--conjunto NOMBRE]
+
+--instantaneas escribe las instantáneas de arranque (ver instantanea.py)
+con lo que hay en disco, p. ej. después de copiar o editar a mano los JSON.
+
+Operaciones (las líneas vacías o que empiezan con # se ignoran):
+
+  {"op": "agregar_problema", "id": ..., "nombre": ..., "url": ..., "concurso": ...,
+   "temas": [...], "ruta_solucion": ..., "etiqueta": ...}
+  {"op": "editar_problema", "id": ..., <campos a cambiar>, "nuevo_id": ...}
+  {"op": "borrar_problema", "id": ..., "cascada": true}
+  {"op": "ordenar_temas", "nombres": [...]}
+  {"op": "marcar_uso", "curso": ..., "tipo": "problema"|"tema"|"concurso",
+   "clave": ..., "usado": true}
+  {"op": "importar", "archivo": "gym.csv", "crear_faltantes": true}
+  {"op": "reporte", "nombre": "integridad"|"archivos"|"nunca_usados"|"al_menos"|
+   "solapamiento"|"diferencia"|"tablero", "k": 2, "curso": ..., "curso_b": ...}
+  {"op": "validar"}
+
+Los reportes y validar ven el estado del lote hasta esa línea. Por cada
+operación se escribe en la salida una línea JSON con su resultado.
+"""
+import json
+import sys
+
+from datos import (
+    cargar_temas,
+    guardar_temas,
+    cargar_problemas,
+    guardar_problemas,
+    generar_instantaneas,
+    lote,
+    usar_conjunto,
+)
+# también registra el guardado de la instantánea de la agrupación
+from indices import guardar_instantanea_agrupacion
+
+CAMPOS_PROBLEMA = ("nombre", "url", "concurso", "temas", "ruta_solucion", "etiqueta")
+
+
+class ErrorOperacion(Exception):
+    pass
+
+
+def _texto(op, campo):
+    return str(op.get(campo) or "").strip()
+
+
+def _temas(op):
+    temas = op.get("temas") or []
+    if isinstance(temas, str):
+        temas = temas.split(";")
+    return [t.strip() for t in temas if t.strip()]
+
+
+def agregar_problema(op):
+    problema_id = _texto(op, "id")
+    if not problema_id:
+        raise ErrorOperacion("El problema necesita un id")
+    problemas = cargar_problemas()
+    if any(p["id"] == problema_id for p in problemas):
+        raise ErrorOperacion(f"Ya existe un problema con id '{problema_id}'")
+    problemas.append({
+        "id": problema_id,
+        "nombre": _texto(op, "nombre"),
+        "url": _texto(op, "url"),
+        "concurso": _texto(op, "concurso"),
+        "temas": _temas(op),
+        "ruta_solucion": _texto(op, "ruta_solucion"),
+        "etiqueta": _texto(op, "etiqueta"),
+    })
+    guardar_problemas(problemas)
+    return {"id": problema_id}
+
+
+def editar_problema(op):
+    from referencias import renombrar
+
+    problema_id = _texto(op, "id")
+    problemas = cargar_problemas()
+    problema = next((p for p in problemas if p["id"] == problema_id), None)
+    if problema is None:
+        raise ErrorOperacion(f"No existe el problema '{problema_id}'")
+
+    nuevo_id = _texto(op, "nuevo_id") or problema_id
+    if nuevo_id != problema_id and any(p["id"] == nuevo_id for p in problemas):
+        raise ErrorOperacion(f"Ya existe otro problema con id '{nuevo_id}'")
+
+    for campo in CAMPOS_PROBLEMA:
+        if campo in op:
+            problema[campo] = _temas(op) if campo == "temas" else _texto(op, campo)
+    problema["id"] = nuevo_id
+    guardar_problemas(problemas)
+    tocados = renombrar("problema", problema_id, nuevo_id)  # usos en los cursos
+    return {"id": nuevo_id, "referencias": tocados}
+
+
+def borrar_problema(op):
+    from referencias import referencias, quitar_referencias
+
+    problema_id = _texto(op, "id")
+    problemas = cargar_problemas()
+    nuevos = [p for p in problemas if p["id"] != problema_id]
+    if len(nuevos) == len(problemas):
+        raise ErrorOperacion(f"No existe el problema '{problema_id}'")
+
+    refs = referencias("problema", problema_id)
+    tocados = 0
+    if refs["cursos"]:
+        if not op.get("cascada"):
+            raise ErrorOperacion(
+                f"Lo usan los cursos {', '.join(refs['cursos'])}; usa \"cascada\": true"
+            )
+        tocados = quitar_referencias("problema", problema_id)
+    guardar_problemas(nuevos)
+    return {"id": problema_id, "referencias": tocados}
+
+
+def ordenar_temas_op(op):
+    from indices import ordenar_temas
+
+    nombres = op.get("nombres")
+    if not isinstance(nombres, list):
+        raise ErrorOperacion('"nombres" debe ser una lista de temas')
+    temas = cargar_temas()
+    faltan = [n for n in nombres if n not in {t["nombre"] for t in temas}]
+    if faltan:
+        raise ErrorOperacion(f"No existen los temas: {', '.join(faltan)}")
+    guardar_temas(ordenar_temas(temas, nombres))
+    return {"temas": len(temas)}
+
+
+def marcar_uso_op(op):
+    from usos import marcar_uso
+
+    try:
+        curso = marcar_uso(
+            _texto(op, "curso"), _texto(op, "tipo"), _texto(op, "clave"), bool(op.get("usado", True))
+        )
+    except ValueError as e:
+        raise ErrorOperacion(str(e))
+    if curso is None:
+        raise ErrorOperacion(f"No existe el curso '{_texto(op, 'curso')}'")
+    return {"curso": curso["nombre"]}
+
+
+def importar_op(op):
+    from importar import importar_binario
+
+    archivo = _texto(op, "archivo")
+    try:
+        with open(archivo, "rb") as f:
+            reporte = importar_binario(f, archivo, crear_faltantes=op.get("crear_faltantes", True))
+    except OSError as e:
+        raise ErrorOperacion(f"No se pudo leer '{archivo}': {e.strerror}")
+    if reporte["errores"]:
+        raise ErrorOperacion("; ".join(f"línea {n}: {m}" for n, m in reporte["errores"]))
+    return {k: reporte[k] for k in ("problemas", "concursos", "temas")}
+
+
+def reporte(op):
+    nombre = _texto(op, "nombre")
+    if nombre == "integridad":
+        from referencias import integridad
+        return integridad()
+    if nombre == "archivos":
+        from archivos import reporte as reporte_archivos
+        return reporte_archivos()
+    if nombre == "nunca_usados":
+        from usos import nunca_usados
+        return nunca_usados()
+    if nombre == "al_menos":
+        from usos import usados_en_al_menos
+        return usados_en_al_menos(int(op.get("k") or 2))
+    if nombre == "solapamiento":
+        from usos import solapamiento
+        return solapamiento()
+    if nombre == "diferencia":
+        from usos import diferencia
+        try:
+            return diferencia(_texto(op, "curso"), _texto(op, "curso_b"))
+        except KeyError as e:
+            raise ErrorOperacion(f"No existe el curso {e}")
+    if nombre == "tablero":
+        from usos import tablero_curso
+        tablero = tablero_curso(_texto(op, "curso"))
+        if tablero is None:
+            raise ErrorOperacion(f"No existe el curso '{_texto(op, 'curso')}'")
+        return tablero
+    raise ErrorOperacion(f"Reporte desconocido: '{nombre}'")
+
+
+def validar(op):
+    from referencias import integridad
+
+    rotas = integridad()
+    if rotas:
+        raise ErrorOperacion(f"{len(rotas)} referencias rotas: " + "; ".join(
+            f"{r['origen']} {r['clave']}: {r['campo']} = {r['valor']}" for r in rotas[:20]
+        ))
+    return {"rotas": 0}
+
+
+OPERACIONES = {
+    "agregar_problema": agregar_problema,
+    "editar_problema": editar_problema,
+    "borrar_problema": borrar_problema,
+    "ordenar_temas": ordenar_temas_op,
+    "marcar_uso": marcar_uso_op,
+    "importar": importar_op,
+    "reporte": reporte,
+    "validar": validar,
+}
+
+
+def leer_operaciones(lineas):
+    """(número de línea, operación) por cada línea con contenido."""
+    for num, linea in enumerate(lineas, start=1):
+        linea = linea.strip()
+        if not linea or linea.startswith("#"):
+            continue
+        try:
+            op = json.loads(linea)
+        except ValueError as e:
+            yield num, {"_error": f"JSON inválido: {e}"}
+            continue
+        yield num, op if isinstance(op, dict) else {"_error": "Cada línea debe ser un objeto JSON"}
+
+
+def ejecutar(operaciones, simulacro=False, salida=None):
+    """
+    Aplica las operaciones ([(línea, op)]) en un solo lote. Escribe en
+    'salida' una línea JSON por operación. Regresa la lista de errores
+    [(línea, mensaje)]; si hay alguno, no se guarda nada.
+    """
+    errores = []
+    try:
+        with lote(simulacro=simulacro):
+            for num, op in operaciones:
+                resultado = {"linea": num, "op": op.get("op")}
+                funcion = OPERACIONES.get(op.get("op"))
+                try:
+                    if "_error" in op:
+                        raise ErrorOperacion(op["_error"])
+                    if funcion is None:
+                        raise ErrorOperacion(f"Operación desconocida: '{op.get('op')}'")
+                    resultado["resultado"] = funcion(op)
+                    resultado["ok"] = True
+                except ErrorOperacion as e:
+                    resultado.update(ok=False, error=str(e))
+                    errores.append((num, str(e)))
+                if salida is not None:
+                    salida.write(json.dumps(resultado, ensure_ascii=False, default=sorted) + "\n")
+            if errores:
+                raise ErrorOperacion("lote con errores")
+    except ErrorOperacion:
+        pass
+    return errores
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aplica operaciones en lote sobre la base de datos.")
+    parser.add_argument("archivo", nargs="?", default="-",
+                        help="archivo JSONL con una operación por línea (por defecto, la entrada estándar)")
+    parser.add_argument("--conjunto", default="", help="conjunto de datos de conjuntos/ (por defecto, data/)")
+    parser.add_argument("--simulacro", action="store_true", help="aplicar y reportar, pero no guardar")
+    parser.add_argument("--instantaneas", action="store_true",
+                        help="solo escribir las instantáneas de arranque con lo que hay en disco")
+    args = parser.parse_args()
+
+    if args.instantaneas:
+        try:
+            with usar_conjunto(args.conjunto):
+                n = generar_instantaneas()
+                guardar_instantanea_agrupacion()
+        except KeyError:
+            sys.exit(f"No existe el conjunto '{args.conjunto}'")
+        print(f"{n} instantáneas escritas." if n else "Las instantáneas están apagadas.", file=sys.stderr)
+        sys.exit(0)
+
+    entrada = sys.stdin if args.archivo == "-" else open(args.archivo, encoding="utf-8")
+    try:
+        with usar_conjunto(args.conjunto):
+            errores = ejecutar(leer_operaciones(entrada), simulacro=args.simulacro, salida=sys.stdout)
+    except KeyError:
+        sys.exit(f"No existe el conjunto '{args.conjunto}'")
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+
+    for num, mensaje in errores:
+        print(f"línea {num}: {mensaje}", file=sys.stderr)
+    if errores:
+        print("No se guardó nada.", file=sys.stderr)
+        sys.exit(1)
+    print("Simulacro: no se guardó nada." if args.simulacro else "Guardado.", file=sys.stderr)
@@ -0,0 +1,778 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializa dentro del mismo proceso
+    fcntl = None
+
+import almacen_sqlite
+import diario
+import historial
+import instantanea
+from metricas import contar, fase
+
+BASE_DIR = Path(__file__).resolve().parent
+# Carpeta de datos; con ICPC_DB_DATA se puede usar otra (p. ej. los datos
+# sintéticos de benchmark.py).
+DATA_DIR = Path(os.environ.get("ICPC_DB_DATA") or BASE_DIR / "data").resolve()
+TEMAS_FILE = DATA_DIR / "temas.json"
+CONCURSOS_FILE = DATA_DIR / "concursos.json"
+CONCURSOS_CATEGORIAS_FILE = DATA_DIR / "concursos_categorias.json"
+PROBLEMAS_FILE = DATA_DIR / "problemas.json"
+CURSOS_FILE = DATA_DIR / "cursos.json"
+SQLITE_FILE = DATA_DIR / "icpc.sqlite3"
+LOCK_FILE = DATA_DIR / ".lock"
+
+# Motor de almacenamiento: "json" (por defecto, los archivos de data/) o
+# "sqlite" (ver almacen_sqlite.py). Se elige con la variable de entorno
+# ICPC_DB_ALMACEN.
+ALMACEN = os.environ.get("ICPC_DB_ALMACEN", "json")
+
+ARCHIVOS = {
+    "temas": TEMAS_FILE,
+    "concursos": CONCURSOS_FILE,
+    "concursos_categorias": CONCURSOS_CATEGORIAS_FILE,
+    "problemas": PROBLEMAS_FILE,
+    "cursos": CURSOS_FILE,
+}
+
+# Historial de cambios en <carpeta>/historial/ (ver historial.py), para
+# deshacer y para ver los datos en una fecha. ICPC_DB_HISTORIAL=0 lo apaga.
+HISTORIAL = os.environ.get("ICPC_DB_HISTORIAL") != "0"
+
+# Instantáneas binarias de las colecciones JSON en <carpeta>/instantanea/
+# (ver instantanea.py), para no parsear ni ordenar los JSON al arrancar.
+# ICPC_DB_INSTANTANEA=0 las apaga.
+INSTANTANEAS = os.environ.get("ICPC_DB_INSTANTANEA") != "0"
+
+# Varios conjuntos de datos (p. ej. uno por entrenador) en el mismo
+# proceso: cada subcarpeta de CONJUNTOS_DIR es una carpeta de datos como
+# data/. Se cargan al primer uso y los que llevan más tiempo sin usarse se
+# descargan cuando el total pasa de ICPC_DB_MEMORIA_MB.
+CONJUNTOS_DIR = Path(os.environ.get("ICPC_DB_CONJUNTOS") or BASE_DIR / "conjuntos").resolve()
+MEMORIA_CONJUNTOS = float(os.environ.get("ICPC_DB_MEMORIA_MB") or 1024) * 1024 * 1024
+
+# memoria aproximada por cada byte de JSON ya cargado (dicts de Python,
+# copias en caché e índices derivados)
+FACTOR_MEMORIA = 8
+
+# versiones de fechas pasadas que se guardan por conjunto
+MAX_FECHAS = 8
+
+NOMBRE_CONJUNTO = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]*$")
+
+
+class Conjunto:
+    """
+    Un conjunto de datos y todo lo que el proceso guarda de él.
+
+    cache: colecciones ya parseadas y ordenadas,
+      coleccion -> {"firma": ..., "registros": [...], "por_clave": {...} o None}
+    Con JSON la firma sale del stat del archivo y de su diario (ver
+    diario.py); con SQLite es el contador de versión de la colección. Si
+    alguien edita el JSON a mano (o escribe otro proceso) la firma cambia y
+    se vuelve a leer.
+
+    escrituras: número de escrituras hechas por este proceso a cada
+    colección. Dos escrituras seguidas pueden dejar el mismo mtime (la
+    resolución del reloj del sistema de archivos es gruesa) y el mismo
+    tamaño, p. ej. al intercambiar dos problemas.
+
+    bloqueo: candado de escritura. El RLock serializa los hilos de este
+    proceso y el flock sobre <carpeta>/.lock a los demás procesos (p. ej.
+    varios workers de gunicorn). Solo la transacción más externa toma el
+    flock.
+
+    derivados: el estado de los índices de los demás módulos (ver derivado()).
+
+    fecha: None para los datos vigentes; si no, el conjunto es la versión
+    de solo lectura de esa fecha, reconstruida del historial (ver
+    conjunto_en_fecha()).
+    """
+
+    def __init__(self, nombre, carpeta, fecha=None):
+        self.nombre = nombre
+        self.fecha = fecha
+        self.carpeta = Path(carpeta).resolve()
+        self.historial = historial.carpeta_de(self.carpeta)
+        self.instantaneas = instantanea.carpeta_de(self.carpeta)
+        self.archivos = {c: self.carpeta / f"{c}.json" for c in ARCHIVOS}
+        self.sqlite = self.carpeta / "icpc.sqlite3"
+        self.lock = self.carpeta / ".lock"
+        self.cache = {}
+        self.escrituras = {}
+        self.bloqueo = threading.RLock()
+        self.anidamiento = 0
+        self.grupo = None  # grupo del historial de la transacción en curso
+        self.derivados = {}
+        self.tamanos = {}  # coleccion -> bytes en disco de lo que está en caché
+        self.en_uso = 0
+        self._bloqueo_derivados = threading.Lock()
+
+    def derivado(self, nombre, crear):
+        """Estado 'nombre' de un índice derivado; crear() lo arma la primera vez."""
+        estado = self.derivados.get(nombre)
+        if estado is None:
+            with self._bloqueo_derivados:
+                estado = self.derivados.get(nombre)
+                if estado is None:
+                    estado = self.derivados[nombre] = crear()
+        return estado
+
+    def memoria(self):
+        return sum(self.tamanos.values()) * FACTOR_MEMORIA
+
+
+_predeterminado = Conjunto("", DATA_DIR)
+_conjuntos = OrderedDict()  # nombre -> Conjunto, del menos al más reciente
+_bloqueo_conjuntos = threading.Lock()
+_actual = contextvars.ContextVar("conjunto", default=None)
+
+
+def conjunto_actual():
+    """El conjunto con el que se está trabajando (data/ si no se eligió otro)."""
+    return _actual.get() or _predeterminado
+
+
+def conjuntos_disponibles():
+    """Nombres de los conjuntos de CONJUNTOS_DIR."""
+    if not CONJUNTOS_DIR.is_dir():
+        return []
+    return sorted(
+        d.name for d in CONJUNTOS_DIR.iterdir()
+        if d.is_dir() and NOMBRE_CONJUNTO.match(d.name)
+    )
+
+
+def existe_conjunto(nombre):
+    """True si 'nombre' es un conjunto de CONJUNTOS_DIR ("" es data/)."""
+    if not nombre or nombre in _conjuntos:
+        return True
+    return bool(NOMBRE_CONJUNTO.match(nombre)) and (CONJUNTOS_DIR / nombre).is_dir()
+
+
+def conjuntos_cargados():
+    """El conjunto predeterminado y los que están en memoria."""
+    with _bloqueo_conjuntos:
+        return [_predeterminado, *_conjuntos.values()]
+
+
+def _liberar_memoria():
+    total = _predeterminado.memoria() + sum(c.memoria() for c in _conjuntos.values())
+    for nombre in list(_conjuntos):
+        if total <= MEMORIA_CONJUNTOS:
+            break
+        conjunto = _conjuntos[nombre]
+        if conjunto.en_uso:
+            continue
+        total -= conjunto.memoria()
+        del _conjuntos[nombre]
+        diario.olvidar(conjunto.archivos.values())
+        almacen_sqlite.olvidar(conjunto.sqlite)
+        contar("icpc_conjuntos_descargados_total")
+
+
+@contextmanager
+def usar_conjunto(nombre):
+    """
+    Dentro del with, las funciones de este módulo (y los índices de los
+    demás) trabajan sobre el conjunto 'nombre' ("" es data/). Lo carga si
+    hace falta. Lanza KeyError si no existe. También acepta un Conjunto ya
+    cargado (p. ej. de conjuntos_cargados()); así no cuenta como uso.
+    """
+    with _bloqueo_conjuntos:
+        if isinstance(nombre, Conjunto):
+            conjunto = nombre
+        elif not nombre:
+            conjunto = _predeterminado
+        else:
+            conjunto = _conjuntos.get(nombre)
+            if conjunto is None:
+                carpeta = CONJUNTOS_DIR / nombre
+                if not NOMBRE_CONJUNTO.match(nombre) or not carpeta.is_dir():
+                    raise KeyError(nombre)
+                conjunto = _conjuntos[nombre] = Conjunto(nombre, carpeta)
+                contar("icpc_conjuntos_cargados_total")
+            _conjuntos.move_to_end(nombre)
+        conjunto.en_uso += 1
+        _liberar_memoria()
+
+    token = _actual.set(conjunto)
+    try:
+        yield conjunto
+    finally:
+        _actual.reset(token)
+        with _bloqueo_conjuntos:
+            conjunto.en_uso -= 1
+
+
+@contextmanager
+def transaccion():
+    """
+    Bloquea las escrituras de los demás hilos y procesos mientras dura el
+    ciclo cargar -> modificar -> guardar. Se puede anidar.
+    """
+    conjunto = conjunto_actual()
+    with conjunto.bloqueo:
+        if not conjunto.anidamiento:
+            # lo que se guarde en esta transacción se deshace junto; el
+            # tiempo va primero para que los grupos se ordenen solos
+            conjunto.grupo = f"{time.time_ns():016x}-{os.getpid()}"
+        if conjunto.anidamiento or fcntl is None:
+            conjunto.anidamiento += 1
+            try:
+                yield
+            finally:
+                conjunto.anidamiento -= 1
+            return
+
+        conjunto.carpeta.mkdir(parents=True, exist_ok=True)
+        with conjunto.lock.open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            conjunto.anidamiento += 1
+            try:
+                yield
+            finally:
+                conjunto.anidamiento -= 1
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def version_registro(registro):
+    """
+    Sello corto del contenido de un registro (o de una lista). Los
+    formularios lo mandan de vuelta para detectar si alguien más modificó
+    el registro mientras se editaba.
+    """
+    contenido = json.dumps(registro, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:12]
+
+
+def _firma_coleccion(coleccion):
+    conjunto = conjunto_actual()
+    pendiente = _pendiente(conjunto, coleccion)
+    if pendiente is not None:
+        return pendiente["firma"]
+    if conjunto.fecha is not None:
+        n = historial.posicion(conjunto.historial, coleccion, conjunto.fecha)
+        if n is not None:
+            return ("historial", n)
+    if ALMACEN == "sqlite":
+        return almacen_sqlite.version(conjunto.sqlite, coleccion)
+    return diario.firma(conjunto.archivos[coleccion])
+
+
+def firma_colecciones(*colecciones):
+    """
+    Firma conjunta de varias colecciones. Cambia cada vez que alguna de
+    ellas se modifica, así que sirve como clave para cachés derivadas.
+    """
+    escrituras = conjunto_actual().escrituras
+    return tuple(
+        (_firma_coleccion(c), escrituras.get(c, 0)) for c in colecciones
+    )
+
+
+def version_colecciones(*colecciones):
+    """
+    Versión de varias colecciones como cadena corta (sirve de ETag).
+    """
+    firma = repr(firma_colecciones(*colecciones)).encode("utf-8")
+    return hashlib.sha1(firma).hexdigest()[:16]
+
+
+def firma_instantanea(*colecciones):
+    """
+    Firma en disco de esas colecciones, para las instantáneas de índices
+    derivados (ver leer_instantanea()). None si no se usan instantáneas
+    (SQLite, una fecha pasada o un lote con cambios sin escribir).
+    """
+    conjunto = conjunto_actual()
+    if not _usa_instantaneas(conjunto):
+        return None
+    if any(_pendiente(conjunto, c) is not None for c in colecciones):
+        return None
+    return tuple(_firma_coleccion(c) for c in colecciones)
+
+
+def leer_instantanea(nombre, firma):
+    """
+    Lo guardado con guardar_instantanea(nombre, ...) con esta firma (la de
+    firma_instantanea()), o None.
+    """
+    if firma is None:
+        return None
+    return instantanea.leer(conjunto_actual().instantaneas, nombre, firma)
+
+
+def guardar_instantanea(nombre, firma, valor):
+    """
+    Guarda un índice derivado para el próximo arranque. 'firma' se debe
+    tomar antes de cargar las colecciones con que se armó.
+    """
+    if firma is not None:
+        instantanea.escribir(conjunto_actual().instantaneas, nombre, firma, valor)
+
+
+# Funciones a llamar después de cada guardar_* (reciben el nombre de la
+# colección). Las usan las cachés derivadas que prefieren vaciarse de
+# inmediato en lugar de esperar a la siguiente consulta.
+_oyentes = []
+
+
+def al_guardar(funcion):
+    _oyentes.append(funcion)
+    return funcion
+
+
+def _copiar(registros):
+    """
+    Copia de una lista de registros (dicts cuyos valores son escalares o
+    listas de escalares). Es bastante más barata que copy.deepcopy y basta
+    para que las rutas puedan modificar lo que reciben sin tocar la caché.
+    """
+    return [
+        {k: (list(v) if isinstance(v, list) else v) for k, v in r.items()}
+        for r in registros
+    ]
+
+
+def _leer(coleccion):
+    conjunto = conjunto_actual()
+    with fase("carga"):
+        if conjunto.fecha is not None:
+            n = historial.posicion(conjunto.historial, coleccion, conjunto.fecha)
+            if n is not None:
+                return historial.reconstruir(
+                    conjunto.historial, coleccion, almacen_sqlite.CLAVES[coleccion], n
+                )
+            # sin historial: no ha cambiado desde que se empezó a registrar
+        if ALMACEN == "sqlite":
+            return almacen_sqlite.cargar(conjunto.sqlite, coleccion)
+
+        return diario.cargar(conjunto.archivos[coleccion], almacen_sqlite.CLAVES[coleccion])
+
+
+def _escribir(coleccion, registros):
+    conjunto = conjunto_actual()
+    with fase("escritura"):
+        if ALMACEN == "sqlite":
+            almacen_sqlite.guardar(conjunto.sqlite, coleccion, registros)
+            return
+
+        diario.guardar(conjunto.archivos[coleccion], registros, almacen_sqlite.CLAVES[coleccion])
+
+
+def _tamano_en_disco(conjunto, coleccion):
+    """Bytes que ocupa la colección en disco (para estimar su memoria)."""
+    if ALMACEN == "sqlite":
+        rutas = [conjunto.sqlite]
+        partes = len(ARCHIVOS)
+    else:
+        rutas = [conjunto.archivos[coleccion], diario.ruta_diario(conjunto.archivos[coleccion])]
+        partes = 1
+    total = 0
+    for ruta in rutas:
+        try:
+            total += ruta.stat().st_size
+        except OSError:
+            pass
+    return total // partes
+
+
+def _usa_instantaneas(conjunto):
+    return INSTANTANEAS and ALMACEN == "json" and conjunto.fecha is None
+
+
+def _leer_ordenados(conjunto, coleccion, firma):
+    """
+    Los registros de la colección en el orden de ORDENES. Salen de la
+    instantánea si sigue al día; si no, del JSON. Leer nunca escribe la
+    instantánea: eso lo hacen _guardar() y generar_instantaneas().
+    """
+    ruta = conjunto.archivos[coleccion]
+    campo = almacen_sqlite.CLAVES[coleccion]
+    if _usa_instantaneas(conjunto):
+        with fase("carga"):
+            guardada = instantanea.leer(conjunto.instantaneas, coleccion, firma)
+        if guardada is not None:
+            registros, posiciones, resumen = guardada
+            # el diario necesita los registros en el orden del archivo
+            diario.recordar(ruta, firma, resumen, registros, campo)
+            contar("icpc_instantaneas_total", coleccion=coleccion, resultado="usada")
+            return registros if posiciones is None else [registros[i] for i in posiciones]
+
+    registros = _leer(coleccion)
+    posiciones = _posiciones_ordenadas(coleccion, registros)
+    return registros if posiciones is None else [registros[i] for i in posiciones]
+
+
+def _posiciones_ordenadas(coleccion, registros):
+    """Permutación que deja 'registros' en el orden de ORDENES, o None si no tiene orden."""
+    orden = ORDENES.get(coleccion)
+    if not orden:
+        return None
+    with fase("orden"):
+        return sorted(range(len(registros)), key=lambda i: orden(registros[i]))
+
+
+def _escribir_instantanea(conjunto, coleccion, registros, posiciones):
+    """
+    Guarda la instantánea de la colección tal como quedó en disco
+    ('registros' en el orden del archivo). Se llama con transaccion()
+    tomada, justo después de leerla o escribirla.
+    """
+    resumen = diario.resumen(conjunto.archivos[coleccion])
+    if resumen is None:
+        return
+    with fase("instantanea"):
+        instantanea.escribir(
+            conjunto.instantaneas, coleccion, _firma_coleccion(coleccion),
+            (registros, posiciones, resumen),
+        )
+    contar("icpc_instantaneas_total", coleccion=coleccion, resultado="generada")
+
+
+def generar_instantaneas():
+    """
+    Escribe las instantáneas de todas las colecciones del conjunto actual
+    con lo que hay en disco. Los guardados ya las escriben; esto es para
+    datos que no se han guardado desde la app (recién copiados o editados
+    a mano) o después de compactar_diarios(). Regresa cuántas escribió.
+    """
+    conjunto = conjunto_actual()
+    if not _usa_instantaneas(conjunto):
+        return 0
+    with transaccion():
+        for coleccion in conjunto.archivos:
+            registros = _leer(coleccion)
+            _escribir_instantanea(
+                conjunto, coleccion, registros, _posiciones_ordenadas(coleccion, registros)
+            )
+    return len(conjunto.archivos)
+
+
+def _entrada(coleccion):
+    conjunto = conjunto_actual()
+    pendiente = _pendiente(conjunto, coleccion)
+    if pendiente is not None:
+        return pendiente
+    firma = _firma_coleccion(coleccion)
+    entrada = conjunto.cache.get(coleccion)
+    if entrada is None or entrada["firma"] != firma:
+        registros = _leer_ordenados(conjunto, coleccion, firma)
+        entrada = {"firma": firma, "registros": registros, "por_clave": None}
+        conjunto.cache[coleccion] = entrada
+        conjunto.tamanos[coleccion] = _tamano_en_disco(conjunto, coleccion)
+        contar("icpc_cargas_total", coleccion=coleccion, origen="disco")
+    else:
+        contar("icpc_cargas_total", coleccion=coleccion, origen="cache")
+    return entrada
+
+
+def _cargar(coleccion):
+    entrada = _entrada(coleccion)
+    with fase("copia"):
+        return _copiar(entrada["registros"])
+
+
+def cargar_compartido(coleccion):
+    """
+    Como cargar_*, pero regresa la lista de la caché sin copiarla. Es para
+    los índices derivados, que solo leen: no se debe modificar.
+    """
+    return _entrada(coleccion)["registros"]
+
+
+def _obtener(coleccion, clave):
+    """Un registro por su clave (id o nombre), sin copiar toda la colección."""
+    entrada = _entrada(coleccion)
+    if entrada["por_clave"] is None:
+        campo = almacen_sqlite.CLAVES[coleccion]
+        entrada["por_clave"] = {r[campo]: r for r in entrada["registros"]}
+    registro = entrada["por_clave"].get(clave)
+    return _copiar([registro])[0] if registro else None
+
+
+def _guardar(coleccion, registros):
+    conjunto = conjunto_actual()
+    if conjunto.fecha is not None:
+        raise RuntimeError("Los datos de una fecha pasada son de solo lectura")
+    copia = _copiar(registros)
+
+    estado = _lote.get()
+    if estado is not None and estado["conjunto"] is conjunto:
+        # dentro de lote(): se escribe al final
+        orden = ORDENES.get(coleccion)
+        if orden:
+            copia.sort(key=orden)
+        estado["version"] += 1
+        estado["colecciones"][coleccion] = {
+            "firma": ("lote", estado["version"]),
+            "registros": copia,
+            "por_clave": None,
+        }
+        return
+
+    contar("icpc_guardados_total", coleccion=coleccion)
+    with transaccion():
+        anteriores = _entrada(coleccion)["registros"] if HISTORIAL else None
+        _escribir(coleccion, copia)
+
+        # lo que acabamos de escribir ya es la versión vigente: no hace falta
+        # volver a leerlo en la siguiente carga (ni en el próximo arranque:
+        # se guarda también su instantánea)
+        posiciones = _posiciones_ordenadas(coleccion, copia)
+        if _usa_instantaneas(conjunto):
+            _escribir_instantanea(conjunto, coleccion, copia, posiciones)
+        if posiciones is not None:
+            copia = [copia[i] for i in posiciones]
+        if HISTORIAL:
+            with fase("historial"):
+                historial.registrar(
+                    conjunto.historial, coleccion, anteriores, copia,
+                    almacen_sqlite.CLAVES[coleccion], conjunto.grupo, _deshaciendo.get(),
+                )
+        conjunto.cache[coleccion] = {
+            "firma": _firma_coleccion(coleccion),
+            "registros": copia,
+            "por_clave": None,
+        }
+        conjunto.escrituras[coleccion] = conjunto.escrituras.get(coleccion, 0) + 1
+
+    for oyente in _oyentes:
+        oyente(coleccion)
+
+
+# Lote en curso (ver lote()): {"conjunto", "version", "colecciones":
+# coleccion -> entrada como las de Conjunto.cache, con lo guardado en el lote}
+_lote = contextvars.ContextVar("lote", default=None)
+
+
+def _pendiente(conjunto, coleccion):
+    estado = _lote.get()
+    if estado is None or estado["conjunto"] is not conjunto:
+        return None
+    return estado["colecciones"].get(coleccion)
+
+
+@contextmanager
+def lote(simulacro=False):
+    """
+    Junta muchas operaciones en un solo ciclo cargar -> guardar: dentro del
+    with, guardar_* solo deja la colección en memoria (los cargar_* y los
+    índices ya la ven) y al salir se escribe una vez cada colección
+    modificada, todo en una misma transacción (y un solo grupo del
+    historial). Si hay una excepción, o con simulacro=True, no se escribe
+    nada.
+    """
+    conjunto = conjunto_actual()
+    with transaccion():
+        estado = {"conjunto": conjunto, "version": 0, "colecciones": {}}
+        token = _lote.set(estado)
+        try:
+            yield
+        finally:
+            _lote.reset(token)
+        if not simulacro:
+            for coleccion, entrada in estado["colecciones"].items():
+                _guardar(coleccion, entrada["registros"])
+
+
+def compactar_diarios():
+    """
+    Vuelca cada colección completa a su JSON y borra los diarios. Útil antes
+    de editar los JSON a mano o de versionarlos.
+    """
+    if ALMACEN == "sqlite":
+        return
+    conjunto = conjunto_actual()
+    with transaccion():
+        for coleccion, ruta in conjunto.archivos.items():
+            if not ruta.exists() and not diario.ruta_diario(ruta).exists():
+                continue
+            diario.compactar(ruta, almacen_sqlite.CLAVES[coleccion])
+            conjunto.cache.pop(coleccion, None)
+
+
+_deshaciendo = contextvars.ContextVar("deshaciendo", default=None)
+
+
+def deshacer_ultimo_cambio():
+    """
+    Revierte el último grupo de cambios (todo lo guardado en una misma
+    transacción) que no se haya deshecho ya. Regresa {"grupo", "fecha",
+    "colecciones"} o None si no hay nada que deshacer. Lanza ValueError si
+    algún registro volvió a cambiar después: revertirlo perdería ese cambio.
+    """
+    conjunto = conjunto_actual()
+    with transaccion():
+        ultimo = historial.ultimo_grupo(conjunto.historial, ARCHIVOS)
+        if ultimo is None:
+            return None
+        revertidos = {
+            coleccion: historial.revertir(
+                _entrada(coleccion)["registros"], entradas, almacen_sqlite.CLAVES[coleccion]
+            )
+            for coleccion, entradas in ultimo["cambios"].items()
+        }
+        token = _deshaciendo.set(ultimo["grupo"])
+        try:
+            for coleccion, registros in revertidos.items():
+                _guardar(coleccion, registros)
+        finally:
+            _deshaciendo.reset(token)
+    return {
+        "grupo": ultimo["grupo"],
+        "fecha": ultimo["fecha"],
+        "colecciones": sorted(revertidos),
+    }
+
+
+def cambios_recientes(limite=50):
+    """Los últimos grupos de cambios del conjunto actual (ver historial.recientes())."""
+    return historial.recientes(conjunto_actual().historial, ARCHIVOS, limite)
+
+
+def conjunto_en_fecha(fecha):
+    """
+    Versión de solo lectura del conjunto actual tal como estaba en 'fecha'
+    ('AAAA-MM-DD' o 'AAAA-MM-DDTHH:MM'), para usar con usar_conjunto().
+    Se guardan las últimas que se pidieron. Lanza ValueError si la fecha no
+    es válida.
+    """
+    conjunto = conjunto_actual()
+    fecha = historial.normalizar_fecha(fecha)
+    versiones = conjunto.derivado("fechas", OrderedDict)
+    with conjunto._bloqueo_derivados:
+        version = versiones.get(fecha)
+        if version is None:
+            version = versiones[fecha] = Conjunto(conjunto.nombre, conjunto.carpeta, fecha)
+            while len(versiones) > MAX_FECHAS:
+                versiones.popitem(last=False)
+        versiones.move_to_end(fecha)
+    return version
+
+
+def _orden_temas(t):
+    return t.get("orden", 0)
+
+
+def _orden_concursos(c):
+    # año descendente y luego nombre
+    return (-int(c.get("anio") or 0), c.get("nombre", ""))
+
+
+def _orden_cursos(c):
+    return c.get("nombre", "")
+
+
+def _orden_categorias(c):
+    return c.get("orden", 0)
+
+
+ORDENES = {
+    "temas": _orden_temas,
+    "concursos": _orden_concursos,
+    "concursos_categorias": _orden_categorias,
+    "cursos": _orden_cursos,
+}
+
+
+def cargar_temas():
+    return _cargar("temas")
+
+def obtener_tema(nombre):
+    return _obtener("temas", nombre)
+
+def guardar_temas(temas):
+    _guardar("temas", temas)
+
+def obtener_categorias():
+    temas = cargar_temas()
+    categorias = sorted({t.get("categoria") for t in temas if t.get("categoria")})
+    return categorias
+
+def cargar_concursos():
+    return _cargar("concursos")
+
+
+def guardar_concursos(concursos):
+    _guardar("concursos", concursos)
+
+def _completar_categorias(categorias, concursos):
+    """
+    Agrega al final de 'categorias' las categorías que aparecen en los
+    concursos pero aún no tienen orden asignado. Regresa True si agregó alguna.
+    """
+    nombres_existentes = {c["nombre"] for c in categorias}
+    categorias_en_concursos = {
+        conc.get("categoria") or "Sin categoría" for conc in concursos
+    }
+    faltantes = sorted(categorias_en_concursos - nombres_existentes)
+    if not faltantes:
+        return False
+
+    max_orden = max((c["orden"] for c in categorias), default=0)
+    for cat in faltantes:
+        max_orden += 1
+        categorias.append({
+            "nombre": cat,
+            "orden": max_orden
+        })
+    return True
+
+def cargar_categorias_concursos():
+    """
+    Categorías de concursos ordenadas por 'orden'. Solo lee: las categorías
+    que faltan en el archivo se agregan en memoria, sin escribir a disco
+    (eso lo hace sincronizar_categorias_concursos al modificar concursos).
+    """
+    categorias = _cargar("concursos_categorias")
+    if _completar_categorias(categorias, cargar_concursos()):
+        categorias.sort(key=_orden_categorias)
+    return categorias
+
+def cargar_categorias_guardadas():
+    """
+    Categorías de concursos tal como están guardadas, sin agregar las que
+    faltan (a diferencia de cargar_categorias_concursos). Sirve para
+    revisar que la lista esté completa.
+    """
+    return _cargar("concursos_categorias")
+
+def sincronizar_categorias_concursos():
+    """
+    Guarda en concursos_categorias las categorías nuevas que aparezcan
+    en los concursos. Solo escribe si de verdad faltaba alguna.
+    """
+    categorias = _cargar("concursos_categorias")
+    if _completar_categorias(categorias, cargar_concursos()):
+        guardar_categorias_concursos(categorias)
+
+def guardar_categorias_concursos(categorias):
+    _guardar("concursos_categorias", categorias)
+
+def cargar_problemas():
+    return _cargar("problemas")
+
+def obtener_problema(problema_id):
+    return _obtener("problemas", problema_id)
+
+
+def guardar_problemas(problemas):
+    _guardar("problemas", problemas)
+
+def cargar_cursos():
+    return _cargar("cursos")
+
+def guardar_cursos(cursos):
+    _guardar("cursos", cursos)
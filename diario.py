@@ -0,0 +1,311 @@
+"""
+Persistencia de las colecciones JSON con un diario de cambios.
+
+El archivo de cada colección (p. ej. data/problemas.json) sigue siendo el
+JSON legible de siempre, pero ya no se reescribe completo en cada edición:
+cada guardado agrega una línea a data/<coleccion>.diario.jsonl con solo lo
+que cambió (registros insertados, actualizados, borrados y los que cambiaron
+de lugar). Al cargar se aplica el diario sobre el JSON.
+
+Cada MAX_ENTRADAS guardados el diario se compacta: se escribe el JSON
+completo (archivo temporal + os.replace, para que una caída nunca deje el
+archivo a medias) y se borra el diario.
+
+La primera línea del diario guarda el sha1 del JSON sobre el que se
+escribió. Si no coincide (la compactación se cayó justo después de
+reemplazar el JSON, o alguien editó el JSON a mano) el diario se ignora.
+"""
+import hashlib
+import json
+import os
+from bisect import bisect_left
+
+from metricas import contar
+
+MAX_ENTRADAS = 200
+
+# Último estado conocido de cada colección, para calcular diferencias:
+#   ruta -> {"firma", "base", "registros" (clave -> registro, en orden),
+#            "entradas", "corrupto"}
+_estado = {}
+
+
+def olvidar(rutas):
+    """Suelta el estado guardado de esas colecciones (al descargar un conjunto)."""
+    for ruta in rutas:
+        _estado.pop(ruta, None)
+
+
+def ruta_diario(ruta):
+    return ruta.with_name(ruta.stem + ".diario.jsonl")
+
+
+def _firma(ruta):
+    try:
+        st = ruta.stat()
+    except FileNotFoundError:
+        return None
+    # el inodo cambia con cada os.replace, aunque mtime y tamaño se repitan
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def firma(ruta):
+    """Firma del JSON y de su diario; cambia con cualquier escritura."""
+    return (_firma(ruta), _firma(ruta_diario(ruta)))
+
+
+def _sha1(contenido):
+    return hashlib.sha1(contenido).hexdigest()
+
+
+def aplicar(registros, cambios, campo):
+    """Aplica una lista de cambios del diario a una lista de registros."""
+    por_clave = {r[campo]: r for r in registros}
+    orden = None  # claves en orden mientras se aplican varios "mover" seguidos
+    for cambio in cambios:
+        op = cambio["op"]
+        if op == "mover":
+            if orden is None:
+                orden = list(por_clave)
+            mover(orden, cambio["clave"], cambio["despues_de"])
+            continue
+        if orden is not None:
+            por_clave = {c: por_clave[c] for c in orden}
+            orden = None
+        if op == "borrar":
+            por_clave.pop(cambio["clave"], None)
+        elif op in ("insertar", "actualizar"):
+            # si ya existe conserva su lugar; si no, va al final
+            registro = cambio["registro"]
+            por_clave[registro[campo]] = registro
+        elif op == "ordenar":
+            por_clave = {c: por_clave[c] for c in cambio["claves"] if c in por_clave}
+    if orden is not None:
+        por_clave = {c: por_clave[c] for c in orden}
+    return list(por_clave.values())
+
+
+def mover(claves, clave, despues_de):
+    """
+    Pone 'clave' justo después de 'despues_de' en la lista 'claves' (al
+    principio si es None). Si alguna de las dos ya no está, no hace nada.
+    """
+    if clave not in claves or (despues_de is not None and despues_de not in claves):
+        return claves
+    claves.remove(clave)
+    claves.insert(0 if despues_de is None else claves.index(despues_de) + 1, clave)
+    return claves
+
+
+def _subsecuencia_creciente(valores):
+    """Índices de una subsecuencia creciente más larga de 'valores'."""
+    finales = []  # finales[k]: menor valor con que termina una de largo k+1
+    indices = []  # índice de ese valor
+    previo = [None] * len(valores)
+    for i, valor in enumerate(valores):
+        k = bisect_left(finales, valor)
+        if k:
+            previo[i] = indices[k - 1]
+        if k == len(finales):
+            finales.append(valor)
+            indices.append(i)
+        else:
+            finales[k] = valor
+            indices[k] = i
+    resultado = []
+    i = indices[-1] if indices else None
+    while i is not None:
+        resultado.append(i)
+        i = previo[i]
+    return resultado[::-1]
+
+
+def movimientos(antes, despues):
+    """
+    Cambios "mover" que llevan la lista de claves 'antes' a 'despues' (las
+    mismas claves en otro orden): las que no están en la subsecuencia más
+    larga que ya quedó en orden, cada una tras la que la precede en
+    'despues'. None si se movió más de la mitad (conviene un "ordenar").
+    """
+    posicion = {clave: i for i, clave in enumerate(antes)}
+    quietas = {despues[i] for i in _subsecuencia_creciente([posicion[c] for c in despues])}
+    if len(despues) - len(quietas) > len(despues) // 2:
+        return None
+    return [
+        {"op": "mover", "clave": clave, "despues_de": despues[i - 1] if i else None}
+        for i, clave in enumerate(despues)
+        if clave not in quietas
+    ]
+
+
+def diferencias(anteriores, registros, campo):
+    """
+    Cambios que llevan de 'anteriores' (clave -> registro, en orden) a la
+    lista 'registros'.
+    """
+    claves = [r[campo] for r in registros]
+    nuevas = set(claves)
+
+    cambios = [{"op": "borrar", "clave": c} for c in anteriores if c not in nuevas]
+    resultante = [c for c in anteriores if c in nuevas]
+
+    for registro, clave in zip(registros, claves):
+        previo = anteriores.get(clave)
+        if previo is None:
+            cambios.append({"op": "insertar", "registro": registro})
+            resultante.append(clave)
+        elif previo != registro:
+            cambios.append({"op": "actualizar", "registro": registro})
+
+    if resultante != claves:
+        # un cambio de lugar se anota como pocos "mover", no con todas las claves
+        cambios += movimientos(resultante, claves) or [{"op": "ordenar", "claves": claves}]
+
+    return cambios
+
+
+def cargar(ruta, campo):
+    """Lee el JSON de la colección y le aplica su diario."""
+    firma_actual = firma(ruta)
+
+    if ruta.exists():
+        contenido = ruta.read_bytes()
+        contar("icpc_bytes_leidos_total", len(contenido), archivo=ruta.name)
+        registros = json.loads(contenido)
+        base = _sha1(contenido)
+    else:
+        registros = []
+        base = None
+
+    entradas = 0
+    corrupto = False
+    diario = ruta_diario(ruta)
+    if diario.exists():
+        texto = diario.read_bytes()
+        contar("icpc_bytes_leidos_total", len(texto), archivo=diario.name)
+        lineas = texto.decode("utf-8").splitlines()
+        try:
+            cabecera = json.loads(lineas[0])["base"] if lineas else None
+        except (ValueError, KeyError):
+            cabecera = None
+
+        if cabecera is not None and cabecera == base:
+            for linea in lineas[1:]:
+                try:
+                    cambios = json.loads(linea)["cambios"]
+                except (ValueError, KeyError):
+                    # línea cortada por una caída a media escritura: lo que
+                    # siga no es confiable; se compacta en el próximo guardado
+                    corrupto = True
+                    break
+                registros = aplicar(registros, cambios, campo)
+                entradas += 1
+        else:
+            corrupto = True
+
+    _estado[ruta] = {
+        "firma": firma_actual,
+        "base": base,
+        "registros": {r[campo]: r for r in registros},
+        "entradas": entradas,
+        "corrupto": corrupto,
+    }
+    return registros
+
+
+def resumen(ruta):
+    """
+    (base, entradas, corrupto) de la última lectura de la colección, o
+    None. Con esto y los registros, recordar() deja el estado igual sin
+    volver a leer (ver instantanea.py).
+    """
+    estado = _estado.get(ruta)
+    if estado is None:
+        return None
+    return (estado["base"], estado["entradas"], estado["corrupto"])
+
+
+def recordar(ruta, firma_leida, resumen_leido, registros, campo):
+    """Como si cargar() acabara de leer 'registros' con esa firma y ese resumen()."""
+    base, entradas, corrupto = resumen_leido
+    _estado[ruta] = {
+        "firma": firma_leida,
+        "base": base,
+        "registros": {r[campo]: r for r in registros},
+        "entradas": entradas,
+        "corrupto": corrupto,
+    }
+
+
+def escribir_atomico(ruta, registros):
+    """
+    Escribe el JSON completo en un temporal y lo pone en su lugar con
+    os.replace. Regresa el sha1 de lo escrito.
+    """
+    contenido = json.dumps(registros, indent=4, ensure_ascii=False).encode("utf-8")
+    tmp = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(contenido)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+    contar("icpc_bytes_escritos_total", len(contenido), archivo=ruta.name)
+    return _sha1(contenido)
+
+
+def compactar(ruta, campo, registros=None):
+    """Vuelca la colección completa al JSON y borra el diario."""
+    if registros is None:
+        registros = cargar(ruta, campo)
+    base = escribir_atomico(ruta, registros)
+    ruta_diario(ruta).unlink(missing_ok=True)
+    _estado[ruta] = {
+        "firma": firma(ruta),
+        "base": base,
+        "registros": {r[campo]: r for r in registros},
+        "entradas": 0,
+        "corrupto": False,
+    }
+
+
+def guardar(ruta, registros, campo):
+    """
+    Deja la colección igual a 'registros'. Normalmente solo agrega una
+    línea al diario con las diferencias; compacta si ya hay muchas.
+    """
+    estado = _estado.get(ruta)
+    if estado is None or estado["firma"] != firma(ruta):
+        cargar(ruta, campo)
+        estado = _estado[ruta]
+
+    claves = [r[campo] for r in registros]
+    if (
+        estado["base"] is None
+        or estado["corrupto"]
+        or estado["entradas"] + 1 >= MAX_ENTRADAS
+        or len(set(claves)) != len(claves)  # con claves repetidas no hay diff por clave
+    ):
+        compactar(ruta, campo, registros)
+        return
+
+    cambios = diferencias(estado["registros"], registros, campo)
+    if not cambios:
+        return
+
+    diario = ruta_diario(ruta)
+    with diario.open("ab") as f:
+        texto = ""
+        if f.tell() == 0:
+            texto += json.dumps({"base": estado["base"]}) + "\n"
+        texto += json.dumps({"cambios": cambios}, ensure_ascii=False) + "\n"
+        contenido = texto.encode("utf-8")
+        f.write(contenido)
+        f.flush()
+        os.fsync(f.fileno())
+    contar("icpc_bytes_escritos_total", len(contenido), archivo=diario.name)
+
+    estado.update(
+        firma=firma(ruta),
+        registros={r[campo]: r for r in registros},
+        entradas=estado["entradas"] + 1,
+    )
@@ -0,0 +1,248 @@
+"""
+Exportación de problemas y material de curso en CSV, JSON, Markdown o ZIP.
+
+Cada formato es un generador que va produciendo el documento por pedazos:
+la respuesta HTTP empieza a enviarse de inmediato y nunca se arma el
+documento completo en memoria. El ZIP incluye, además del índice
+(problemas.csv, problemas.json y README.md), los archivos de 'ruta_solucion'
+de los problemas y de 'ruta' de los temas, leídos también por pedazos.
+
+El CSV usa las mismas columnas que importar.py, así que un paquete
+exportado se puede importar en otra copia de la app.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from datos import BASE_DIR, cargar_temas, cargar_problemas, cargar_cursos
+from indices import agrupar_problemas_por_tema_principal, ids_filtrados
+
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "json": ("application/json", "json"),
+    "md": ("text/markdown; charset=utf-8", "md"),
+    "zip": ("application/zip", "zip"),
+}
+
+COLUMNAS = (
+    "tipo", "id", "nombre", "url", "concurso", "temas",
+    "ruta_solucion", "etiqueta", "categoria", "ruta",
+)
+
+TAMANO_PEDAZO = 64 * 1024
+
+
+def seleccionar(curso=None, filtros=None):
+    """
+    Regresa la selección a exportar, un dict con "titulo", "problemas",
+    "temas" y "orden_temas" (todos los temas, para agrupar):
+      - curso: los problemas y temas marcados como usados en ese curso;
+      - filtros: los problemas que cumplen filtrar_problemas() y sus temas;
+      - nada: todo el banco.
+    Los problemas conservan el orden del banco y los temas su 'orden'.
+    Lanza KeyError si el curso no existe.
+    """
+    temas = cargar_temas()
+    problemas = cargar_problemas()
+
+    if curso is not None:
+        registro = next((c for c in cargar_cursos() if c["nombre"] == curso), None)
+        if registro is None:
+            raise KeyError(curso)
+        usados = set(registro.get("usados_problemas") or [])
+        usados_temas = set(registro.get("usados_temas") or [])
+        return {
+            "titulo": f"Curso {curso}",
+            "problemas": [p for p in problemas if p["id"] in usados],
+            "temas": [t for t in temas if t["nombre"] in usados_temas],
+            "orden_temas": temas,
+        }
+
+    if filtros:
+        ids = set(ids_filtrados(**filtros))
+        seleccion = [p for p in problemas if p["id"] in ids]
+        referidos = {t for p in seleccion for t in p.get("temas") or []}
+        return {
+            "titulo": "Selección de problemas",
+            "problemas": seleccion,
+            "temas": [t for t in temas if t["nombre"] in referidos],
+            "orden_temas": temas,
+        }
+
+    return {
+        "titulo": "Banco de problemas",
+        "problemas": problemas,
+        "temas": temas,
+        "orden_temas": temas,
+    }
+
+
+def _fila_csv(valores):
+    salida = io.StringIO()
+    csv.writer(salida).writerow(valores)
+    return salida.getvalue()
+
+
+def generar_csv(seleccion):
+    yield _fila_csv(COLUMNAS)
+    for t in seleccion["temas"]:
+        yield _fila_csv([
+            "tema", "", t["nombre"], "", "", "", "", "",
+            t.get("categoria") or "", t.get("ruta") or "",
+        ])
+    for p in seleccion["problemas"]:
+        yield _fila_csv([
+            "problema", p["id"], p.get("nombre") or "", p.get("url") or "",
+            p.get("concurso") or "", ";".join(p.get("temas") or []),
+            p.get("ruta_solucion") or "", p.get("etiqueta") or "", "", "",
+        ])
+
+
+def generar_json(seleccion):
+    titulo = json.dumps(seleccion["titulo"], ensure_ascii=False)
+    yield "{" + f'"titulo": {titulo}, "temas": ['
+    for i, t in enumerate(seleccion["temas"]):
+        yield ("," if i else "") + "\n  " + json.dumps(t, ensure_ascii=False)
+    yield '\n], "problemas": ['
+    for i, p in enumerate(seleccion["problemas"]):
+        yield ("," if i else "") + "\n  " + json.dumps(p, ensure_ascii=False)
+    yield "\n]}\n"
+
+
+def _celda(texto):
+    return str(texto or "").replace("|", "\\|").replace("\n", " ")
+
+
+def generar_markdown(seleccion):
+    yield f"# {seleccion['titulo']}\n\n"
+    if seleccion["temas"]:
+        yield "## Temas\n\n"
+        for t in seleccion["temas"]:
+            categoria = f" ({t['categoria']})" if t.get("categoria") else ""
+            yield f"- {t['nombre']}{categoria}\n"
+        yield "\n"
+
+    # mismos grupos y orden que en /problemas
+    grupos = agrupar_problemas_por_tema_principal(
+        seleccion["problemas"], seleccion["orden_temas"]
+    )
+    for grupo in grupos:
+        yield f"## {grupo['nombre']}\n\n"
+        yield "| ID | Nombre | Concurso | Temas | Etiqueta |\n"
+        yield "|----|--------|----------|-------|----------|\n"
+        for p in grupo["problemas"]:
+            nombre = _celda(p.get("nombre") or p["id"])
+            if p.get("url"):
+                nombre = f"[{nombre}]({p['url']})"
+            yield (
+                f"| {_celda(p['id'])} | {nombre} | {_celda(p.get('concurso'))} "
+                f"| {_celda(', '.join(p.get('temas') or []))} | {_celda(p.get('etiqueta'))} |\n"
+            )
+        yield "\n"
+
+
+GENERADORES = {
+    "csv": generar_csv,
+    "json": generar_json,
+    "md": generar_markdown,
+}
+
+
+def _ruta_archivo(ruta):
+    """Ruta absoluta de un archivo referido, solo si está dentro del proyecto."""
+    if not ruta:
+        return None
+    archivo = (BASE_DIR / ruta).resolve()
+    if not archivo.is_relative_to(BASE_DIR) or not archivo.is_file():
+        return None
+    return archivo
+
+
+class _Salida:
+    """
+    Destino de escritura para ZipFile que solo acumula lo escrito desde la
+    última vez que se vació. No se puede hacer seek, así que zipfile escribe
+    los tamaños de cada entrada después de sus datos.
+    """
+
+    def __init__(self):
+        self.pedazos = []
+
+    def write(self, datos):
+        self.pedazos.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self.pedazos)
+        self.pedazos = []
+        return datos
+
+
+def generar_zip(seleccion):
+    salida = _Salida()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as paquete:
+        for nombre, generador in (
+            ("problemas.csv", generar_csv),
+            ("problemas.json", generar_json),
+            ("README.md", generar_markdown),
+        ):
+            with paquete.open(nombre, "w") as destino:
+                for texto in generador(seleccion):
+                    destino.write(texto.encode("utf-8"))
+                    if len(salida.pedazos) > 16:
+                        yield salida.vaciar()
+            yield salida.vaciar()
+
+        rutas = dict.fromkeys(
+            [t.get("ruta") for t in seleccion["temas"]]
+            + [p.get("ruta_solucion") for p in seleccion["problemas"]]
+        )
+        for ruta in rutas:
+            archivo = _ruta_archivo(ruta)
+            if archivo is None:
+                continue
+            # dentro del ZIP, con la misma ruta relativa que en el proyecto
+            with archivo.open("rb") as origen, paquete.open(
+                archivo.relative_to(BASE_DIR).as_posix(), "w"
+            ) as destino:
+                while pedazo := origen.read(TAMANO_PEDAZO):
+                    destino.write(pedazo)
+                    yield salida.vaciar()
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def exportar(formato, curso=None, filtros=None):
+    """
+    Regresa (generador, mimetype, nombre de archivo). La selección se hace
+    aquí, antes de empezar a generar, para que todo el documento salga de
+    los mismos datos aunque alguien edite mientras se descarga.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    seleccion = seleccionar(curso, filtros)
+    mimetype, extension = FORMATOS[formato]
+    generador = generar_zip if formato == "zip" else GENERADORES[formato]
+    nombre = (curso or "problemas").replace(" ", "_")
+    return generador(seleccion), mimetype, f"{nombre}.{extension}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Exporta problemas y material de curso.")
+    parser.add_argument("formato", choices=sorted(FORMATOS))
+    parser.add_argument("--curso", help="exportar solo lo usado en este curso")
+    parser.add_argument("-o", "--salida", help="archivo de salida (por defecto, stdout)")
+    args = parser.parse_args()
+
+    generador, _, _ = exportar(args.formato, curso=args.curso)
+    destino = open(args.salida, "wb") if args.salida else sys.stdout.buffer
+    with destino:
+        for pedazo in generador:
+            destino.write(pedazo if isinstance(pedazo, bytes) else pedazo.encode("utf-8"))
@@ -0,0 +1,373 @@
+"""
+Historial de cambios de las colecciones, para deshacer y para ver los datos
+en una fecha pasada.
+
+Cada guardado agrega una línea a <carpeta>/historial/<coleccion>.jsonl con
+solo los registros que cambiaron, con su valor de antes y de después:
+
+  {"n": 12, "fecha": "2026-10-17T18:04:11", "grupo": "...", "deshace": null,
+   "cambios": [{"op": "actualizar", "antes": {...}, "registro": {...}}, ...]}
+
+"grupo" junta los guardados de una misma transacción (p. ej. renombrar un
+tema toca problemas y cursos), que se deshacen juntos. "deshace" marca las
+entradas que revierten otro grupo.
+
+Para reconstruir una versión vieja sin aplicar todo el historial desde el
+principio se guardan puntos de control (<coleccion>.<n>.json, la colección
+completa tras la entrada n). Se escribe uno nuevo cuando los cambios
+acumulados desde el último ocupan tanto como la colección, así que
+reconstruir cualquier versión cuesta a lo más leer un punto y otro tanto
+de cambios, y el historial crece en proporción a lo editado (los puntos
+nunca ocupan más que los cambios que los separan).
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+import diario
+
+CARPETA = "historial"
+
+# los primeros puntos de control no valen la pena para colecciones diminutas
+MINIMO_PUNTO = 64 * 1024
+
+# Índice de cada archivo de historial, para no releerlo completo:
+#   ruta -> {"firma", "tamano" (bytes leídos), "entradas": [{"n", "fecha",
+#            "grupo", "deshace", "offset", "largo"}], "puntos": [n...],
+#            "desde_punto" (bytes de cambios tras el último punto), "punto" (bytes del último)}
+_indices = {}
+_bloqueo = threading.Lock()
+
+
+def carpeta_de(carpeta_datos):
+    return carpeta_datos / CARPETA
+
+
+def _ruta(carpeta, coleccion):
+    return carpeta / f"{coleccion}.jsonl"
+
+
+def _ruta_punto(carpeta, coleccion, n):
+    return carpeta / f"{coleccion}.{n}.json"
+
+
+def normalizar_fecha(texto):
+    """
+    'AAAA-MM-DD' (el final de ese día) o 'AAAA-MM-DDTHH:MM[:SS]' ->
+    'AAAA-MM-DDTHH:MM:SS'. Lanza ValueError si no es una fecha.
+    """
+    texto = texto.strip()
+    fecha = datetime.fromisoformat(texto)
+    if len(texto) == 10:
+        fecha = fecha.replace(hour=23, minute=59, second=59)
+    return fecha.replace(microsecond=0, tzinfo=None).isoformat()
+
+
+def _puntos(carpeta, coleccion):
+    prefijo = f"{coleccion}."
+    puntos = []
+    for archivo in carpeta.glob(f"{coleccion}.*.json"):
+        n = archivo.name[len(prefijo):-len(".json")]
+        if n.isdigit():
+            puntos.append(int(n))
+    return sorted(puntos)
+
+
+def _indice(carpeta, coleccion):
+    """Índice al día del historial de la colección (solo lee lo nuevo)."""
+    ruta = _ruta(carpeta, coleccion)
+    try:
+        st = ruta.stat()
+        firma = (st.st_ino, st.st_size)
+    except FileNotFoundError:
+        firma = None
+
+    with _bloqueo:
+        indice = _indices.get(ruta)
+        if indice is not None and indice["firma"] == firma:
+            return indice
+        if (
+            indice is None
+            or firma is None
+            or indice["firma"] is not None
+            and (firma[0] != indice["firma"][0] or firma[1] < indice["tamano"])
+        ):
+            # nuevo, borrado o reemplazado: se lee desde el principio
+            puntos = _puntos(carpeta, coleccion)
+            ultimo = puntos[-1] if puntos else None
+            indice = {
+                "firma": None,
+                "tamano": 0,
+                "entradas": [],
+                "puntos": puntos,
+                "desde_punto": 0,
+                "punto": _ruta_punto(carpeta, coleccion, ultimo).stat().st_size if puntos else 0,
+            }
+        if firma is not None:
+            with ruta.open("rb") as f:
+                f.seek(indice["tamano"])
+                offset = indice["tamano"]
+                for linea in f:
+                    if not linea.endswith(b"\n"):
+                        break  # escritura a medias: se ignora hasta que termine
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        offset += len(linea)
+                        continue
+                    indice["entradas"].append({
+                        "n": entrada["n"],
+                        "fecha": entrada["fecha"],
+                        "grupo": entrada["grupo"],
+                        "deshace": entrada.get("deshace"),
+                        "offset": offset,
+                        "largo": len(linea),
+                    })
+                    if not indice["puntos"] or entrada["n"] > indice["puntos"][-1]:
+                        indice["desde_punto"] += len(linea)
+                    offset += len(linea)
+                indice["tamano"] = offset
+        indice["firma"] = firma
+        _indices[ruta] = indice
+        return indice
+
+
+def _leer_entrada(carpeta, coleccion, entrada):
+    with _ruta(carpeta, coleccion).open("rb") as f:
+        f.seek(entrada["offset"])
+        return json.loads(f.read(entrada["largo"]))
+
+
+def _escribir_punto(carpeta, coleccion, n, registros):
+    ruta = _ruta_punto(carpeta, coleccion, n)
+    contenido = json.dumps(registros, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    tmp = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(contenido)
+    os.replace(tmp, ruta)
+    return len(contenido)
+
+
+def diferencias(antes, despues, campo):
+    """
+    Cambios de la lista 'antes' a la lista 'despues', con lo necesario
+    para revertirlos: el registro anterior de cada actualizado o borrado
+    (y su lugar) y el orden anterior de las claves.
+    """
+    anteriores = {r[campo]: r for r in antes}
+    cambios = diario.diferencias(anteriores, despues, campo)
+    posicion = None
+    orden = None  # claves tras cada "mover", para anotar dónde estaba antes
+    for cambio in cambios:
+        if cambio["op"] == "borrar":
+            if posicion is None:
+                posicion = {clave: i for i, clave in enumerate(anteriores)}
+            cambio["antes"] = anteriores[cambio["clave"]]
+            cambio["indice"] = posicion[cambio["clave"]]
+        elif cambio["op"] == "actualizar":
+            cambio["antes"] = anteriores[cambio["registro"][campo]]
+        elif cambio["op"] == "ordenar":
+            cambio["antes"] = list(anteriores)
+        elif cambio["op"] == "mover":
+            if orden is None:
+                # los "mover" van al final, después de borrar e insertar
+                nuevas = {r[campo] for r in despues}
+                orden = [c for c in anteriores if c in nuevas]
+                orden += [r[campo] for r in despues if r[campo] not in anteriores]
+            i = orden.index(cambio["clave"])
+            cambio["antes_de_mover"] = orden[i - 1] if i else None
+            diario.mover(orden, cambio["clave"], cambio["despues_de"])
+    return cambios
+
+
+def registrar(carpeta, coleccion, antes, despues, campo, grupo, deshace=None):
+    """
+    Anota en el historial el paso de 'antes' a 'despues' (listas de
+    registros). Debe llamarse dentro de la transacción que hizo el guardado.
+    """
+    cambios = diferencias(antes, despues, campo)
+    if not cambios:
+        return
+
+    carpeta.mkdir(parents=True, exist_ok=True)
+    indice = _indice(carpeta, coleccion)
+    if not indice["entradas"] and not indice["puntos"]:
+        # primer cambio: el estado de partida es el punto 0
+        indice["punto"] = _escribir_punto(carpeta, coleccion, 0, antes)
+        indice["puntos"].append(0)
+
+    n = indice["entradas"][-1]["n"] + 1 if indice["entradas"] else 1
+    ruta = _ruta(carpeta, coleccion)
+    if ruta.exists() and ruta.stat().st_size > indice["tamano"]:
+        # restos de una escritura que se cortó
+        os.truncate(ruta, indice["tamano"])
+    linea = json.dumps({
+        "n": n,
+        "fecha": datetime.now().replace(microsecond=0).isoformat(),
+        "grupo": grupo,
+        "deshace": deshace,
+        "cambios": cambios,
+    }, ensure_ascii=False).encode("utf-8") + b"\n"
+    with ruta.open("ab") as f:
+        f.write(linea)
+        f.flush()
+        os.fsync(f.fileno())
+
+    indice = _indice(carpeta, coleccion)
+    if indice["desde_punto"] >= max(indice["punto"], MINIMO_PUNTO):
+        tamano = _escribir_punto(carpeta, coleccion, n, despues)
+        with _bloqueo:
+            indice["puntos"].append(n)
+            indice["punto"] = tamano
+            indice["desde_punto"] = 0
+
+
+def posicion(carpeta, coleccion, fecha):
+    """
+    Número de la última entrada hecha hasta 'fecha' (normalizada); 0 si es
+    anterior a todo el historial y None si la colección no tiene historial.
+    """
+    indice = _indice(carpeta, coleccion)
+    if not indice["entradas"]:
+        return None
+    n = 0
+    for entrada in indice["entradas"]:
+        if entrada["fecha"] > fecha:
+            break
+        n = entrada["n"]
+    return n
+
+
+def reconstruir(carpeta, coleccion, campo, n):
+    """Registros de la colección tal como quedaron tras la entrada n."""
+    indice = _indice(carpeta, coleccion)
+    punto = max(p for p in indice["puntos"] if p <= n)
+    registros = json.loads(_ruta_punto(carpeta, coleccion, punto).read_bytes())
+    for entrada in indice["entradas"]:
+        if punto < entrada["n"] <= n:
+            registros = diario.aplicar(registros, _leer_entrada(carpeta, coleccion, entrada)["cambios"], campo)
+    return registros
+
+
+def _entradas(carpeta, colecciones):
+    """
+    [(coleccion, entrada)] de todas las colecciones, de la más reciente a
+    la más vieja (los grupos se numeran en orden de tiempo), y el conjunto
+    de grupos deshechos.
+    """
+    entradas = []
+    deshechos = set()
+    for coleccion in colecciones:
+        for entrada in _indice(carpeta, coleccion)["entradas"]:
+            entradas.append((coleccion, entrada))
+            if entrada["deshace"]:
+                deshechos.add(entrada["deshace"])
+    entradas.sort(key=lambda ce: (ce[1]["grupo"], ce[1]["n"]), reverse=True)
+    return entradas, deshechos
+
+
+def _pendientes(carpeta, colecciones):
+    """
+    Entradas que todavía se pueden deshacer, de la más reciente a la más
+    vieja: las que no son un deshacer ni fueron deshechas.
+    """
+    entradas, deshechos = _entradas(carpeta, colecciones)
+    return [
+        (coleccion, entrada) for coleccion, entrada in entradas
+        if not entrada["deshace"] and entrada["grupo"] not in deshechos
+    ]
+
+
+def ultimo_grupo(carpeta, colecciones):
+    """
+    El último grupo de cambios que se puede deshacer: {"grupo", "fecha",
+    "cambios": {coleccion: [cambios de cada entrada, de la última a la primera]}},
+    o None si no hay.
+    """
+    pendientes = _pendientes(carpeta, colecciones)
+    if not pendientes:
+        return None
+    grupo = pendientes[0][1]["grupo"]
+    resultado = {"grupo": grupo, "fecha": pendientes[0][1]["fecha"], "cambios": {}}
+    for coleccion, entrada in pendientes:
+        if entrada["grupo"] != grupo:
+            break
+        resultado["cambios"].setdefault(coleccion, []).append(
+            _leer_entrada(carpeta, coleccion, entrada)["cambios"]
+        )
+    return resultado
+
+
+def revertir(registros, entradas, campo):
+    """
+    Aplica al revés los cambios de 'entradas' (de la última a la primera)
+    sobre la lista 'registros'. Lanza ValueError si algún registro cambió
+    después y revertirlo perdería ese cambio.
+    """
+    por_clave = {r[campo]: r for r in registros}
+    claves = list(por_clave)
+    for cambios in entradas:
+        # los borrados se reinsertan al final y de menor a mayor índice,
+        # para que cada uno vuelva exactamente a su lugar
+        orden = [c for c in reversed(cambios) if c["op"] != "borrar"]
+        orden += [c for c in cambios if c["op"] == "borrar"]
+        for cambio in orden:
+            op = cambio["op"]
+            if op == "ordenar":
+                if claves == cambio["claves"]:
+                    presentes = set(claves)
+                    anteriores = [c for c in cambio["antes"] if c in presentes]
+                    vistas = set(anteriores)
+                    claves = anteriores + [c for c in claves if c not in vistas]
+                continue
+            if op == "mover":
+                diario.mover(claves, cambio["clave"], cambio["antes_de_mover"])
+                continue
+
+            clave = cambio["clave"] if op == "borrar" else cambio["registro"][campo]
+            esperado = None if op == "borrar" else cambio["registro"]
+            if por_clave.get(clave) != esperado:
+                raise ValueError(f"'{clave}' cambió después; no se puede deshacer sin perder ese cambio")
+            if op == "insertar":
+                del por_clave[clave]
+                claves.remove(clave)
+            elif op == "actualizar":
+                por_clave[clave] = cambio["antes"]
+            else:
+                por_clave[clave] = cambio["antes"]
+                claves.insert(min(cambio["indice"], len(claves)), clave)
+    return [por_clave[c] for c in claves]
+
+
+def recientes(carpeta, colecciones, limite=50):
+    """
+    Los últimos 'limite' grupos de cambios, del más reciente al más viejo:
+    [{"grupo", "fecha", "deshace", "deshecho", "colecciones": {coleccion:
+    {"insertados", "actualizados", "borrados", "reordenado"}}}].
+    """
+    entradas, deshechos = _entradas(carpeta, colecciones)
+    grupos = []
+    for coleccion, entrada in entradas:
+        if not grupos or grupos[-1]["grupo"] != entrada["grupo"]:
+            if len(grupos) == limite:
+                break
+            grupos.append({
+                "grupo": entrada["grupo"],
+                "fecha": entrada["fecha"],
+                "deshace": entrada["deshace"],
+                "deshecho": entrada["grupo"] in deshechos,
+                "colecciones": {},
+            })
+        resumen = grupos[-1]["colecciones"].setdefault(coleccion, {
+            "insertados": 0, "actualizados": 0, "borrados": 0, "reordenado": False,
+        })
+        for cambio in _leer_entrada(carpeta, coleccion, entrada)["cambios"]:
+            if cambio["op"] == "insertar":
+                resumen["insertados"] += 1
+            elif cambio["op"] == "actualizar":
+                resumen["actualizados"] += 1
+            elif cambio["op"] == "borrar":
+                resumen["borrados"] += 1
+            else:
+                resumen["reordenado"] = True
+    return grupos
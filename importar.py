@@ -0,0 +1,247 @@
+"""
+Importación masiva de problemas, concursos y temas desde CSV o JSONL.
+
+Cada fila es un registro. La columna 'tipo' dice qué es ("problema" si se
+omite, "concurso" o "tema"):
+
+  problema: id, nombre, url, concurso, temas, ruta_solucion, etiqueta
+            (en CSV los temas van separados por ';')
+  concurso: nombre, anio, categoria
+  tema:     nombre, categoria, ruta
+
+Las filas se leen una por una. Los ids y nombres se revisan contra
+conjuntos (O(1) por fila) y, si no hubo errores, todo se guarda al final
+con una sola escritura por colección. Si hay cualquier error no se guarda
+nada. Con crear_faltantes=True, los concursos y temas que mencionan los
+problemas y no existen se crean solos; si no, son error.
+
+Desde la terminal:
+
+    python importar.py gym.csv [--simulacro] [--no-crear]
+"""
+import csv
+import io
+import json
+
+from datos import (
+    cargar_temas,
+    guardar_temas,
+    cargar_concursos,
+    guardar_concursos,
+    sincronizar_categorias_concursos,
+    cargar_problemas,
+    guardar_problemas,
+    transaccion,
+)
+
+
+def leer_filas(archivo, formato):
+    """
+    Genera (número de línea, fila) a partir de un archivo de texto abierto.
+    'formato' es "csv" o "jsonl".
+    """
+    if formato == "csv":
+        lector = csv.DictReader(archivo)
+        for fila in lector:
+            yield lector.line_num, fila
+    elif formato == "jsonl":
+        for num, linea in enumerate(archivo, start=1):
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+            except ValueError as e:
+                yield num, {"_error": f"JSON inválido: {e}"}
+                continue
+            yield num, fila if isinstance(fila, dict) else {"_error": "La línea no es un objeto JSON"}
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def formato_de(nombre_archivo):
+    return "jsonl" if nombre_archivo.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def _texto(fila, campo):
+    valor = fila.get(campo)
+    return "" if valor is None else str(valor).strip()
+
+
+def _lista(fila, campo):
+    valor = fila.get(campo)
+    if isinstance(valor, list):
+        return [str(v).strip() for v in valor if str(v).strip()]
+    return [v.strip() for v in _texto(fila, campo).split(";") if v.strip()]
+
+
+def _anio(fila):
+    try:
+        return int(_texto(fila, "anio")) if _texto(fila, "anio") else None
+    except ValueError:
+        return None
+
+
+def importar(filas, crear_faltantes=True, simulacro=False):
+    """
+    Importa las filas que genera leer_filas(). Regresa un reporte:
+      {"problemas": [...ids nuevos], "concursos": [...], "temas": [...],
+       "errores": [(línea, mensaje), ...], "guardado": bool}
+    """
+    with transaccion():
+        temas = cargar_temas()
+        concursos = cargar_concursos()
+        problemas = cargar_problemas()
+
+        ids = {p["id"] for p in problemas}
+        nombres_temas = {t["nombre"] for t in temas}
+        nombres_concursos = {c["nombre"] for c in concursos}
+        siguiente_orden = max((t.get("orden", 0) for t in temas), default=0) + 1
+
+        reporte = {"problemas": [], "concursos": [], "temas": [], "errores": [], "guardado": False}
+        errores = reporte["errores"]
+
+        # creados solos por aparecer en un problema; si más adelante viene
+        # su propia fila, se completan sus datos en vez de marcar duplicado
+        autocreados = {}
+
+        def nuevo_tema(nombre, categoria="", ruta=""):
+            nonlocal siguiente_orden
+            tema = {
+                "nombre": nombre,
+                "categoria": categoria,
+                "orden": siguiente_orden,
+                "ruta": ruta,
+            }
+            temas.append(tema)
+            siguiente_orden += 1
+            nombres_temas.add(nombre)
+            reporte["temas"].append(nombre)
+            return tema
+
+        def nuevo_concurso(nombre, anio=None, categoria=""):
+            concurso = {"nombre": nombre, "anio": anio, "categoria": categoria}
+            concursos.append(concurso)
+            nombres_concursos.add(nombre)
+            reporte["concursos"].append(nombre)
+            return concurso
+
+        for num, fila in filas:
+            if "_error" in fila:
+                errores.append((num, fila["_error"]))
+                continue
+
+            tipo = _texto(fila, "tipo").lower() or "problema"
+            if tipo == "tema":
+                nombre = _texto(fila, "nombre")
+                if not nombre or "," in nombre:
+                    errores.append((num, "El tema necesita un nombre sin comas"))
+                elif ("tema", nombre) in autocreados:
+                    autocreados.pop(("tema", nombre)).update(
+                        categoria=_texto(fila, "categoria"), ruta=_texto(fila, "ruta")
+                    )
+                elif nombre in nombres_temas:
+                    errores.append((num, f"El tema '{nombre}' ya existe"))
+                else:
+                    nuevo_tema(nombre, _texto(fila, "categoria"), _texto(fila, "ruta"))
+
+            elif tipo == "concurso":
+                nombre = _texto(fila, "nombre")
+                if not nombre:
+                    errores.append((num, "El concurso necesita un nombre"))
+                elif ("concurso", nombre) in autocreados:
+                    autocreados.pop(("concurso", nombre)).update(
+                        anio=_anio(fila), categoria=_texto(fila, "categoria")
+                    )
+                elif nombre in nombres_concursos:
+                    errores.append((num, f"El concurso '{nombre}' ya existe"))
+                else:
+                    nuevo_concurso(nombre, _anio(fila), _texto(fila, "categoria"))
+
+            elif tipo == "problema":
+                problema_id = _texto(fila, "id")
+                if not problema_id:
+                    errores.append((num, "El problema necesita un id"))
+                    continue
+                if problema_id in ids:
+                    errores.append((num, f"Ya existe un problema con id '{problema_id}'"))
+                    continue
+
+                concurso = _texto(fila, "concurso")
+                if concurso and concurso not in nombres_concursos:
+                    if not crear_faltantes:
+                        errores.append((num, f"No existe el concurso '{concurso}'"))
+                        continue
+                    autocreados[("concurso", concurso)] = nuevo_concurso(concurso)
+
+                temas_problema = _lista(fila, "temas")
+                faltantes = [t for t in temas_problema if t not in nombres_temas]
+                if faltantes and not crear_faltantes:
+                    errores.append((num, f"No existen los temas: {', '.join(faltantes)}"))
+                    continue
+                for t in dict.fromkeys(faltantes):
+                    if "," in t:
+                        errores.append((num, f"Nombre de tema inválido: '{t}'"))
+                    else:
+                        autocreados[("tema", t)] = nuevo_tema(t)
+
+                problemas.append({
+                    "id": problema_id,
+                    "nombre": _texto(fila, "nombre"),
+                    "url": _texto(fila, "url"),
+                    "concurso": concurso,
+                    "temas": temas_problema,
+                    "ruta_solucion": _texto(fila, "ruta_solucion"),
+                    "etiqueta": _texto(fila, "etiqueta"),
+                })
+                ids.add(problema_id)
+                reporte["problemas"].append(problema_id)
+
+            else:
+                errores.append((num, f"Tipo desconocido: '{tipo}'"))
+
+        if simulacro or errores:
+            return reporte
+
+        if reporte["temas"]:
+            guardar_temas(temas)
+        if reporte["concursos"]:
+            guardar_concursos(concursos)
+            sincronizar_categorias_concursos()
+        if reporte["problemas"]:
+            guardar_problemas(problemas)
+        reporte["guardado"] = True
+        return reporte
+
+
+def importar_binario(flujo, nombre_archivo, **opciones):
+    """Igual que importar(), a partir de un archivo binario (p. ej. un upload)."""
+    texto = io.TextIOWrapper(flujo, encoding="utf-8-sig", newline="")
+    return importar(leer_filas(texto, formato_de(nombre_archivo)), **opciones)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Importa problemas, concursos y temas.")
+    parser.add_argument("archivo", help="archivo .csv o .jsonl")
+    parser.add_argument("--simulacro", action="store_true", help="solo reportar, no guardar")
+    parser.add_argument("--no-crear", action="store_true",
+                        help="no crear concursos ni temas faltantes (son error)")
+    args = parser.parse_args()
+
+    with open(args.archivo, "rb") as f:
+        reporte = importar_binario(
+            f, args.archivo, crear_faltantes=not args.no_crear, simulacro=args.simulacro,
+        )
+
+    print(f"Problemas nuevos: {len(reporte['problemas'])}")
+    print(f"Concursos nuevos: {', '.join(reporte['concursos']) or '—'}")
+    print(f"Temas nuevos: {', '.join(reporte['temas']) or '—'}")
+    for num, mensaje in reporte["errores"]:
+        print(f"  línea {num}: {mensaje}", file=sys.stderr)
+    if reporte["guardado"]:
+        print("Guardado.")
+    else:
+        print("No se guardó nada" + (" (simulacro)." if args.simulacro else "."))
+        sys.exit(1 if reporte["errores"] else 0)
@@ -0,0 +1,570 @@
+import threading
+from bisect import bisect_left, insort
+
+import diario
+from datos import (
+    al_guardar,
+    cargar_temas,
+    cargar_problemas,
+    cargar_cursos,
+    cargar_compartido,
+    conjunto_actual,
+    firma_colecciones,
+    firma_instantanea,
+    leer_instantanea,
+    guardar_instantanea,
+)
+from metricas import fase, recalcular
+
+SIN_TEMA_PRINCIPAL = "Sin tema principal"
+
+
+def indice_orden_temas(temas):
+    """
+    Índice nombre de tema -> 'orden'. Se construye una sola vez por lista de
+    temas y se reutiliza para todos los problemas.
+    """
+    return {t["nombre"]: t.get("orden", 0) for t in temas}
+
+
+def ordenar_temas(temas, nombres):
+    """
+    Renumera 'orden' según la lista 'nombres' (los nombres que no existen
+    se ignoran). Los temas que no vienen en la lista van al final,
+    conservando su orden relativo anterior. Regresa la lista nueva.
+    """
+    tema_por_nombre = {t["nombre"]: t for t in temas}
+    nuevos = []
+    for nombre in dict.fromkeys(nombres):
+        tema = tema_por_nombre.get(nombre)
+        if tema:
+            nuevos.append(tema)
+    vistos = {t["nombre"] for t in nuevos}
+    nuevos += [t for t in temas if t["nombre"] not in vistos]
+    for orden, tema in enumerate(nuevos, start=1):
+        tema["orden"] = orden
+    return nuevos
+
+
+def calcular_tema_principal(problema, orden_por_nombre):
+    """
+    Devuelve el nombre del 'tema principal' del problema:
+    el tema con mayor 'orden' de entre los temas asociados.
+    Si no tiene temas, devuelve 'Sin tema principal'.
+
+    'orden_por_nombre' es el índice que regresa indice_orden_temas().
+    """
+    nombres_temas_problema = problema.get("temas") or []
+    if not nombres_temas_problema:
+        return SIN_TEMA_PRINCIPAL
+
+    # usamos -1 si el tema no existe en la lista de temas
+    return max(
+        nombres_temas_problema,
+        key=lambda nombre: orden_por_nombre.get(nombre, -1)
+    )
+
+
+def es_introductorio(problema):
+    # etiqueta == 'introductorio', case-insensitive
+    return (problema.get("etiqueta", "") or "").strip().lower() == "introductorio"
+
+
+def _armar_grupos(problemas, temas, principal_por_id):
+    grupos_dict = {}  # nombre_tema_principal -> lista de problemas
+    for p in problemas:
+        grupos_dict.setdefault(principal_por_id[p["id"]], []).append(p)
+
+    # Orden de grupos: primero los temas en su orden, luego extra, luego 'Sin tema principal'
+    nombres_grupos_ordenados = [t["nombre"] for t in temas if t["nombre"] in grupos_dict]
+
+    vistos = set(nombres_grupos_ordenados)
+    otros = sorted(
+        nombre for nombre in grupos_dict
+        if nombre not in vistos and nombre != SIN_TEMA_PRINCIPAL
+    )
+    nombres_grupos_ordenados.extend(otros)
+
+    if SIN_TEMA_PRINCIPAL in grupos_dict:
+        nombres_grupos_ordenados.append(SIN_TEMA_PRINCIPAL)
+
+    grupos = []
+    for nombre in nombres_grupos_ordenados:
+        lista = grupos_dict[nombre]
+        # Introductorios primero, luego el resto; ambos en el orden original
+        intro = [p for p in lista if es_introductorio(p)]
+        resto = [p for p in lista if not es_introductorio(p)]
+        grupos.append({
+            "nombre": nombre,
+            "problemas": intro + resto,
+        })
+
+    return grupos
+
+
+def agrupar_problemas_por_tema_principal(problemas, temas):
+    """
+    Regresa una lista de grupos:
+    [
+      {
+        "nombre": "Segment Tree",
+        "problemas": [ ... lista de problemas ... ]
+      },
+      ...
+    ]
+    Los grupos se ordenan por el 'orden' del Tema.
+    Dentro de cada grupo:
+      - primero los etiquetados como Introductorios,
+      - luego el resto en el orden original.
+    """
+    orden_por_nombre = indice_orden_temas(temas)
+    principal_por_id = {
+        p["id"]: calcular_tema_principal(p, orden_por_nombre) for p in problemas
+    }
+    return _armar_grupos(problemas, temas, principal_por_id)
+
+
+# Agrupación vigente de los problemas guardados, para no reagrupar todo el
+# banco en cada vista. Si solo cambiaron los problemas, se sacan de su grupo
+# y se vuelven a meter en el nuevo únicamente los que cambiaron, se
+# borraron o cambiaron de lugar; los demás grupos ni se tocan. Si cambiaron
+# los temas se rearma todo, pero el tema principal solo se recalcula para
+# los problemas que usan algún tema que cambió de orden. Hay una por
+# conjunto de datos.
+def _agrupacion_nueva():
+    return {
+        "firma": None,
+        "firma_temas": None,
+        "orden": {},      # índice nombre de tema -> orden con el que se calculó
+        "principal": {},  # id -> (tupla de temas, tema principal)
+        "problemas": {},  # id -> problema, en orden: lo que está agrupado
+        "posicion": {},   # id -> lugar en esa lista
+        "grupos": [],     # [{"nombre", "problemas", "introductorios"}]
+        "bloqueo": threading.Lock(),
+    }
+
+
+def _agrupacion_del_conjunto():
+    return conjunto_actual().derivado("agrupacion", _agrupacion_nueva)
+
+
+def _posicion_en(grupo, problema, posicion):
+    """Dónde va (o está) 'problema' en el grupo: introductorios primero y, en cada parte, por 'posicion'."""
+    intro = grupo["introductorios"]
+    lo, hi = (0, intro) if es_introductorio(problema) else (intro, len(grupo["problemas"]))
+    return bisect_left(grupo["problemas"], posicion[problema["id"]], lo, hi, key=lambda p: posicion[p["id"]])
+
+
+def _ordenar_grupos(grupos, temas):
+    """Los grupos en el orden de _armar_grupos(): temas, otros y 'Sin tema principal'."""
+    por_nombre = {g["nombre"]: g for g in grupos}
+    nombres = [t["nombre"] for t in temas if t["nombre"] in por_nombre]
+    vistos = set(nombres)
+    nombres += sorted(n for n in por_nombre if n not in vistos and n != SIN_TEMA_PRINCIPAL)
+    if SIN_TEMA_PRINCIPAL in por_nombre:
+        nombres.append(SIN_TEMA_PRINCIPAL)
+    return [por_nombre[n] for n in nombres]
+
+
+def _rearmar(agrupacion, temas, problemas, principal):
+    grupos = _armar_grupos(problemas, temas, {pid: v[1] for pid, v in principal.items()})
+    for g in grupos:
+        g["introductorios"] = sum(1 for p in g["problemas"] if es_introductorio(p))
+    agrupacion.update(
+        principal=principal,
+        problemas={p["id"]: p for p in problemas},
+        posicion={p["id"]: i for i, p in enumerate(problemas)},
+        grupos=grupos,
+    )
+
+
+def _actualizar_problemas(agrupacion, temas, problemas):
+    """
+    Los temas no cambiaron: mueve solo los problemas distintos a los ya
+    agrupados. Regresa False si conviene rearmar todo (ids repetidos o
+    casi todo cambió de lugar).
+    """
+    anteriores = agrupacion["problemas"]
+    actuales = {p["id"]: p for p in problemas}
+    if len(actuales) != len(problemas):
+        return False
+
+    cambiados = {pid for pid, p in actuales.items() if anteriores.get(pid) != p}
+    borrados = anteriores.keys() - actuales.keys()
+    quedan = [pid for pid in actuales if pid in anteriores]
+    if quedan != [pid for pid in anteriores if pid in actuales]:
+        # cambiaron de lugar: se mueven los que no están en la subsecuencia
+        # más larga que quedó en orden
+        movidos = diario.movimientos([pid for pid in anteriores if pid in actuales], quedan)
+        if movidos is None:
+            return False
+        cambiados |= {m["clave"] for m in movidos}
+    if not cambiados and not borrados:
+        return True
+
+    grupos = {g["nombre"]: g for g in agrupacion["grupos"]}
+    principal = agrupacion["principal"]
+    posicion = agrupacion["posicion"]
+    for pid in (cambiados | borrados) & anteriores.keys():
+        grupo = grupos[principal[pid][1]]
+        i = _posicion_en(grupo, anteriores[pid], posicion)
+        del grupo["problemas"][i]
+        if es_introductorio(anteriores[pid]):
+            grupo["introductorios"] -= 1
+        if not grupo["problemas"]:
+            del grupos[grupo["nombre"]]
+        if pid in borrados:
+            del principal[pid]
+
+    posicion = {p["id"]: i for i, p in enumerate(problemas)}
+    orden_por_nombre = agrupacion["orden"]
+    for pid in cambiados:
+        p = actuales[pid]
+        clave = tuple(p.get("temas") or ())
+        previo = principal.get(pid)
+        if not previo or previo[0] != clave:
+            principal[pid] = previo = (clave, calcular_tema_principal(p, orden_por_nombre))
+        grupo = grupos.get(previo[1])
+        if grupo is None:
+            grupo = grupos[previo[1]] = {"nombre": previo[1], "problemas": [], "introductorios": 0}
+        grupo["problemas"].insert(_posicion_en(grupo, p, posicion), p)
+        if es_introductorio(p):
+            grupo["introductorios"] += 1
+
+    agrupacion.update(
+        problemas=actuales,
+        posicion=posicion,
+        grupos=_ordenar_grupos(grupos.values(), temas),
+    )
+    return True
+
+
+@fase("agrupacion")
+def _actualizar_agrupacion(agrupacion):
+    """Pone al día la agrupación del conjunto actual; se llama con agrupacion["bloqueo"] tomado."""
+    firma = firma_colecciones("temas", "problemas")
+    if not recalcular("agrupacion", firma, agrupacion["firma"]):
+        return agrupacion
+
+    firma_temas = firma_colecciones("temas")
+    temas = cargar_compartido("temas")
+    if agrupacion["firma"] is not None and firma_temas == agrupacion["firma_temas"]:
+        if _actualizar_problemas(agrupacion, temas, cargar_compartido("problemas")):
+            agrupacion["firma"] = firma
+            return agrupacion
+
+    # la primera vez en este proceso, la agrupación puede venir de la
+    # instantánea del arranque anterior (ver instantanea.py)
+    en_disco = firma_instantanea("temas", "problemas") if agrupacion["firma"] is None else None
+    guardada = leer_instantanea("agrupacion", en_disco)
+
+    problemas = cargar_compartido("problemas")
+    orden_por_nombre = indice_orden_temas(temas)
+    agrupacion.update(firma=firma, firma_temas=firma_temas)
+
+    if guardada is not None and firma_instantanea("temas", "problemas") == en_disco:
+        # grupos: [(nombre, posiciones en 'problemas')]; la firma se vuelve
+        # a revisar por si otro proceso escribió mientras se cargaba
+        agrupacion.update(
+            orden=orden_por_nombre,
+            principal=guardada["principal"],
+            problemas={p["id"]: p for p in problemas},
+            posicion={p["id"]: i for i, p in enumerate(problemas)},
+            grupos=[
+                {"nombre": nombre, "problemas": [problemas[i] for i in posiciones]}
+                for nombre, posiciones in guardada["grupos"]
+            ],
+        )
+        for g in agrupacion["grupos"]:
+            g["introductorios"] = sum(1 for p in g["problemas"] if es_introductorio(p))
+        return agrupacion
+
+    orden_anterior = agrupacion["orden"]
+    reordenados = {
+        nombre for nombre in orden_por_nombre.keys() | orden_anterior.keys()
+        if orden_por_nombre.get(nombre) != orden_anterior.get(nombre)
+    }
+
+    anterior = agrupacion["principal"]
+    principal = {}
+    for p in problemas:
+        clave = tuple(p.get("temas") or ())
+        previo = anterior.get(p["id"])
+        if previo and previo[0] == clave and reordenados.isdisjoint(clave):
+            principal[p["id"]] = previo
+        else:
+            principal[p["id"]] = (clave, calcular_tema_principal(p, orden_por_nombre))
+
+    agrupacion["orden"] = orden_por_nombre
+    _rearmar(agrupacion, temas, problemas, principal)
+    return agrupacion
+
+
+def guardar_instantanea_agrupacion():
+    """
+    Guarda la agrupación vigente en su instantánea, para el próximo
+    arranque. Se llama después de guardar temas o problemas y desde
+    cli.py --instantaneas; las vistas solo la leen.
+    """
+    en_disco = firma_instantanea("temas", "problemas")
+    if en_disco is None:
+        return
+    agrupacion = _agrupacion_del_conjunto()
+    with agrupacion["bloqueo"]:
+        _actualizar_agrupacion(agrupacion)
+        if firma_instantanea("temas", "problemas") != en_disco:
+            return  # otro proceso escribió mientras tanto
+        posicion = agrupacion["posicion"]  # id -> lugar en cargar_problemas()
+        if len(posicion) != len(cargar_compartido("problemas")):
+            return  # con ids repetidos las posiciones no alcanzan
+        guardar_instantanea("agrupacion", en_disco, {
+            "principal": agrupacion["principal"],
+            "grupos": [
+                (g["nombre"], [posicion[p["id"]] for p in g["problemas"]])
+                for g in agrupacion["grupos"]
+            ],
+        })
+
+
+@al_guardar
+def _instantanea_tras_guardar(coleccion):
+    if coleccion in ("temas", "problemas"):
+        guardar_instantanea_agrupacion()
+
+
+def cargar_grupos_problemas():
+    """
+    Igual que agrupar_problemas_por_tema_principal(cargar_problemas(),
+    cargar_temas()), pero reutilizando la agrupación ya calculada mientras
+    no cambien los datos. Los dicts de problema se comparten entre
+    llamadas: son de solo lectura.
+    """
+    agrupacion = _agrupacion_del_conjunto()
+    with agrupacion["bloqueo"]:
+        _actualizar_agrupacion(agrupacion)
+        return [
+            {"nombre": g["nombre"], "problemas": list(g["problemas"])}
+            for g in agrupacion["grupos"]
+        ]
+
+
+def problemas_del_grupo(nombre):
+    """
+    Problemas del grupo 'nombre' (introductorios primero), igual que en
+    cargar_grupos_problemas() pero sin copiar los demás grupos.
+    """
+    agrupacion = _agrupacion_del_conjunto()
+    with agrupacion["bloqueo"]:
+        _actualizar_agrupacion(agrupacion)
+        for g in agrupacion["grupos"]:
+            if g["nombre"] == nombre:
+                return list(g["problemas"])
+    return []
+
+
+def tema_principal_por_id():
+    """id de problema -> nombre de su tema principal (según lo guardado)."""
+    agrupacion = _agrupacion_del_conjunto()
+    with agrupacion["bloqueo"]:
+        _actualizar_agrupacion(agrupacion)
+        return {pid: v[1] for pid, v in agrupacion["principal"].items()}
+
+
+def juez_de(problema_id):
+    """Juez a partir del prefijo del id: 'CF-242E' -> 'CF', 'CSES-1143' -> 'CSES'."""
+    prefijo, separador, _ = problema_id.partition("-")
+    return prefijo.upper() if separador else ""
+
+
+def _valores_faceta(problema):
+    """(faceta, valor) de un problema para los índices invertidos."""
+    for tema in dict.fromkeys(problema.get("temas") or []):
+        yield ("tema", tema)
+    if problema.get("concurso"):
+        yield ("concurso", problema["concurso"])
+    etiqueta = (problema.get("etiqueta") or "").strip().lower()
+    if etiqueta:
+        yield ("etiqueta", etiqueta)
+    juez = juez_de(problema["id"])
+    if juez:
+        yield ("juez", juez)
+
+
+class IndiceFacetas:
+    """
+    Índices invertidos faceta -> valor -> conjunto de ids de problema,
+    más curso -> ids usados y la lista ordenada de ids (para prefijos).
+    Se actualiza por registro: poner()/quitar() solo tocan los valores del
+    problema que cambió.
+    """
+
+    FACETAS = ("tema", "concurso", "etiqueta", "juez")
+
+    def __init__(self):
+        self.ids = {f: {} for f in self.FACETAS}
+        self.registros = {}      # id -> problema indexado
+        self.posicion = {}       # id -> lugar en el banco (para el orden)
+        self.ids_ordenados = []  # ids en orden alfabético
+        self.usados_por_curso = {}
+
+    def quitar(self, problema_id):
+        problema = self.registros.pop(problema_id, None)
+        if problema is None:
+            return
+        for faceta, valor in _valores_faceta(problema):
+            ids = self.ids[faceta][valor]
+            ids.discard(problema_id)
+            if not ids:
+                del self.ids[faceta][valor]
+        del self.ids_ordenados[bisect_left(self.ids_ordenados, problema_id)]
+
+    def poner(self, problema):
+        self.quitar(problema["id"])
+        self.registros[problema["id"]] = problema
+        for faceta, valor in _valores_faceta(problema):
+            self.ids[faceta].setdefault(valor, set()).add(problema["id"])
+        insort(self.ids_ordenados, problema["id"])
+
+    def con_prefijo(self, prefijo):
+        i = bisect_left(self.ids_ordenados, prefijo)
+        resultado = set()
+        while i < len(self.ids_ordenados) and self.ids_ordenados[i].startswith(prefijo):
+            resultado.add(self.ids_ordenados[i])
+            i += 1
+        return resultado
+
+
+def _facetas_nuevas():
+    return {
+        "indice": IndiceFacetas(),
+        "estado": {"problemas": None, "cursos": None},
+        "bloqueo": threading.Lock(),
+    }
+
+
+def _facetas_del_conjunto():
+    return conjunto_actual().derivado("facetas", _facetas_nuevas)
+
+
+@fase("indices")
+def _sincronizar_facetas(actual):
+    """Pone al día el índice de facetas; se llama con actual["bloqueo"] tomado."""
+    indice = actual["indice"]
+    estado = actual["estado"]
+    firma_problemas = firma_colecciones("problemas")
+    if recalcular("facetas", firma_problemas, estado["problemas"]):
+        problemas = cargar_problemas()
+        actuales = {p["id"] for p in problemas}
+        for problema_id in indice.registros.keys() - actuales:
+            indice.quitar(problema_id)
+        for p in problemas:
+            if indice.registros.get(p["id"]) != p:
+                indice.poner(p)
+        indice.posicion = {p["id"]: i for i, p in enumerate(problemas)}
+        estado["problemas"] = firma_problemas
+
+    firma_cursos = firma_colecciones("cursos")
+    if recalcular("facetas_cursos", firma_cursos, estado["cursos"]):
+        indice.usados_por_curso = {
+            c["nombre"]: set(c.get("usados_problemas") or []) for c in cargar_cursos()
+        }
+        estado["cursos"] = firma_cursos
+
+
+def _filtrar(
+    indice,
+    temas=(),
+    todos_los_temas=False,
+    concursos=(),
+    etiquetas=(),
+    jueces=(),
+    usado_en=None,
+    no_usado_en=None,
+    prefijo="",
+):
+    conjuntos = []
+
+    def union(faceta, valores):
+        ids = set()
+        for valor in valores:
+            ids |= indice.ids[faceta].get(valor, set())
+        return ids
+
+    if temas:
+        if todos_los_temas:
+            conjuntos.extend(indice.ids["tema"].get(t, set()) for t in temas)
+        else:
+            conjuntos.append(union("tema", temas))
+    if concursos:
+        conjuntos.append(union("concurso", concursos))
+    if etiquetas:
+        conjuntos.append(union("etiqueta", [e.strip().lower() for e in etiquetas]))
+    if jueces:
+        conjuntos.append(union("juez", [j.upper() for j in jueces]))
+    if usado_en is not None:
+        conjuntos.append(indice.usados_por_curso.get(usado_en, set()))
+    if prefijo:
+        conjuntos.append(indice.con_prefijo(prefijo))
+
+    if conjuntos:
+        conjuntos.sort(key=len)  # intersectar empezando por el más chico
+        resultado = set(conjuntos[0]).intersection(*conjuntos[1:])
+    else:
+        resultado = set(indice.registros)
+
+    if no_usado_en is not None:
+        resultado -= indice.usados_por_curso.get(no_usado_en, set())
+    return resultado
+
+
+def ids_filtrados(**filtros):
+    """
+    Ids de los problemas que cumplen los filtros de filtrar_problemas(),
+    todos (sin paginar) y en el orden del banco.
+    """
+    actual = _facetas_del_conjunto()
+    with actual["bloqueo"]:
+        _sincronizar_facetas(actual)
+        indice = actual["indice"]
+        resultado = _filtrar(indice, **filtros)
+        return sorted(resultado, key=indice.posicion.__getitem__)
+
+
+def filtrar_problemas(pagina=1, por_pagina=50, **filtros):
+    """
+    Filtra el banco de problemas intersectando conjuntos de ids. Filtros
+    (todos opcionales): temas, todos_los_temas, concursos, etiquetas,
+    jueces, usado_en, no_usado_en y prefijo. Dentro de una misma faceta los
+    valores se combinan con OR (salvo los temas con todos_los_temas=True,
+    que usan AND); entre facetas, con AND.
+
+    Regresa {"total", "pagina", "por_pagina", "problemas", "facetas"}, donde
+    "facetas" cuenta, sobre el resultado completo (no solo la página),
+    cuántos problemas hay por tema, concurso, etiqueta, juez y curso.
+    """
+    actual = _facetas_del_conjunto()
+    with actual["bloqueo"]:
+        _sincronizar_facetas(actual)
+        indice = actual["indice"]
+        resultado = _filtrar(indice, **filtros)
+
+        facetas = {f: {} for f in IndiceFacetas.FACETAS}
+        for problema_id in resultado:
+            for faceta, valor in _valores_faceta(indice.registros[problema_id]):
+                facetas[faceta][valor] = facetas[faceta].get(valor, 0) + 1
+        facetas["curso"] = {
+            curso: len(usados & resultado)
+            for curso, usados in indice.usados_por_curso.items()
+        }
+
+        ordenados = sorted(resultado, key=indice.posicion.__getitem__)
+        inicio = (pagina - 1) * por_pagina
+        pagina_ids = ordenados[inicio:inicio + por_pagina]
+
+        return {
+            "total": len(ordenados),
+            "pagina": pagina,
+            "por_pagina": por_pagina,
+            "problemas": [dict(indice.registros[i]) for i in pagina_ids],
+            "facetas": facetas,
+        }
@@ -0,0 +1,166 @@
+"""
+Métricas internas: contadores, histogramas y tiempos por fase.
+
+Las capas de datos e índices marcan sus fases con fase("carga"),
+fase("escritura"), etc. Dentro de una petición (ver iniciar_peticion())
+el tiempo de cada fase se acumula de forma exclusiva: si una fase corre
+dentro de otra (p. ej. la carga de problemas que hace la agrupación), ese
+tiempo se cuenta solo en la interna.
+
+texto_prometheus() regresa todo en el formato de texto de Prometheus. Los
+valores son de este proceso: con varios workers, cada uno tiene los suyos.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# límites (en segundos) de las cubetas del histograma de duración
+CUBETAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+AYUDA = {
+    "icpc_peticiones_total": ("counter", "Peticiones atendidas"),
+    "icpc_peticion_segundos": ("histogram", "Duración de las peticiones"),
+    "icpc_fase_segundos_total": ("counter", "Tiempo por fase dentro de las peticiones"),
+    "icpc_cargas_total": ("counter", "Llamadas a cargar_* por colección (caché o disco)"),
+    "icpc_guardados_total": ("counter", "Llamadas a guardar_* por colección"),
+    "icpc_bytes_leidos_total": ("counter", "Bytes leídos del almacenamiento"),
+    "icpc_bytes_escritos_total": ("counter", "Bytes escritos al almacenamiento"),
+    "icpc_cache_paginas_total": ("counter", "Páginas servidas desde la caché, 304 o renderizadas"),
+    "icpc_cache_derivada_total": ("counter", "Índices derivados reutilizados o recalculados"),
+    "icpc_escaneos_archivos_total": ("counter", "Revisiones de notas y soluciones (completas o parciales)"),
+    "icpc_conjuntos_cargados_total": ("counter", "Conjuntos de datos cargados en memoria"),
+    "icpc_conjuntos_descargados_total": ("counter", "Conjuntos de datos descargados por falta de memoria"),
+    "icpc_cache_notas_total": ("counter", "Notas servidas desde la caché de HTML o convertidas"),
+    "icpc_instantaneas_total": ("counter", "Colecciones cargadas de su instantánea binaria o con instantánea regenerada"),
+}
+
+_bloqueo = threading.Lock()
+_contadores = {}    # (nombre, etiquetas) -> valor
+_histogramas = {}   # (nombre, etiquetas) -> [cuenta por cubeta..., suma, cuenta]
+
+# estado de la petición en curso: {"fases": {nombre: segundos}, "pila": [[nombre, inicio]]}
+_peticion = contextvars.ContextVar("peticion", default=None)
+
+
+def _clave(nombre, etiquetas):
+    return (nombre, tuple(sorted(etiquetas.items())))
+
+
+def contar(nombre, valor=1, **etiquetas):
+    clave = _clave(nombre, etiquetas)
+    with _bloqueo:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def observar(nombre, segundos, **etiquetas):
+    clave = _clave(nombre, etiquetas)
+    with _bloqueo:
+        valores = _histogramas.get(clave)
+        if valores is None:
+            valores = _histogramas[clave] = [0] * (len(CUBETAS) + 2)
+        for i, limite in enumerate(CUBETAS):
+            if segundos <= limite:
+                valores[i] += 1
+        valores[-2] += segundos
+        valores[-1] += 1
+
+
+def iniciar_peticion():
+    """Empieza a medir fases en el contexto actual. Regresa un token."""
+    return _peticion.set({"fases": {}, "pila": []})
+
+
+def terminar_peticion(token):
+    """Deja de medir y regresa {fase: segundos} de la petición."""
+    estado = _peticion.get()
+    _peticion.reset(token)
+    return estado["fases"] if estado else {}
+
+
+def empezar_fase(nombre):
+    estado = _peticion.get()
+    if estado is None:
+        return
+    ahora = time.perf_counter()
+    pila = estado["pila"]
+    if pila:
+        # la fase de afuera se pausa mientras corre esta
+        afuera = pila[-1]
+        estado["fases"][afuera[0]] = estado["fases"].get(afuera[0], 0.0) + ahora - afuera[1]
+    pila.append([nombre, ahora])
+
+
+def terminar_fase():
+    estado = _peticion.get()
+    if estado is None or not estado["pila"]:
+        return
+    ahora = time.perf_counter()
+    pila = estado["pila"]
+    nombre, inicio = pila.pop()
+    estado["fases"][nombre] = estado["fases"].get(nombre, 0.0) + ahora - inicio
+    if pila:
+        pila[-1][1] = ahora  # la de afuera sigue corriendo desde aquí
+
+
+@contextmanager
+def fase(nombre):
+    empezar_fase(nombre)
+    try:
+        yield
+    finally:
+        terminar_fase()
+
+
+def recalcular(indice, firma, anterior):
+    """
+    Para los índices derivados: True si la firma cambió y hay que
+    recalcular. Cuenta los reusos y recálculos de cada índice.
+    """
+    cambio = firma != anterior
+    contar(
+        "icpc_cache_derivada_total",
+        indice=indice,
+        resultado="recalculado" if cambio else "reutilizado",
+    )
+    return cambio
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor):
+    return repr(round(valor, 6)) if isinstance(valor, float) else str(valor)
+
+
+def texto_prometheus():
+    with _bloqueo:
+        contadores = dict(_contadores)
+        histogramas = {k: list(v) for k, v in _histogramas.items()}
+
+    nombres = sorted({n for n, _ in contadores} | {n for n, _ in histogramas})
+    lineas = []
+    for nombre in nombres:
+        tipo, ayuda = AYUDA.get(nombre, ("untyped", nombre))
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for (n, etiquetas), valor in sorted(contadores.items()):
+            if n == nombre:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        for (n, etiquetas), valores in sorted(histogramas.items()):
+            if n != nombre:
+                continue
+            for limite, cuenta in zip(CUBETAS, valores):
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, [('le', limite)])} {cuenta}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, [('le', '+Inf')])} {valores[-1]}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(valores[-2])}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {valores[-1]}")
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,196 @@
+"""
+Render de las notas de temas y de los archivos de solución a HTML.
+
+Los .md se convierten con markdown-it-py (CommonMark, más tablas y
+tachado) si está instalado; si no, se muestran como texto. Si Pygments está
+instalado, los bloques de código y los archivos de solución (.cpp, .py,
+...) se muestran con colores. Las dos dependencias son opcionales.
+
+El HTML ya compilado se guarda en una caché LRU por ruta, validada con el
+mtime y el tamaño del archivo, y limitada a LIMITE_CACHE caracteres: cada
+nota se convierte una sola vez mientras no cambie. precalentar() convierte
+de antemano todas las notas de temas/ en un pool de hilos.
+"""
+import html
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from datos import BASE_DIR
+from metricas import contar, fase
+
+try:
+    from pygments import highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name, get_lexer_for_filename
+    from pygments.util import ClassNotFound
+except ImportError:  # sin Pygments el código se muestra sin colores
+    highlight = None
+
+try:
+    from markdown_it import MarkdownIt
+except ImportError:  # sin markdown-it-py las notas se muestran como texto
+    MarkdownIt = None
+
+EXTENSIONES_MARKDOWN = {".md", ".markdown"}
+
+# archivos de solución que se muestran como código
+EXTENSIONES_CODIGO = {
+    ".c", ".cc", ".cpp", ".cxx", ".h", ".hpp", ".py", ".java", ".kt",
+    ".rs", ".go", ".js", ".ts", ".rb", ".cs", ".hs", ".ml", ".txt",
+}
+
+# tamaño máximo de la caché, en caracteres de HTML (ICPC_DB_CACHE_NOTAS_MB)
+LIMITE_CACHE = int(float(os.environ.get("ICPC_DB_CACHE_NOTAS_MB") or 32) * 1024 * 1024)
+
+if highlight is not None:
+    _FORMATO = HtmlFormatter(cssclass="highlight")
+    ESTILOS = _FORMATO.get_style_defs(".highlight")
+else:
+    ESTILOS = ""
+
+_cache = OrderedDict()  # ruta -> (mtime_ns, tamaño, html)
+_tamano_cache = 0
+_bloqueo = threading.Lock()
+
+
+# ---------------------------------------------------------------- código
+
+def _codigo(texto, lenguaje=None, nombre_archivo=None):
+    """Bloque <pre> con colores si hay Pygments y se reconoce el lenguaje."""
+    if highlight is not None:
+        try:
+            if lenguaje:
+                lexer = get_lexer_by_name(lenguaje)
+            elif nombre_archivo:
+                lexer = get_lexer_for_filename(nombre_archivo, texto)
+            else:
+                lexer = None
+        except ClassNotFound:
+            lexer = None
+        if lexer is not None:
+            return highlight(texto, lexer, _FORMATO)
+
+    clase = f' class="language-{html.escape(lenguaje)}"' if lenguaje else ""
+    return f"<pre><code{clase}>{html.escape(texto)}</code></pre>\n"
+
+
+# ---------------------------------------------------------------- markdown
+
+def _bloque_cercado(self, tokens, idx, options, env):
+    token = tokens[idx]
+    lenguaje = token.info.strip().split(" ", 1)[0] if token.info.strip() else None
+    return _codigo(token.content, lenguaje)
+
+
+def _bloque_con_sangria(self, tokens, idx, options, env):
+    return _codigo(tokens[idx].content)
+
+
+def _con_clase(clase):
+    """Regla de render que agrega las clases de Bootstrap a la etiqueta."""
+    def regla(self, tokens, idx, options, env):
+        tokens[idx].attrSet("class", clase)
+        return self.renderToken(tokens, idx, options, env)
+    return regla
+
+
+def _imagen(self, tokens, idx, options, env):
+    tokens[idx].attrSet("class", "img-fluid")
+    return self.image(tokens, idx, options, env)
+
+
+if MarkdownIt is not None:
+    # CommonMark sin HTML crudo (se escapa); markdown-it ya descarta los
+    # enlaces javascript:/data: y está hecho para no tardar de más con
+    # entradas patológicas
+    _MARKDOWN = MarkdownIt("commonmark", {"html": False}).enable(["table", "strikethrough"])
+    _MARKDOWN.add_render_rule("fence", _bloque_cercado)
+    _MARKDOWN.add_render_rule("code_block", _bloque_con_sangria)
+    _MARKDOWN.add_render_rule("table_open", _con_clase("table table-sm table-bordered"))
+    _MARKDOWN.add_render_rule("blockquote_open", _con_clase("blockquote border-start ps-3"))
+    _MARKDOWN.add_render_rule("image", _imagen)
+
+
+def markdown_a_html(texto):
+    """
+    Convierte el texto Markdown de una nota a HTML. Sin markdown-it-py la
+    nota se muestra tal cual, escapada, como bloque de código.
+    """
+    if MarkdownIt is None:
+        return _codigo(texto, "markdown")
+    return _MARKDOWN.render(texto)
+
+
+# ---------------------------------------------------------------- archivos
+
+def se_puede_mostrar(archivo):
+    """True si el archivo se muestra como página (Markdown o código)."""
+    sufijo = archivo.suffix.lower()
+    return sufijo in EXTENSIONES_MARKDOWN or sufijo in EXTENSIONES_CODIGO
+
+
+def _compilar(archivo):
+    texto = archivo.read_text(encoding="utf-8", errors="replace")
+    if archivo.suffix.lower() in EXTENSIONES_MARKDOWN:
+        return markdown_a_html(texto)
+    return _codigo(texto, nombre_archivo=archivo.name)
+
+
+def _guardar_en_cache(clave, entrada):
+    global _tamano_cache
+    anterior = _cache.pop(clave, None)
+    if anterior is not None:
+        _tamano_cache -= len(anterior[2])
+    if len(entrada[2]) > LIMITE_CACHE:
+        return
+    _cache[clave] = entrada
+    _tamano_cache += len(entrada[2])
+    while _tamano_cache > LIMITE_CACHE:
+        _, viejo = _cache.popitem(last=False)
+        _tamano_cache -= len(viejo[2])
+
+
+def html_de_archivo(archivo):
+    """
+    HTML de la nota o solución 'archivo' (un Path absoluto), convertido una
+    sola vez mientras el archivo no cambie.
+    """
+    estado = archivo.stat()
+    clave = str(archivo)
+    firma = (estado.st_mtime_ns, estado.st_size)
+    with _bloqueo:
+        entrada = _cache.get(clave)
+        if entrada is not None and entrada[:2] == firma:
+            _cache.move_to_end(clave)
+            contar("icpc_cache_notas_total", resultado="acierto")
+            return entrada[2]
+
+    contar("icpc_cache_notas_total", resultado="fallo")
+    with fase("markdown"):
+        contenido = _compilar(archivo)
+    with _bloqueo:
+        _guardar_en_cache(clave, (*firma, contenido))
+    return contenido
+
+
+def firma_archivo(archivo):
+    """Cadena que cambia cuando cambia el archivo (para el ETag de la página)."""
+    estado = archivo.stat()
+    return f"{estado.st_mtime_ns:x}-{estado.st_size:x}"
+
+
+def precalentar(carpeta=None, hilos=4):
+    """
+    Convierte de antemano todas las notas Markdown de 'carpeta' (por
+    defecto temas/) usando un pool de hilos. Regresa cuántas convirtió.
+    """
+    carpeta = carpeta or BASE_DIR / "temas"
+    archivos = [
+        a for a in carpeta.rglob("*")
+        if a.is_file() and a.suffix.lower() in EXTENSIONES_MARKDOWN
+    ]
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        list(pool.map(html_de_archivo, archivos))
+    return len(archivos)
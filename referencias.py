@@ -0,0 +1,242 @@
+"""
+Índice inverso de referencias entre colecciones y cambios en cascada.
+
+Los problemas se refieren a temas (problema["temas"]) y a concursos
+(problema["concurso"]); los cursos a problemas, temas y concursos (sus
+listas usados_*). El índice guarda, para cada tema, concurso o problema,
+qué registros lo mencionan, así que al renombrar o borrar algo solo se
+tocan esos registros en vez de recorrer todos los archivos.
+
+Como los demás índices derivados, se actualiza por registro: solo se
+vuelven a indexar los problemas o cursos que cambiaron desde la última vez.
+"""
+import threading
+
+from datos import (
+    cargar_temas,
+    cargar_concursos,
+    cargar_categorias_guardadas,
+    cargar_problemas,
+    guardar_problemas,
+    cargar_cursos,
+    guardar_cursos,
+    conjunto_actual,
+    firma_colecciones,
+    transaccion,
+)
+from indices import SIN_TEMA_PRINCIPAL
+from metricas import fase, recalcular
+
+TIPOS = ("tema", "concurso", "problema")
+
+# tipo referido -> lista del curso donde aparece
+USOS = {
+    "tema": "usados_temas",
+    "concurso": "usados_concursos",
+    "problema": "usados_problemas",
+}
+
+
+def _referencias_problema(problema):
+    for tema in problema.get("temas") or []:
+        yield ("tema", tema)
+    if problema.get("concurso"):
+        yield ("concurso", problema["concurso"])
+
+
+def _referencias_curso(curso):
+    for tipo, campo in USOS.items():
+        for valor in curso.get(campo) or []:
+            yield (tipo, valor)
+
+
+class IndiceReferencias:
+    """
+    (tipo, clave) -> ids de problemas y nombres de cursos que lo mencionan.
+    """
+
+    def __init__(self):
+        self.problemas = {}         # (tipo, clave) -> set de ids de problema
+        self.cursos = {}            # (tipo, clave) -> set de nombres de curso
+        self.registros = {"problemas": {}, "cursos": {}}
+
+    def _mapa(self, coleccion):
+        return self.problemas if coleccion == "problemas" else self.cursos
+
+    def quitar(self, coleccion, clave):
+        registro = self.registros[coleccion].pop(clave, None)
+        if registro is None:
+            return
+        extraer = _referencias_problema if coleccion == "problemas" else _referencias_curso
+        mapa = self._mapa(coleccion)
+        for referida in set(extraer(registro)):
+            claves = mapa[referida]
+            claves.discard(clave)
+            if not claves:
+                del mapa[referida]
+
+    def poner(self, coleccion, clave, registro):
+        self.quitar(coleccion, clave)
+        self.registros[coleccion][clave] = registro
+        extraer = _referencias_problema if coleccion == "problemas" else _referencias_curso
+        mapa = self._mapa(coleccion)
+        for referida in extraer(registro):
+            mapa.setdefault(referida, set()).add(clave)
+
+    def sincronizar(self, coleccion, registros, campo):
+        actuales = {r[campo]: r for r in registros}
+        for clave in self.registros[coleccion].keys() - actuales.keys():
+            self.quitar(coleccion, clave)
+        for clave, registro in actuales.items():
+            if self.registros[coleccion].get(clave) != registro:
+                self.poner(coleccion, clave, registro)
+
+
+def _nuevo():
+    return {
+        "indice": IndiceReferencias(),
+        "estado": {"problemas": None, "cursos": None},
+        "bloqueo": threading.Lock(),
+    }
+
+
+@fase("indices")
+def _sincronizar(actual):
+    """Pone al día el índice del conjunto; se llama con actual["bloqueo"] tomado."""
+    indice = actual["indice"]
+    estado = actual["estado"]
+    firma = firma_colecciones("problemas")
+    if recalcular("referencias", firma, estado["problemas"]):
+        indice.sincronizar("problemas", cargar_problemas(), "id")
+        estado["problemas"] = firma
+
+    firma = firma_colecciones("cursos")
+    if recalcular("referencias_cursos", firma, estado["cursos"]):
+        indice.sincronizar("cursos", cargar_cursos(), "nombre")
+        estado["cursos"] = firma
+
+
+def referencias(tipo, clave):
+    """
+    Quién menciona al tema, concurso o problema 'clave':
+      {"problemas": [ids...], "cursos": [nombres...]}, ambos ordenados.
+    """
+    actual = conjunto_actual().derivado("referencias", _nuevo)
+    with actual["bloqueo"]:
+        _sincronizar(actual)
+        indice = actual["indice"]
+        return {
+            "problemas": sorted(indice.problemas.get((tipo, clave), ())),
+            "cursos": sorted(indice.cursos.get((tipo, clave), ())),
+        }
+
+
+def _reemplazar(lista, anterior, nuevo):
+    """Cambia 'anterior' por 'nuevo' (o lo quita si nuevo es None) sin duplicar."""
+    resultado = []
+    for valor in lista:
+        if valor == anterior:
+            valor = nuevo
+        if valor is not None and valor not in resultado:
+            resultado.append(valor)
+    return resultado
+
+
+def _aplicar(tipo, anterior, nuevo):
+    """
+    Renombra (nuevo = otra clave) o quita (nuevo = None) las referencias a
+    'anterior' en los problemas y cursos que lo mencionan. Debe llamarse
+    dentro de una transacción. Regresa cuántos registros se tocaron.
+    """
+    refs = referencias(tipo, anterior)
+    tocados = 0
+
+    if refs["problemas"]:
+        ids = set(refs["problemas"])
+        problemas = cargar_problemas()
+        for p in problemas:
+            if p["id"] not in ids:
+                continue
+            if tipo == "tema":
+                p["temas"] = _reemplazar(p.get("temas") or [], anterior, nuevo)
+            elif tipo == "concurso":
+                p["concurso"] = nuevo or ""
+            tocados += 1
+        guardar_problemas(problemas)
+
+    if refs["cursos"]:
+        nombres = set(refs["cursos"])
+        campo = USOS[tipo]
+        cursos = cargar_cursos()
+        for c in cursos:
+            if c["nombre"] in nombres:
+                c[campo] = _reemplazar(c.get(campo) or [], anterior, nuevo)
+                tocados += 1
+        guardar_cursos(cursos)
+
+    return tocados
+
+
+def renombrar(tipo, anterior, nuevo):
+    """
+    Después de renombrar un tema, concurso o problema, actualiza todas sus
+    referencias. Regresa cuántos registros se modificaron.
+    """
+    if anterior == nuevo:
+        return 0
+    with transaccion():
+        return _aplicar(tipo, anterior, nuevo)
+
+
+def quitar_referencias(tipo, clave):
+    """
+    Después de borrar un tema, concurso o problema, lo quita de los
+    problemas y cursos que lo mencionaban. Regresa cuántos registros se
+    modificaron.
+    """
+    with transaccion():
+        return _aplicar(tipo, clave, None)
+
+
+def integridad():
+    """
+    Revisa en una sola pasada todas las referencias y regresa la lista de
+    las rotas, cada una un dict con "origen" ("problema" o "curso"),
+    "clave" (id o nombre del registro), "campo" y "valor" (lo que no existe).
+    """
+    temas = {t["nombre"] for t in cargar_temas()}
+    concursos = cargar_concursos()
+    nombres_concursos = {c["nombre"] for c in concursos}
+    # las guardadas: cargar_categorias_concursos() ya completa las que faltan
+    categorias = {c["nombre"] for c in cargar_categorias_guardadas()}
+    problemas = cargar_problemas()
+    ids = set()
+
+    rotas = []
+    for p in problemas:
+        if p["id"] in ids:
+            rotas.append({"origen": "problema", "clave": p["id"], "campo": "id", "valor": "repetido"})
+        ids.add(p["id"])
+        for tema in p.get("temas") or []:
+            if tema not in temas:
+                rotas.append({"origen": "problema", "clave": p["id"], "campo": "temas", "valor": tema})
+        if p.get("concurso") and p["concurso"] not in nombres_concursos:
+            rotas.append({"origen": "problema", "clave": p["id"], "campo": "concurso", "valor": p["concurso"]})
+
+    for c in concursos:
+        if c.get("categoria") and c["categoria"] not in categorias:
+            rotas.append({"origen": "concurso", "clave": c["nombre"], "campo": "categoria", "valor": c["categoria"]})
+
+    existentes = {
+        "usados_problemas": ids,
+        # en /cursos/gestionar también se puede marcar el grupo sin tema principal
+        "usados_temas": temas | {SIN_TEMA_PRINCIPAL},
+        "usados_concursos": nombres_concursos,
+    }
+    for curso in cargar_cursos():
+        for campo, validos in existentes.items():
+            for valor in curso.get(campo) or []:
+                if valor not in validos:
+                    rotas.append({"origen": "curso", "clave": curso["nombre"], "campo": campo, "valor": valor})
+
+    return rotas
@@ -0,0 +1,229 @@
+"""
+Exportación del lado de solo lectura a un sitio estático.
+
+Genera con las mismas plantillas de la app (en modo solo_lectura: sin
+botones de edición ni formularios) /, /temas, /concursos, /problemas,
+/cursos, la página de usos de cada curso y las notas y soluciones ya
+convertidas a HTML. Cada página queda en <salida>/<ruta>/index.html, así
+que un servidor como nginx la sirve con las mismas URL:
+
+    location / { try_files $uri $uri/index.html =404; }
+
+La construcción es incremental: <salida>/.dependencias.json guarda, para
+cada página, la huella de cada cosa que usó (colecciones, registros,
+archivos de notas, plantillas). Solo se vuelven a generar las páginas con
+alguna huella distinta, y se borran las que ya no existen. Las páginas se
+reparten entre varios procesos.
+
+    python sitio.py [-o sitio/] [--procesos N] [--todo]
+"""
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote
+
+from flask import g, url_for
+
+from app import app, VERSION_PLANTILLAS
+from archivos import estado_rutas
+from datos import (
+    BASE_DIR,
+    cargar_temas,
+    cargar_concursos,
+    cargar_categorias_concursos,
+    cargar_problemas,
+    cargar_cursos,
+    version_registro,
+)
+from notas import se_puede_mostrar
+
+MANIFIESTO = ".dependencias.json"
+
+SALIDA = BASE_DIR / "sitio"
+
+
+def _huella_archivo(ruta):
+    archivo = (BASE_DIR / ruta).resolve()
+    try:
+        estado = archivo.stat()
+    except OSError:
+        return "falta"
+    return f"{estado.st_mtime_ns:x}-{estado.st_size:x}"
+
+
+def paginas():
+    """
+    url -> {"endpoint", "argumentos", "entradas"}: todas las páginas del
+    sitio y, para cada una, la huella de cada dato que usa.
+    """
+    temas = cargar_temas()
+    problemas = cargar_problemas()
+    cursos = cargar_cursos()
+    colecciones = {
+        "temas": version_registro(temas),
+        "problemas": version_registro(problemas),
+        "concursos": version_registro(cargar_concursos()),
+        "concursos_categorias": version_registro(cargar_categorias_concursos()),
+        "cursos": version_registro(cursos),
+    }
+    estados = {"temas": estado_rutas("temas"), "problemas": estado_rutas("problemas")}
+
+    def entradas(*nombres, **extra):
+        huellas = {"plantillas": VERSION_PLANTILLAS}
+        for nombre in nombres:
+            huellas[nombre] = colecciones[nombre]
+        huellas.update(extra)
+        return huellas
+
+    lista = [
+        ("home", {}, entradas()),
+        ("lista_temas", {}, entradas(
+            "temas", rutas=version_registro(estados["temas"])
+        )),
+        ("lista_concursos", {}, entradas("concursos", "concursos_categorias")),
+        ("lista_problemas", {}, entradas(
+            "temas", "problemas", rutas=version_registro(estados["problemas"])
+        )),
+        ("lista_cursos", {}, entradas("cursos")),
+    ]
+    for c in cursos:
+        lista.append((
+            "gestionar_curso", {"nombre": c["nombre"]},
+            entradas("temas", "problemas", "concursos", curso=version_registro(c)),
+        ))
+    for t in temas:
+        if estados["temas"].get(t["nombre"]) == "ok" and se_puede_mostrar(Path(t["ruta"])):
+            lista.append((
+                "ver_tema", {"nombre": t["nombre"]},
+                entradas(tema=version_registro(t), archivo=_huella_archivo(t["ruta"])),
+            ))
+    for p in problemas:
+        if estados["problemas"].get(p["id"]) == "ok" and se_puede_mostrar(Path(p["ruta_solucion"])):
+            lista.append((
+                "ver_solucion_problema", {"problema_id": p["id"]},
+                entradas(problema=version_registro(p), archivo=_huella_archivo(p["ruta_solucion"])),
+            ))
+
+    resultado = {}
+    with app.test_request_context():
+        for endpoint, argumentos, huellas in lista:
+            resultado[url_for(endpoint, **argumentos)] = {
+                "endpoint": endpoint,
+                "argumentos": argumentos,
+                "entradas": huellas,
+            }
+    return resultado
+
+
+def archivo_de(salida, url):
+    """Archivo donde va la página 'url', o None si quedaría fuera de 'salida'."""
+    archivo = (salida / unquote(url).lstrip("/") / "index.html").resolve()
+    return archivo if archivo.is_relative_to(salida.resolve()) else None
+
+
+def _renderizar(salida, trabajos):
+    """
+    Genera las páginas de 'trabajos' ([(url, endpoint, argumentos)]) en
+    'salida'. Corre en los procesos del pool. Regresa las url generadas.
+    """
+    hechas = []
+    for url, endpoint, argumentos in trabajos:
+        archivo = archivo_de(salida, url)
+        if archivo is None:
+            continue
+        with app.test_request_context(url):
+            g.solo_lectura = True
+            # la vista sin con_cache: no debe usar ni llenar la caché de páginas
+            vista = inspect.unwrap(app.view_functions[endpoint])
+            respuesta = app.make_response(vista(**argumentos))
+        if respuesta.status_code != 200:
+            continue
+        archivo.parent.mkdir(parents=True, exist_ok=True)
+        tmp = archivo.with_name(f".{archivo.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(respuesta.get_data())
+        os.replace(tmp, archivo)
+        hechas.append(url)
+    return hechas
+
+
+def construir(salida=SALIDA, procesos=None, todo=False):
+    """
+    Genera o actualiza el sitio en 'salida'. Con todo=True se ignora lo
+    generado antes. Regresa {"generadas", "sin_cambios", "borradas"}.
+    """
+    salida = Path(salida)
+    salida.mkdir(parents=True, exist_ok=True)
+    ruta_manifiesto = salida / MANIFIESTO
+    anterior = {}
+    if ruta_manifiesto.exists() and not todo:
+        anterior = json.loads(ruta_manifiesto.read_text(encoding="utf-8"))
+
+    actuales = paginas()
+
+    pendientes = []
+    for url, pagina in actuales.items():
+        archivo = archivo_de(salida, url)
+        previa = anterior.get(url)
+        if previa and previa == pagina["entradas"] and archivo and archivo.exists():
+            continue
+        pendientes.append((url, pagina["endpoint"], pagina["argumentos"]))
+
+    borradas = 0
+    for url in anterior.keys() - actuales.keys():
+        archivo = archivo_de(salida, url)
+        if archivo and archivo.exists():
+            archivo.unlink()
+            borradas += 1
+            # quitar las carpetas que quedaron vacías
+            carpeta = archivo.parent
+            while carpeta != salida.resolve() and not any(carpeta.iterdir()):
+                carpeta.rmdir()
+                carpeta = carpeta.parent
+
+    procesos = procesos or os.cpu_count() or 1
+    hechas = []
+    if procesos == 1 or len(pendientes) < 2:
+        hechas = _renderizar(salida, pendientes)
+    else:
+        tamano = max(1, len(pendientes) // (procesos * 4))
+        lotes = [pendientes[i:i + tamano] for i in range(0, len(pendientes), tamano)]
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            for resultado in pool.map(_renderizar, [salida] * len(lotes), lotes):
+                hechas.extend(resultado)
+
+    # solo se anotan las páginas que sí se generaron: las demás se vuelven
+    # a intentar la próxima vez
+    generadas = set(hechas)
+    intentadas = {url for url, _, _ in pendientes}
+    manifiesto = {
+        url: pagina["entradas"]
+        for url, pagina in actuales.items()
+        if url in generadas or url not in intentadas
+    }
+    tmp = ruta_manifiesto.with_name(MANIFIESTO + ".tmp")
+    tmp.write_text(json.dumps(manifiesto, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, ruta_manifiesto)
+
+    return {
+        "generadas": len(hechas),
+        "sin_cambios": len(actuales) - len(pendientes),
+        "borradas": borradas,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Genera el sitio estático de solo lectura.")
+    parser.add_argument("-o", "--salida", default=str(SALIDA), help="carpeta de salida (por defecto, sitio/)")
+    parser.add_argument("--procesos", type=int, help="procesos en paralelo (por defecto, uno por CPU)")
+    parser.add_argument("--todo", action="store_true", help="regenerar todas las páginas")
+    args = parser.parse_args()
+
+    resumen = construir(args.salida, procesos=args.procesos, todo=args.todo)
+    print(
+        f"{resumen['generadas']} páginas generadas, {resumen['sin_cambios']} sin cambios, "
+        f"{resumen['borradas']} borradas"
+    )
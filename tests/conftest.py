@@ -0,0 +1,18 @@
+"""
+Los tests trabajan sobre una copia de data/ en un directorio temporal: las
+rutas de datos.py se fijan al importarlo, así que la copia se prepara aquí,
+antes de que cualquier test importe los módulos de la app.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+_datos = Path(tempfile.mkdtemp(prefix="icpc-db-tests-")) / "data"
+shutil.copytree(RAIZ / "data", _datos, ignore=shutil.ignore_patterns("instantanea", ".*"))
+os.environ["ICPC_DB_DATA"] = str(_datos)
+os.environ["ICPC_DB_ESCANEO_S"] = "0"
+sys.path.insert(0, str(RAIZ))
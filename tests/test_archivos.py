@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import pytest
+
+import archivos
+
+
+class _Fin(Exception):
+    pass
+
+
+def test_la_revision_sigue_despues_de_un_error(monkeypatch, caplog):
+    vueltas = []
+
+    def escanear():
+        vueltas.append(1)
+        raise ValueError("archivo a medio escribir")
+
+    def dormir(segundos):
+        if len(vueltas) == 2:
+            raise _Fin  # ya dio dos vueltas: la primera falla no lo detuvo
+
+    monkeypatch.setattr(archivos, "escanear", escanear)
+    monkeypatch.setattr(archivos, "time", SimpleNamespace(sleep=dormir))
+    with pytest.raises(_Fin):
+        archivos._vigilar(1)
+
+    assert len(vueltas) == 2
+    assert "archivo a medio escribir" in caplog.text
@@ -0,0 +1,59 @@
+import sys
+import threading
+
+from datos import cargar_problemas, cargar_temas, guardar_problemas
+from indices import (
+    agrupar_problemas_por_tema_principal,
+    cargar_grupos_problemas,
+    problemas_del_grupo,
+    tema_principal_por_id,
+)
+
+
+def test_agrupacion_con_lectores_concurrentes_tras_guardar():
+    # cambiar de hilo muy seguido, para que se encimen las actualizaciones
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        _lectores_concurrentes()
+    finally:
+        sys.setswitchinterval(intervalo)
+
+
+def _lectores_concurrentes():
+    temas = [t["nombre"] for t in cargar_temas()]
+    for vuelta in range(60):
+        problemas = cargar_problemas()
+        # cambios de tema y de lugar: la agrupación se actualiza por partes
+        for i in range(vuelta % 7, len(problemas), 7):
+            problemas[i]["temas"] = [temas[(i + vuelta) % len(temas)]]
+        problemas.insert(0, problemas.pop())
+        guardar_problemas(problemas)
+        esperado = agrupar_problemas_por_tema_principal(cargar_problemas(), cargar_temas())
+
+        barrera = threading.Barrier(8)
+        resultados = []
+        errores = []
+
+        def leer():
+            barrera.wait()
+            try:
+                grupos = cargar_grupos_problemas()
+                principal = tema_principal_por_id()
+                primero = problemas_del_grupo(grupos[0]["nombre"])
+                resultados.append((grupos, principal, primero))
+            except Exception as e:  # noqa: BLE001 - se revisa abajo
+                errores.append(e)
+
+        hilos = [threading.Thread(target=leer) for _ in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        assert not errores
+        for grupos, principal, primero in resultados:
+            assert grupos == esperado
+            assert primero == esperado[0]["problemas"]
+            for g in esperado:
+                assert all(principal[p["id"]] == g["nombre"] for p in g["problemas"])
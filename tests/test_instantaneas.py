@@ -0,0 +1,84 @@
+import shutil
+
+import pytest
+
+import datos
+import diario
+import indices
+from datos import cargar_problemas, cargar_temas, guardar_problemas, usar_conjunto
+
+
+def _en_frio():
+    # como al arrancar un worker: conjunto nuevo, sin caché ni índices
+    conjunto = datos.Conjunto("", datos.DATA_DIR)
+    diario.olvidar(conjunto.archivos.values())
+    return conjunto
+
+
+def _todo():
+    return [
+        datos.cargar_temas(), datos.cargar_concursos(), datos.cargar_categorias_concursos(),
+        datos.cargar_problemas(), datos.cargar_cursos(), indices.cargar_grupos_problemas(),
+    ]
+
+
+def _archivos(carpeta):
+    if not carpeta.exists():
+        return {}
+    return {a.name: a.stat().st_mtime_ns for a in carpeta.iterdir()}
+
+
+@pytest.fixture
+def sin_instantaneas():
+    carpeta = datos.conjunto_actual().instantaneas
+    shutil.rmtree(carpeta, ignore_errors=True)
+    yield carpeta
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+
+def test_leer_no_escribe_instantaneas(sin_instantaneas):
+    with usar_conjunto(_en_frio()):
+        _todo()
+    assert not sin_instantaneas.exists()
+
+
+def test_guardar_y_generar_escriben_instantaneas_vigentes(sin_instantaneas):
+    with usar_conjunto(_en_frio()):
+        esperado = _todo()
+        assert datos.generar_instantaneas() == len(datos.ARCHIVOS)
+        indices.guardar_instantanea_agrupacion()
+    assert "agrupacion.bin" in _archivos(sin_instantaneas)
+
+    antes = _archivos(sin_instantaneas)
+    with usar_conjunto(_en_frio()):
+        assert _todo() == esperado
+    assert _archivos(sin_instantaneas) == antes
+
+    problemas = cargar_problemas()
+    problemas[0]["nombre"] += " (editado)"
+    problemas.reverse()
+    guardar_problemas(problemas)
+    despues = _archivos(sin_instantaneas)
+    assert despues["problemas.bin"] != antes["problemas.bin"]
+    assert despues["agrupacion.bin"] != antes["agrupacion.bin"]
+
+    with usar_conjunto(_en_frio()):
+        datos.INSTANTANEAS = False
+        try:
+            esperado = _todo()
+        finally:
+            datos.INSTANTANEAS = True
+    with usar_conjunto(_en_frio()):
+        assert _todo() == esperado
+    assert _archivos(sin_instantaneas) == despues
+
+
+def test_guardar_sin_poder_escribir_instantaneas(sin_instantaneas):
+    sin_instantaneas.write_bytes(b"")  # un archivo donde debería ir la carpeta
+    temas = cargar_temas()
+    guardar_problemas(cargar_problemas()[::-1])
+    with usar_conjunto(_en_frio()):
+        assert cargar_temas() == temas
+        _todo()
+    assert sin_instantaneas.is_file()
+    sin_instantaneas.unlink()
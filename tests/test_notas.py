@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+import notas
+from notas import markdown_a_html
+
+
+def _rapido(texto, segundos=2):
+    inicio = time.perf_counter()
+    resultado = markdown_a_html(texto)
+    assert time.perf_counter() - inicio < segundos
+    return resultado
+
+
+@pytest.fixture
+def markdown_it():
+    return pytest.importorskip("markdown_it")
+
+
+# con un conversor cuadrático cada una tardaba segundos
+PATOLOGICAS = {
+    "corchetes": "[" * 15000,
+    "negritas": "**a " * 3000,
+    "cursivas": "_a " * 5000,
+    "enlaces": "[a](" * 5000,
+    "acentos_graves": "`" * 10000,
+    "citas": "> " * 5000,
+}
+
+
+@pytest.mark.parametrize("nombre", PATOLOGICAS)
+def test_entradas_patologicas_no_tardan(markdown_it, nombre):
+    _rapido(PATOLOGICAS[nombre])
+
+
+def test_nul_no_pasa_ni_en_bloques_de_codigo(markdown_it):
+    resultado = markdown_a_html("a\x00b\n\n    co\x00de\n\n```\nx\x00y\n```\n")
+    assert "\x00" not in resultado
+
+
+def test_enlace_javascript_no_se_enlaza(markdown_it):
+    resultado = markdown_a_html("[a](javascript:alert(1)) fin")
+    assert "<a" not in resultado
+    assert "href" not in resultado
+    assert resultado.count(")") == resultado.count("(")
+
+
+def test_texto_de_enlace_con_url_no_anida_enlaces(markdown_it):
+    resultado = markdown_a_html("[http://x.com](http://y.com)")
+    assert resultado.count("<a ") == 1
+    assert 'href="http://y.com"' in resultado
+
+
+def test_html_crudo_se_escapa(markdown_it):
+    resultado = markdown_a_html("<script>alert(1)</script>\n\n<img src=x onerror=alert(1)>")
+    assert "<script>" not in resultado
+    assert "<img" not in resultado
+
+
+def test_clases_de_bootstrap(markdown_it):
+    resultado = markdown_a_html("> cita\n\n|a|b|\n|-|-|\n|1|2|\n\n![x](x.png)\n")
+    assert '<blockquote class="blockquote border-start ps-3">' in resultado
+    assert '<table class="table table-sm table-bordered">' in resultado
+    assert 'class="img-fluid"' in resultado
+
+
+def test_sin_markdown_it_se_muestra_escapado(monkeypatch):
+    monkeypatch.setattr(notas, "MarkdownIt", None)
+    resultado = markdown_a_html("# Título\n<b>x</b>")
+    assert "<h1>" not in resultado
+    assert "<b>" not in resultado
+    assert "&lt;b&gt;" in resultado
@@ -0,0 +1,434 @@
+"""
+Uso de material por curso.
+
+En cursos.json cada curso guarda sus listas usados_problemas, usados_temas
+y usados_concursos. Aquí se manejan como conjuntos (pertenencia en O(1))
+y se marcan o desmarcan de a uno: marcar_uso() solo cambia ese elemento
+del curso, así que el diario guarda un único registro modificado.
+
+También se llevan los contadores del tablero de cada curso (problemas
+usados por tema principal y por concurso). No se recalculan por vista:
+cuando cambia un curso se suman o restan solo los problemas que se
+marcaron o desmarcaron, y cuando cambia un problema (su tema principal o
+su concurso) solo se mueve su cuenta en los cursos que lo usan.
+"""
+import threading
+from collections import Counter
+
+from datos import (
+    cargar_temas,
+    cargar_concursos,
+    cargar_problemas,
+    obtener_problema,
+    cargar_cursos,
+    guardar_cursos,
+    conjunto_actual,
+    firma_colecciones,
+    transaccion,
+)
+from indices import SIN_TEMA_PRINCIPAL, tema_principal_por_id, problemas_del_grupo
+from referencias import USOS
+from metricas import fase, recalcular
+
+
+def conjuntos_curso(curso):
+    """{"problema": set, "tema": set, "concurso": set} con lo usado en el curso."""
+    return {tipo: set(curso.get(campo) or []) for tipo, campo in USOS.items()}
+
+
+def _existe(tipo, clave):
+    if tipo == "problema":
+        return obtener_problema(clave) is not None
+    if tipo == "tema":
+        return clave == SIN_TEMA_PRINCIPAL or any(t["nombre"] == clave for t in cargar_temas())
+    return any(c["nombre"] == clave for c in cargar_concursos())
+
+
+def marcar_uso(nombre_curso, tipo, clave, usado):
+    """
+    Marca (usado=True) o desmarca un problema, tema o concurso en un curso.
+    Regresa el curso actualizado, o None si el curso no existe. Lanza
+    ValueError si el tipo no es válido o, al marcar, si 'clave' no existe.
+    """
+    if tipo not in USOS:
+        raise ValueError(f"Tipo desconocido: '{tipo}'")
+    campo = USOS[tipo]
+
+    with transaccion():
+        cursos = cargar_cursos()
+        curso = next((c for c in cursos if c["nombre"] == nombre_curso), None)
+        if curso is None:
+            return None
+
+        lista = curso.get(campo) or []
+        if usado and clave not in lista:
+            if not _existe(tipo, clave):
+                raise ValueError(f"No existe el {tipo} '{clave}'")
+            curso[campo] = lista + [clave]
+        elif not usado and clave in lista:
+            curso[campo] = [v for v in lista if v != clave]
+        else:
+            return curso  # ya estaba así: nada que escribir
+
+        guardar_cursos(cursos)
+        return curso
+
+
+# Contadores del tablero:
+#   "atributos": id de problema -> (tema principal, concurso)
+#   "totales": tema principal -> problemas en el banco
+#   "cursos": nombre -> {"usados": set de ids, "por_tema": Counter, "por_concurso": Counter}
+# Hay uno por conjunto de datos.
+def _cobertura_nueva():
+    return {
+        "bloqueo": threading.Lock(),
+        "firma_problemas": None,
+        "firma_cursos": None,
+        "atributos": {},
+        "totales": Counter(),
+        "cursos": {},
+    }
+
+
+def _contar(cuenta, atributos, signo):
+    if atributos is None:
+        return  # el curso marca un id que no existe en el banco
+    tema, concurso = atributos
+    cuenta["por_tema"][tema] += signo
+    if concurso:
+        cuenta["por_concurso"][concurso] += signo
+
+
+@fase("indices")
+def _sincronizar_cobertura(estado):
+    firma = firma_colecciones("temas", "problemas")
+    if recalcular("cobertura", firma, estado["firma_problemas"]):
+        principal = tema_principal_por_id()
+        nuevos = {
+            p["id"]: (principal[p["id"]], p.get("concurso") or "")
+            for p in cargar_problemas()
+        }
+        anteriores = estado["atributos"]
+        for problema_id in anteriores.keys() | nuevos.keys():
+            previo, actual = anteriores.get(problema_id), nuevos.get(problema_id)
+            if previo == actual:
+                continue
+            if previo is not None:
+                estado["totales"][previo[0]] -= 1
+            if actual is not None:
+                estado["totales"][actual[0]] += 1
+            for cuenta in estado["cursos"].values():
+                if problema_id in cuenta["usados"]:
+                    _contar(cuenta, previo, -1)
+                    _contar(cuenta, actual, +1)
+        estado["atributos"] = nuevos
+        estado["firma_problemas"] = firma
+
+    firma = firma_colecciones("cursos")
+    if recalcular("cobertura_cursos", firma, estado["firma_cursos"]):
+        atributos = estado["atributos"]
+        vigentes = {}
+        for curso in cargar_cursos():
+            usados = set(curso.get("usados_problemas") or [])
+            cuenta = estado["cursos"].get(curso["nombre"]) or {
+                "usados": set(), "por_tema": Counter(), "por_concurso": Counter(),
+            }
+            for problema_id in usados - cuenta["usados"]:
+                _contar(cuenta, atributos.get(problema_id), +1)
+            for problema_id in cuenta["usados"] - usados:
+                _contar(cuenta, atributos.get(problema_id), -1)
+            cuenta["usados"] = usados
+            vigentes[curso["nombre"]] = cuenta
+        estado["cursos"] = vigentes
+        estado["firma_cursos"] = firma
+
+
+def tablero_curso(nombre, sugerencias=5):
+    """
+    Resumen de cobertura de un curso, o None si no existe:
+      "temas":      en el orden de los temas, cada uno con "cubierto",
+                    "usados" y "total" (problemas con ese tema principal);
+      "categorias": lo mismo sumado por categoría de tema;
+      "concursos":  concursos de los que salieron problemas usados, o que
+                    se marcaron como usados;
+      "siguiente":  el primer tema no cubierto y sus primeros problemas
+                    sin usar (introductorios primero);
+      "resumen":    totales.
+    """
+    curso = next((c for c in cargar_cursos() if c["nombre"] == nombre), None)
+    if curso is None:
+        return None
+
+    cobertura = conjunto_actual().derivado("cobertura", _cobertura_nueva)
+    with cobertura["bloqueo"]:
+        _sincronizar_cobertura(cobertura)
+        cuenta = cobertura["cursos"].get(nombre)
+        if cuenta is None:
+            return None  # se borró o renombró mientras tanto
+        usados = set(cuenta["usados"])
+        por_tema = Counter(cuenta["por_tema"])
+        por_concurso = Counter(cuenta["por_concurso"])
+        totales = Counter(cobertura["totales"])
+
+    cubiertos = set(curso.get("usados_temas") or [])
+    temas = cargar_temas()
+    filas = [
+        {
+            "nombre": t["nombre"],
+            "categoria": t.get("categoria") or "Sin categoría",
+            "cubierto": t["nombre"] in cubiertos,
+            "usados": por_tema[t["nombre"]],
+            "total": totales[t["nombre"]],
+        }
+        for t in temas
+    ]
+    if totales[SIN_TEMA_PRINCIPAL]:
+        filas.append({
+            "nombre": SIN_TEMA_PRINCIPAL,
+            "categoria": "Sin categoría",
+            "cubierto": SIN_TEMA_PRINCIPAL in cubiertos,
+            "usados": por_tema[SIN_TEMA_PRINCIPAL],
+            "total": totales[SIN_TEMA_PRINCIPAL],
+        })
+
+    categorias = {}
+    for fila in filas:
+        cat = categorias.setdefault(fila["categoria"], {
+            "nombre": fila["categoria"], "temas": 0, "cubiertos": 0, "usados": 0, "total": 0,
+        })
+        cat["temas"] += 1
+        cat["cubiertos"] += fila["cubierto"]
+        cat["usados"] += fila["usados"]
+        cat["total"] += fila["total"]
+
+    marcados = set(curso.get("usados_concursos") or [])
+    concursos = [
+        {
+            "nombre": c["nombre"],
+            "anio": c.get("anio"),
+            "usados": por_concurso[c["nombre"]],
+            "marcado": c["nombre"] in marcados,
+        }
+        for c in cargar_concursos()
+        if por_concurso[c["nombre"]] or c["nombre"] in marcados
+    ]
+    concursos.sort(key=lambda c: -c["usados"])
+
+    siguiente = None
+    pendiente = next((f for f in filas if not f["cubierto"]), None)
+    if pendiente is not None:
+        sin_usar = [p for p in problemas_del_grupo(pendiente["nombre"]) if p["id"] not in usados]
+        siguiente = {"tema": pendiente["nombre"], "problemas": sin_usar[:sugerencias]}
+
+    return {
+        "curso": curso,
+        "temas": filas,
+        "categorias": list(categorias.values()),
+        "concursos": concursos,
+        "siguiente": siguiente,
+        "resumen": {
+            "temas_cubiertos": sum(f["cubierto"] for f in filas),
+            "temas": len(filas),
+            "problemas_usados": sum(por_tema.values()),
+            "problemas": sum(totales.values()),
+        },
+    }
+
+
+# Matriz problemas x cursos. Cada problema tiene un bit fijo y cada curso
+# es un entero de Python usado como bitset: unión, intersección y
+# diferencia entre cursos son una sola operación sobre enteros grandes (en
+# C, 64 problemas por palabra) en vez de recorrer listas.
+#   "bit":       id de problema -> número de bit
+#   "ids":       número de bit -> id (None si el problema se borró)
+#   "existentes": bitset de los problemas que hay en el banco
+#   "posicion":  id -> lugar en el banco (para ordenar los resultados)
+#   "cursos":    nombre -> (frozenset de ids usados, bitset)
+# Hay una por conjunto de datos.
+def _matriz_nueva():
+    return {
+        "bloqueo": threading.Lock(),
+        "firma_problemas": None,
+        "firma_cursos": None,
+        "bit": {},
+        "ids": [],
+        "existentes": 0,
+        "posicion": {},
+        "nombres": {},
+        "cursos": {},
+    }
+
+
+def _matriz_del_conjunto():
+    return conjunto_actual().derivado("matriz", _matriz_nueva)
+
+
+def _bitset(estado, ids):
+    # se arma byte por byte: hacer 'mascara |= 1 << n' por cada id crearía
+    # un entero grande nuevo cada vez
+    bit = estado["bit"]
+    bytes_ = bytearray((len(estado["ids"]) + 7) // 8)
+    for problema_id in ids:
+        n = bit.get(problema_id)
+        if n is not None:
+            bytes_[n >> 3] |= 1 << (n & 7)
+    return int.from_bytes(bytes_, "little")
+
+
+@fase("indices")
+def _sincronizar_matriz(estado):
+    firma = firma_colecciones("problemas")
+    if recalcular("matriz", firma, estado["firma_problemas"]):
+        problemas = cargar_problemas()
+        actuales = {p["id"] for p in problemas}
+        ids_cambiaron = actuales != estado["bit"].keys()
+
+        if ids_cambiaron:
+            huecos = sum(1 for i in estado["ids"] if i is None)
+            borrados = estado["bit"].keys() - actuales
+            if (huecos + len(borrados)) * 2 > len(estado["ids"]):
+                # demasiados huecos: numerar todo de nuevo
+                estado["bit"], estado["ids"] = {}, []
+            for problema_id in borrados & estado["bit"].keys():
+                estado["ids"][estado["bit"].pop(problema_id)] = None
+            for p in problemas:
+                if p["id"] not in estado["bit"]:
+                    estado["bit"][p["id"]] = len(estado["ids"])
+                    estado["ids"].append(p["id"])
+            estado["existentes"] = _bitset(estado, actuales)
+
+        estado["posicion"] = {p["id"]: i for i, p in enumerate(problemas)}
+        estado["nombres"] = {p["id"]: p.get("nombre") or "" for p in problemas}
+        estado["firma_problemas"] = firma
+        if ids_cambiaron:
+            # los bitsets de los cursos dependen de la numeración
+            estado["cursos"] = {
+                nombre: (usados, _bitset(estado, usados))
+                for nombre, (usados, _) in estado["cursos"].items()
+            }
+
+    firma = firma_colecciones("cursos")
+    if recalcular("matriz_cursos", firma, estado["firma_cursos"]):
+        vigentes = {}
+        for curso in cargar_cursos():
+            usados = frozenset(curso.get("usados_problemas") or [])
+            previo = estado["cursos"].get(curso["nombre"])
+            vigentes[curso["nombre"]] = (
+                previo if previo and previo[0] == usados else (usados, _bitset(estado, usados))
+            )
+        estado["cursos"] = vigentes
+        estado["firma_cursos"] = firma
+
+
+def _bits(mascara):
+    """Números de los bits encendidos, de menor a mayor."""
+    binario = bin(mascara)[:1:-1]  # sin '0b' y al revés: el bit 0 primero
+    return [i for i, c in enumerate(binario) if c == "1"]
+
+
+def _problemas(matriz, mascara, usos=None):
+    ids = matriz["ids"]
+    resultado = [ids[i] for i in _bits(mascara)]
+    resultado.sort(key=matriz["posicion"].__getitem__)
+    return [
+        {"id": i, "nombre": matriz["nombres"][i], **({"usos": usos[i]} if usos else {})}
+        for i in resultado
+    ]
+
+
+def _contadores(mascaras):
+    """
+    Suma en paralelo, bit por bit, cuántos bitsets tienen encendido cada
+    bit: regresa los bits del contador (el 0 es el menos significativo),
+    cada uno también como bitset.
+    """
+    contador = []
+    for mascara in mascaras:
+        acarreo = mascara
+        for i in range(len(contador)):
+            if not acarreo:
+                break
+            contador[i], acarreo = contador[i] ^ acarreo, contador[i] & acarreo
+        if acarreo:
+            contador.append(acarreo)
+    return contador
+
+
+def _al_menos(contador, k, universo):
+    """Bitset de las posiciones cuyo contador vale >= k."""
+    mayor, igual = 0, universo
+    for i in range(max(len(contador), k.bit_length()) - 1, -1, -1):
+        bit = contador[i] if i < len(contador) else 0
+        if (k >> i) & 1:
+            igual &= bit
+        else:
+            mayor |= igual & bit
+            igual &= ~bit
+    return mayor | igual
+
+
+def nunca_usados():
+    """Problemas del banco que no se han usado en ningún curso."""
+    matriz = _matriz_del_conjunto()
+    with matriz["bloqueo"]:
+        _sincronizar_matriz(matriz)
+        usados = 0
+        for _, mascara in matriz["cursos"].values():
+            usados |= mascara
+        return _problemas(matriz, matriz["existentes"] & ~usados)
+
+
+def usados_en_al_menos(k):
+    """Problemas usados en k cursos o más, cada uno con 'usos' (cuántos)."""
+    matriz = _matriz_del_conjunto()
+    with matriz["bloqueo"]:
+        _sincronizar_matriz(matriz)
+        contador = _contadores(m for _, m in matriz["cursos"].values())
+        resultado = _al_menos(contador, max(k, 1), matriz["existentes"])
+        ids = matriz["ids"]
+        usos = {}
+        for i, bits in enumerate(contador):
+            for b in _bits(bits & resultado):
+                usos[ids[b]] = usos.get(ids[b], 0) + (1 << i)
+        return _problemas(matriz, resultado, usos)
+
+
+def solapamiento():
+    """
+    Para cada par de cursos: problemas en común, en total (unión) y su
+    índice de Jaccard (común / total). Regresa {"cursos": [...], "pares": [...]}.
+    """
+    matriz = _matriz_del_conjunto()
+    with matriz["bloqueo"]:
+        _sincronizar_matriz(matriz)
+        cursos = list(matriz["cursos"].items())
+
+    pares = []
+    for i, (a, (_, ma)) in enumerate(cursos):
+        for b, (_, mb) in cursos[i + 1:]:
+            comun = (ma & mb).bit_count()
+            total = (ma | mb).bit_count()
+            pares.append({
+                "a": a,
+                "b": b,
+                "comun": comun,
+                "total": total,
+                "jaccard": round(comun / total, 4) if total else 0.0,
+            })
+    return {
+        "cursos": [{"nombre": n, "usados": m.bit_count()} for n, (_, m) in cursos],
+        "pares": pares,
+    }
+
+
+def diferencia(curso_a, curso_b):
+    """
+    Problemas que usó curso_a y curso_b no. Lanza KeyError si alguno de
+    los cursos no existe.
+    """
+    matriz = _matriz_del_conjunto()
+    with matriz["bloqueo"]:
+        _sincronizar_matriz(matriz)
+        _, ma = matriz["cursos"][curso_a]
+        _, mb = matriz["cursos"][curso_b]
+        return _problemas(matriz, ma & ~mb)